@@ -1,17 +1,29 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import List, Literal, Optional, Union
+import anyio
+import asyncio
 import logging
+import os
 import sys
 import json
 
-from .database import get_db, init_db
+from .database import AsyncSessionLocal, SessionLocal, async_engine, get_async_db, init_db
 from .models.job import Job
 from .models.device import Device
-from .services.device_manager import DeviceManager
-from .queue.tasks import process_test_job
-from .queue.celery_app import get_queue_by_priority, get_priority_info
+from .models.test_result import TestResult
+from .services.device_manager import AsyncDeviceManager, read_app_cache_stats, summarize_device_status
+from .services import events, pagination, queue_stats, sharding
+from .services.counters import QueueCounters, priority_allocation
+from .queue.tasks import enqueue_batch_dispatch, release_ready_jobs
+from .queue.scheduler import FAIR_SHARE_SCHEDULING, ReadySet
+from .queue.batching import BATCH_LINGER_SECONDS, batch_stats
+from .queue.celery_app import celery_app, get_queue_by_priority, get_priority_info
 
 # Configure logging
 logging.basicConfig(
@@ -26,6 +38,10 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="QualGent Job Server")
 
+# Endpoints use AsyncSession; the threadpool only runs blocking broker/Redis
+# calls (batch signalling) off the event loop
+API_THREADPOOL_SIZE = int(os.getenv('API_THREADPOOL_SIZE', '40'))
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint for Docker and monitoring."""
@@ -37,19 +53,94 @@ class TestJob(BaseModel):
     test_path: str
     priority: int = 1
     target: str = "emulator"  # One of: emulator, device, browserstack
+    shards: Union[int, Literal["auto"]] = 1  # Split the file with --shard i/N (auto: from its runtime history)
 
 class JobResponse(BaseModel):
     job_id: int
     status: str
     created_at: datetime
 
+class SubmittedJobResponse(JobResponse):
+    # From historical runtimes (services.runtime_stats); None when unknown
+    estimated_duration_seconds: Optional[int] = None
+    estimated_wait_seconds: Optional[int] = None
+    estimated_completion: Optional[datetime] = None
+    # Conservative counterparts, from p90 runtimes
+    estimated_duration_seconds_p90: Optional[int] = None
+    estimated_wait_seconds_p90: Optional[int] = None
+    estimated_completion_p90: Optional[datetime] = None
+    # Sharded submissions: job_id is the parent, these run the shards
+    shard_count: Optional[int] = None
+    shard_job_ids: Optional[List[int]] = None
+
+class BulkTestJobs(BaseModel):
+    jobs: List[TestJob]
+
+class BulkJobResponse(BaseModel):
+    total: int
+    jobs: List[JobResponse]  # Same order as the submitted payloads
+
+# Upper bound on jobs accepted by a single bulk request; the CLI chunks below this
+MAX_BULK_JOBS = 1000
+
+# GET /jobs page size when no limit is given, and rows fetched per round trip when streaming
+DEFAULT_PAGE_SIZE = 50
+STREAM_BATCH_SIZE = int(os.getenv('JOBS_STREAM_BATCH_SIZE', '1000'))
+
+# /jobs/wait: jobs per request, longest single long-poll, and how often waiters
+# re-read statuses in case a completion event was missed
+TERMINAL_STATUSES = ('completed', 'failed')
+MAX_WAIT_JOBS = 10000
+WAIT_MAX_TIMEOUT = float(os.getenv('WAIT_MAX_TIMEOUT', '60'))
+WAIT_RECHECK_INTERVAL = float(os.getenv('WAIT_RECHECK_INTERVAL', '10'))
+
+def _signal_batches(jobs: List[TestJob], producer=None) -> int:
+    """Signal each distinct batch key once, at the highest priority submitted for it."""
+    batch_priorities = {}
+    for job in jobs:
+        key = (job.app_version_id, job.target, get_queue_by_priority(job.priority))
+        batch_priorities[key] = max(batch_priorities.get(key, 0), job.priority)
+
+    dispatchers = 0
+    for (app_version_id, target, _), priority in batch_priorities.items():
+        if enqueue_batch_dispatch(app_version_id, target, priority, producer=producer):
+            dispatchers += 1
+    return dispatchers
+
+def _signal_batches_pooled(jobs: List[TestJob]) -> int:
+    """_signal_batches over one pooled broker connection."""
+    with celery_app.producer_or_acquire() as producer:
+        return _signal_batches(jobs, producer=producer)
+
+def _schedule_jobs(jobs) -> int:
+    """Fair-share mode: add recorded jobs to the ready set and fill any free device slots."""
+    ReadySet().enqueue(jobs)
+    return release_ready_jobs()
+
+def _reconcile_counters():
+    """Rebuild the Redis dashboard counters from the database (best effort)."""
+    db = SessionLocal()
+    try:
+        QueueCounters().reconcile(db)
+    except Exception as e:
+        logger.warning(f"Could not reconcile queue counters: {str(e)}")
+    finally:
+        db.close()
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup."""
+    """Initialize database and dashboard counters on startup."""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = API_THREADPOOL_SIZE
     init_db()
+    await run_in_threadpool(_reconcile_counters)
 
-@app.post("/jobs/submit", response_model=JobResponse)
-async def submit_job(job: TestJob, db: Session = Depends(get_db)):
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled database connections."""
+    await async_engine.dispose()
+
+@app.post("/jobs/submit", response_model=SubmittedJobResponse)
+async def submit_job(job: TestJob, db: AsyncSession = Depends(get_async_db)):
     """Submit a new job with priority-based routing."""
     try:
         logger.info(f"Received job submission request: {json.dumps(job.dict())}")
@@ -57,6 +148,9 @@ async def submit_job(job: TestJob, db: Session = Depends(get_db)):
         # Validate priority
         if not 1 <= job.priority <= 5:
             raise HTTPException(status_code=400, detail="Priority must be between 1 and 5")
+        if job.shards != "auto" and not 1 <= job.shards <= sharding.MAX_SHARDS:
+            raise HTTPException(status_code=400, detail=f"Shards must be between 1 and {sharding.MAX_SHARDS} or auto")
+        shard_count = await _shard_count(db, job)
         
         db_job = Job(
             org_id=job.org_id,
@@ -67,63 +161,273 @@ async def submit_job(job: TestJob, db: Session = Depends(get_db)):
             status="queued"
         )
         db.add(db_job)
-        db.commit()
-        db.refresh(db_job)
-        
-        logger.info(f"Created job {db_job.id} in database with priority {db_job.priority}, status {db_job.status}")
+        shards = []
+        if shard_count > 1:
+            # The parent only tracks the shards; they are what gets scheduled
+            await db.flush()
+            shards = sharding.create_shards(db_job, shard_count)
+            db.add_all(shards)
+        await db.commit()
+        await db.refresh(db_job)
+        runnable = shards or [db_job]
         
-        # Route job to appropriate priority queue
-        queue_name = get_queue_by_priority(job.priority)
-        logger.info(f"Routing job {db_job.id} (priority {job.priority}) to queue: {queue_name}")
+        logger.info(f"Created job {db_job.id} in database with priority {db_job.priority}, status {db_job.status}"
+                    + (f" ({shard_count} shards: {[shard.id for shard in shards]})" if shards else ""))
+        await run_in_threadpool(events.publish_events, [events.job_event(j) for j in [db_job, *shards]])
         
-        # Queue the job for processing with priority routing
+        # Signal the job's batch (or, in fair-share mode, hand it to the
+        # scheduler); a dispatcher on the priority queue picks it up
         try:
-            task = process_test_job.apply_async(
-                args=[db_job.id],
-                queue=queue_name,
-                priority=job.priority,  # Set task priority within the queue
-                retry=True,
-                retry_policy={
-                    'max_retries': 3,
-                    'interval_start': 0,
-                    'interval_step': 0.2,
-                    'interval_max': 0.2,
-                }
-            )
-            logger.info(f"Queued job {db_job.id} with task ID {task.id} in {queue_name} queue")
-            logger.info(f"Task details: queue={queue_name}, priority={job.priority}")
+            if FAIR_SHARE_SCHEDULING:
+                await run_in_threadpool(_schedule_jobs, runnable)
+            else:
+                await run_in_threadpool(_signal_batches, [job])
         except Exception as e:
             logger.error(f"Error queueing task: {str(e)}")
-            db_job.status = "failed"
-            db.commit()
+            for failed in [db_job, *shards]:
+                failed.status = "failed"
+            await db.commit()
+            await run_in_threadpool(events.publish_events,
+                                    [events.job_event(db_job, sharding.SHARDED_STATUS if shards else "queued")]
+                                    + [events.job_event(shard, "queued") for shard in shards])
             raise
         
-        return JobResponse(
+        return SubmittedJobResponse(
             job_id=db_job.id,
-            status=db_job.status,
-            created_at=db_job.created_at
+            status="queued" if shards else db_job.status,
+            created_at=db_job.created_at,
+            shard_count=shard_count if shards else None,
+            shard_job_ids=[shard.id for shard in shards] or None,
+            **await _estimate_completion(db, runnable[-1], len(runnable))
         )
     except Exception as e:
         logger.error(f"Error submitting job: {str(e)}")
         raise
 
+async def _shard_count(db: AsyncSession, job: TestJob) -> int:
+    """Shards to split a submission into (auto mode falls back to 1 if history is unavailable)."""
+    if job.shards != "auto":
+        return job.shards
+    try:
+        return await db.run_sync(lambda session: sharding.auto_shard_count(session, job.test_path, job.target))
+    except Exception as e:
+        logger.warning(f"Could not pick a shard count for {job.test_path}: {str(e)}")
+        return 1
+
+async def _estimate_completion(db: AsyncSession, last_job: Job, shard_count: int = 1) -> dict:
+    """
+    Estimated runtime, wait and completion time of a submission (best effort: {} on error).
+    
+    For a sharded job these are of its last shard: the one that starts last.
+    The _p90 fields are the conservative figures, from p90 runtimes.
+    """
+    try:
+        estimate = await AsyncDeviceManager(db).estimate_wait(last_job.target, last_job.priority, last_job.test_path,
+                                                              before_job_id=last_job.id)
+    except Exception as e:
+        logger.warning(f"Could not estimate the completion of job {last_job.id}: {str(e)}")
+        return {}
+    result = {}
+    for suffix in ("", "_p90"):
+        run_seconds = int(round(estimate["run_seconds" + suffix] / shard_count))
+        wait_seconds = estimate["wait_seconds" + suffix]
+        completion = None
+        if wait_seconds is not None:
+            completion = last_job.created_at + timedelta(seconds=wait_seconds + run_seconds)
+        result.update({
+            "estimated_duration_seconds" + suffix: run_seconds,
+            "estimated_wait_seconds" + suffix: wait_seconds,
+            "estimated_completion" + suffix: completion,
+        })
+    return result
+
+@app.post("/jobs/submit/bulk", response_model=BulkJobResponse)
+async def submit_jobs_bulk(payload: BulkTestJobs, db: AsyncSession = Depends(get_async_db)):
+    """Submit many jobs with one multi-row insert and one broker connection."""
+    try:
+        if not payload.jobs:
+            raise HTTPException(status_code=400, detail="No jobs submitted")
+        if len(payload.jobs) > MAX_BULK_JOBS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_JOBS} jobs per bulk request")
+        
+        invalid = [i for i, job in enumerate(payload.jobs) if not 1 <= job.priority <= 5]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"Priority must be between 1 and 5 (items {invalid[:10]})")
+        sharded = [i for i, job in enumerate(payload.jobs) if job.shards != 1]
+        if sharded:
+            raise HTTPException(status_code=400, detail=f"Submit sharded jobs with POST /jobs/submit (items {sharded[:10]})")
+        
+        logger.info(f"Received bulk submission of {len(payload.jobs)} jobs")
+        
+        # Single INSERT ... VALUES (...), (...) RETURNING in one transaction
+        rows = (await db.execute(
+            insert(Job).returning(
+                Job.id, Job.status, Job.created_at, Job.priority, Job.target, Job.app_version_id,
+                Job.test_path, Job.assigned_device_name, Job.org_id, sort_by_parameter_order=True
+            ),
+            [
+                {
+                    "org_id": job.org_id,
+                    "app_version_id": job.app_version_id,
+                    "test_path": job.test_path,
+                    "priority": job.priority,
+                    "target": job.target,
+                    "status": "queued"
+                }
+                for job in payload.jobs
+            ]
+        )).all()
+        await db.commit()
+        
+        logger.info(f"Created {len(rows)} jobs in database ({rows[0].id}..{rows[-1].id})")
+        await run_in_threadpool(events.publish_events, [events.job_event(row) for row in rows])
+        
+        # One signal per batch key, published over one pooled broker connection
+        try:
+            if FAIR_SHARE_SCHEDULING:
+                dispatchers = await run_in_threadpool(_schedule_jobs, rows)
+            else:
+                dispatchers = await run_in_threadpool(_signal_batches_pooled, payload.jobs)
+            logger.info(f"Signalled {dispatchers} new batch dispatchers for {len(rows)} jobs")
+        except Exception as e:
+            logger.error(f"Error queueing bulk tasks: {str(e)}")
+            await db.execute(update(Job).where(Job.id.in_([row.id for row in rows])).values(status="failed"))
+            await db.commit()
+            await run_in_threadpool(events.publish_events, [
+                events.job_event(row, "queued", status="failed", type="job.failed") for row in rows
+            ])
+            raise
+        
+        return BulkJobResponse(
+            total=len(rows),
+            jobs=[
+                JobResponse(job_id=row.id, status=row.status, created_at=row.created_at)
+                for row in rows
+            ]
+        )
+    except Exception as e:
+        logger.error(f"Error submitting bulk jobs: {str(e)}")
+        raise
+
+class WaitRequest(BaseModel):
+    job_ids: List[int]
+    mode: str = "all"  # all: every job finished; any: at least one finished
+    timeout: float = 30
+
+async def _job_statuses(db: AsyncSession, job_ids: List[int]) -> dict:
+    """Current status of each listed job that exists."""
+    rows = (await db.execute(select(Job.id, Job.status).where(Job.id.in_(job_ids)))).all()
+    # Hand the connection back to the pool while the request waits
+    await db.close()
+    return {row.id: row.status for row in rows}
+
+def _wait_satisfied(statuses: dict, mode: str) -> bool:
+    finished = [status in TERMINAL_STATUSES for status in statuses.values()]
+    return any(finished) if mode == "any" else all(finished)
+
+async def _wait_for_jobs(db: AsyncSession, request: WaitRequest) -> dict:
+    """
+    Long-poll until the listed jobs reach a terminal state or the timeout passes.
+    
+    Job completion events from the event channel update the statuses in
+    memory, so a waiter costs one query up front plus a safety re-check every
+    WAIT_RECHECK_INTERVAL seconds, not a query per poll.
+    """
+    if request.mode not in ("all", "any"):
+        raise HTTPException(status_code=400, detail="mode must be 'all' or 'any'")
+    job_ids = [int(job_id) for job_id in dict.fromkeys(request.job_ids)]
+    if not job_ids:
+        raise HTTPException(status_code=400, detail="No job IDs given")
+    if len(job_ids) > MAX_WAIT_JOBS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_WAIT_JOBS} jobs per wait request")
+    
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max(0.0, min(request.timeout, WAIT_MAX_TIMEOUT))
+    
+    # Subscribe before the first read so no completion can slip in between
+    stream = events.subscribe(["job.completed", "job.failed"], heartbeat=1)
+    try:
+        await stream.__anext__()
+        statuses = await _job_statuses(db, job_ids)
+        missing = [job_id for job_id in job_ids if job_id not in statuses]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Jobs not found: {missing[:20]}")
+        
+        last_check = loop.time()
+        while not _wait_satisfied(statuses, request.mode) and loop.time() < deadline:
+            event = await stream.__anext__()
+            if event is not None:
+                if event["job_id"] in statuses:
+                    statuses[event["job_id"]] = event["status"]
+            elif loop.time() - last_check >= WAIT_RECHECK_INTERVAL:
+                statuses = await _job_statuses(db, job_ids)
+                last_check = loop.time()
+    finally:
+        await stream.aclose()
+    
+    summary = {"completed": 0, "failed": 0, "pending": 0}
+    for status in statuses.values():
+        summary[status if status in TERMINAL_STATUSES else "pending"] += 1
+    done = _wait_satisfied(statuses, request.mode)
+    return {
+        "mode": request.mode,
+        "done": done,
+        "timed_out": not done,
+        "summary": summary,
+        "jobs": statuses
+    }
+
+@app.get("/jobs/wait")
+async def wait_for_jobs(ids: str, mode: str = "all", timeout: float = 30,
+                        db: AsyncSession = Depends(get_async_db)):
+    """
+    Block until the comma-separated job `ids` finish (mode=all) or one of them
+    does (mode=any), for at most `timeout` seconds. Use POST for long ID lists.
+    """
+    try:
+        job_ids = [int(job_id) for job_id in ids.split(',') if job_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    return await _wait_for_jobs(db, WaitRequest(job_ids=job_ids, mode=mode, timeout=timeout))
+
+@app.post("/jobs/wait")
+async def wait_for_jobs_post(request: WaitRequest, db: AsyncSession = Depends(get_async_db)):
+    """Same as GET /jobs/wait with the job IDs in the body (thousands of IDs per call)."""
+    return await _wait_for_jobs(db, request)
+
 @app.get("/jobs/{job_id}", response_model=JobResponse)
-async def get_job_status(job_id: int, db: Session = Depends(get_db)):
+async def get_job_status(job_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get the status of a job."""
-    db_job = db.query(Job).filter(Job.id == job_id).first()
+    db_job = await db.get(Job, job_id)
     if db_job is None:
         raise HTTPException(status_code=404, detail="Job not found")
     
+    status = db_job.status
+    if db_job.status == sharding.SHARDED_STATUS:
+        status = (await db.run_sync(lambda session: sharding.shard_summary(session, db_job)))["status"]
     return JobResponse(
         job_id=db_job.id,
-        status=db_job.status,
+        status=status,
         created_at=db_job.created_at
     )
 
+@app.get("/jobs/{job_id}/shards")
+async def get_job_shards(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Shards of a sharded job with their statuses, and the rolled-up status."""
+    db_job = await db.get(Job, job_id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if db_job.shard_count is None or db_job.shard_index is not None:
+        raise HTTPException(status_code=400, detail="Job is not sharded")
+    
+    summary = await db.run_sync(lambda session: sharding.shard_summary(session, db_job))
+    shards = (await db.scalars(select(Job).where(Job.parent_job_id == job_id).order_by(Job.shard_index))).all()
+    return {"job_id": job_id, **summary, "jobs": [_job_to_dict(shard) for shard in shards]}
+
 @app.get("/jobs/group/{app_version_id}")
-async def get_grouped_jobs(app_version_id: str, db: Session = Depends(get_db)):
+async def get_grouped_jobs(app_version_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get all jobs for a specific app version."""
-    jobs = db.query(Job).filter(Job.app_version_id == app_version_id).all()
+    jobs = (await db.scalars(select(Job).where(Job.app_version_id == app_version_id))).all()
     return [
         {
             "job_id": job.id,
@@ -134,24 +438,59 @@ async def get_grouped_jobs(app_version_id: str, db: Session = Depends(get_db)):
         for job in jobs
     ]
 
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: int, status: str = None, db: AsyncSession = Depends(get_async_db)):
+    """
+    Per-test results of a job, parsed from its AppWright JSON report.
+    
+    Optionally filtered by comma-separated outcome (passed, failed, flaky, skipped).
+    """
+    db_job = await db.get(Job, job_id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    job_ids = [job_id]
+    if db_job.shard_count is not None and db_job.shard_index is None:
+        # A sharded job's results are its shards'
+        job_ids = (await db.scalars(select(Job.id).where(Job.parent_job_id == job_id))).all()
+    query = select(TestResult).where(TestResult.job_id.in_(job_ids)).order_by(TestResult.id)
+    if status:
+        query = query.where(TestResult.status.in_([s.strip() for s in status.split(',')]))
+    results = (await db.scalars(query)).all()
+    
+    summary = {"total": len(results), "passed": 0, "failed": 0, "flaky": 0, "skipped": 0,
+               "duration_ms": sum(result.duration_ms or 0 for result in results)}
+    for result in results:
+        summary[result.status] = summary.get(result.status, 0) + 1
+    
+    job_status = db_job.status
+    if job_status == sharding.SHARDED_STATUS:
+        job_status = (await db.run_sync(lambda session: sharding.shard_summary(session, db_job)))["status"]
+    return {
+        "job_id": job_id,
+        "status": job_status,
+        "summary": summary,
+        "results": [result.to_dict() for result in results]
+    }
+
 @app.get("/batches/summary")
-async def get_batch_summary(db: Session = Depends(get_db)):
+async def get_batch_summary(db: AsyncSession = Depends(get_async_db)):
     """Get batch processing summary showing grouping efficiency."""
-    # Group jobs by app_version_id and target
-    from sqlalchemy import func
-    
-    batch_data = db.query(
+    # Group jobs by app_version_id and target (sharded jobs count as their shards)
+    batch_data = (await db.execute(select(
         Job.app_version_id,
         Job.target,
         Job.status,
         func.count(Job.id).label('job_count'),
         func.min(Job.created_at).label('first_job'),
         func.max(Job.created_at).label('last_job')
+    ).where(
+        Job.shard_index.isnot(None) | Job.shard_count.is_(None)
     ).group_by(
         Job.app_version_id, 
         Job.target, 
         Job.status
-    ).all()
+    ))).all()
     
     batches = {}
     for row in batch_data:
@@ -185,6 +524,14 @@ async def get_batch_summary(db: Session = Depends(get_db)):
         for batch in batches.values()
     )
     
+    # What dispatchers actually achieved (groups above span every dispatch of an app version)
+    try:
+        dispatched = await run_in_threadpool(batch_stats)
+        dispatched["linger_seconds"] = BATCH_LINGER_SECONDS
+    except Exception as e:
+        logger.warning(f"Could not read batch dispatch stats: {str(e)}")
+        dispatched = None
+    
     return {
         "summary": {
             "total_batches": total_batches,
@@ -192,15 +539,16 @@ async def get_batch_summary(db: Session = Depends(get_db)):
             "average_batch_size": round(total_jobs / total_batches, 2) if total_batches > 0 else 0,
             "potential_time_saved_seconds": potential_time_saved
         },
+        "dispatched": dispatched,
         "batches": list(batches.values())
     }
 
 # Device Management Endpoints
 
 @app.get("/devices")
-async def list_devices(db: Session = Depends(get_db)):
+async def list_devices(db: AsyncSession = Depends(get_async_db)):
     """Get all devices and their current status."""
-    devices = db.query(Device).all()
+    devices = (await db.scalars(select(Device))).all()
     return {
         "devices": [
             {
@@ -218,35 +566,50 @@ async def list_devices(db: Session = Depends(get_db)):
         ]
     }
 
+def _read_counters(read):
+    """Run a QueueCounters read, or return None if Redis is unavailable."""
+    try:
+        return read(QueueCounters())
+    except Exception as e:
+        logger.warning(f"Queue counters unavailable, counting in the database: {str(e)}")
+        return None
+
 @app.get("/devices/status")
-async def get_device_pool_status(db: Session = Depends(get_db)):
+async def get_device_pool_status(db: AsyncSession = Depends(get_async_db)):
     """Get device pool status and utilization metrics."""
-    device_manager = DeviceManager(db)
-    return device_manager.get_device_status()
+    snapshot = await run_in_threadpool(_read_counters, QueueCounters.snapshot)
+    if snapshot is not None:
+        devices, job_counts = snapshot
+        app_cache = await run_in_threadpool(read_app_cache_stats)
+        return summarize_device_status(devices, priority_allocation(job_counts), app_cache)
+    device_manager = AsyncDeviceManager(db)
+    return await device_manager.get_device_status()
 
 @app.get("/devices/recommendations/{target_type}")
-async def get_device_recommendations(target_type: str, db: Session = Depends(get_db)):
-    """Get device allocation recommendations for a specific target type."""
-    device_manager = DeviceManager(db)
-    return device_manager.get_device_recommendations(target_type)
+async def get_device_recommendations(target_type: str, priority: int = 1, test_path: Optional[str] = None,
+                                     db: AsyncSession = Depends(get_async_db)):
+    """Get device allocation recommendations for a specific target type, priority and (optionally) test."""
+    device_manager = AsyncDeviceManager(db)
+    return await device_manager.get_device_recommendations(target_type, priority, test_path)
 
 @app.post("/devices/health-check")
-async def perform_health_check(db: Session = Depends(get_db)):
+async def perform_health_check(db: AsyncSession = Depends(get_async_db)):
     """Perform health check on all devices."""
-    device_manager = DeviceManager(db)
-    return device_manager.health_check_devices()
+    device_manager = AsyncDeviceManager(db)
+    return await device_manager.health_check_devices()
 
 class DeviceCreate(BaseModel):
     device_id: str
     device_type: str
     max_concurrent_jobs: int = 1
     location: str = None
+    app_storage_slots: int = 3  # App versions kept installed (least recently used are evicted)
 
 @app.post("/devices")
-async def create_device(device: DeviceCreate, db: Session = Depends(get_db)):
+async def create_device(device: DeviceCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new device in the pool."""
     # Check if device_id already exists
-    existing_device = db.query(Device).filter(Device.device_id == device.device_id).first()
+    existing_device = await db.scalar(select(Device).where(Device.device_id == device.device_id))
     if existing_device:
         raise HTTPException(status_code=400, detail="Device ID already exists")
     
@@ -255,11 +618,13 @@ async def create_device(device: DeviceCreate, db: Session = Depends(get_db)):
         device_type=device.device_type,
         status="available",
         max_concurrent_jobs=device.max_concurrent_jobs,
-        location=device.location
+        location=device.location,
+        app_storage_slots=device.app_storage_slots
     )
     db.add(db_device)
-    db.commit()
-    db.refresh(db_device)
+    await db.commit()
+    await db.refresh(db_device)
+    await run_in_threadpool(events.publish_event, events.device_event(db_device, "registered"))
     
     return {
         "device_id": db_device.device_id,
@@ -268,19 +633,56 @@ async def create_device(device: DeviceCreate, db: Session = Depends(get_db)):
     }
 
 @app.delete("/devices/{device_id}")
-async def remove_device(device_id: str, db: Session = Depends(get_db)):
+async def remove_device(device_id: str, db: AsyncSession = Depends(get_async_db)):
     """Remove a device from the pool."""
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    device = await db.scalar(select(Device).where(Device.device_id == device_id))
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     
     if device.current_jobs > 0:
         raise HTTPException(status_code=400, detail="Cannot remove device with running jobs")
     
-    db.delete(device)
-    db.commit()
+    await db.delete(device)
+    await db.commit()
+    await run_in_threadpool(events.publish_event, events.device_event(device, "removed"))
     return {"message": f"Device {device_id} removed successfully"} 
 
+def _format_sse(event) -> str:
+    """Render an event (or a keep-alive for None) in text/event-stream framing."""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@app.get("/events")
+async def stream_events(request: Request, types: str = None):
+    """
+    Stream job and device state changes as Server-Sent Events.
+    
+    `types` is a comma-separated list of event type prefixes to receive,
+    e.g. `job` or `job.completed,device`; everything is sent by default.
+
+    The first line is a `: connected` comment, sent once the subscription is
+    active: a client that takes a snapshot after reading it misses no change.
+    """
+    prefixes = [t.strip() for t in types.split(',') if t.strip()] if types else None
+    
+    async def event_stream():
+        connected = False
+        async for event in events.subscribe(prefixes):
+            if await request.is_disconnected():
+                break
+            if event is None and not connected:
+                connected = True
+                yield ": connected\n\n"
+                continue
+            yield _format_sse(event)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/queues/priority-info")
 async def get_priority_queue_info():
     """Get information about priority queue configuration."""
@@ -296,73 +698,52 @@ async def get_priority_queue_info():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/queues/status")
-async def get_queue_status(db: Session = Depends(get_db)):
-    """Get current queue status by priority level."""
+async def get_queue_status(db: AsyncSession = Depends(get_async_db)):
+    """Get current queue status by priority level, from the Redis counters when available."""
     try:
-        # Count jobs by priority and status
-        priority_stats = {}
-        
-        for priority in range(1, 6):
-            queue_name = get_queue_by_priority(priority)
-            queued_count = db.query(Job).filter(
-                Job.priority == priority, 
-                Job.status == "queued"
-            ).count()
-            running_count = db.query(Job).filter(
-                Job.priority == priority, 
-                Job.status == "running"
-            ).count()
-            
-            priority_stats[f"priority_{priority}"] = {
-                "queue_name": queue_name,
-                "queued_jobs": queued_count,
-                "running_jobs": running_count,
-                "total_active": queued_count + running_count
-            }
-        
-        # Group by queue
-        queue_summary = {}
-        for queue in ['high_priority', 'normal_priority', 'low_priority']:
-            total_queued = sum(
-                stats["queued_jobs"] for stats in priority_stats.values() 
-                if stats["queue_name"] == queue
-            )
-            total_running = sum(
-                stats["running_jobs"] for stats in priority_stats.values() 
-                if stats["queue_name"] == queue
-            )
-            queue_summary[queue] = {
-                "queued_jobs": total_queued,
-                "running_jobs": total_running,
-                "total_active": total_queued + total_running
-            }
-        
-        return {
-            "queue_summary": queue_summary,
-            "priority_breakdown": priority_stats,
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        counts = await run_in_threadpool(_read_counters, QueueCounters.active_job_counts)
+        if counts is not None:
+            return queue_stats.build_queue_status(counts)
+        return await db.run_sync(queue_stats.get_queue_status)
     except Exception as e:
         logger.error(f"Error getting queue status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/jobs/{job_id}")
-async def cancel_job(job_id: int, db: Session = Depends(get_db)):
+async def cancel_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
     """Cancel a queued or running job."""
     try:
-        job = db.query(Job).filter(Job.id == job_id).first()
+        job = await db.get(Job, job_id)
         if not job:
             raise HTTPException(status_code=404, detail="Job not found")
         
         if job.status in ["completed", "failed"]:
             raise HTTPException(status_code=400, detail=f"Cannot cancel job with status: {job.status}")
         
-        # Mark job as failed (cancelled)
+        # Mark job as failed (cancelled), with its unfinished shards if it is sharded
         original_status = job.status
         job.status = "failed"
-        db.commit()
+        shards = []
+        if original_status == sharding.SHARDED_STATUS:
+            shards = await db.run_sync(lambda session: sharding.cancel_shards(session, job_id))
+        await db.commit()
         
-        logger.info(f"Job {job_id} cancelled (was {original_status})")
+        logger.info(f"Job {job_id} cancelled (was {original_status})"
+                    + (f" with {len(shards)} unfinished shards" if shards else ""))
+        queued_ids = [job_id] if original_status == "queued" else []
+        queued_ids += [shard.id for shard, previous in shards if previous == "queued"]
+        if FAIR_SHARE_SCHEDULING and queued_ids:
+            try:
+                await run_in_threadpool(ReadySet().discard, queued_ids, job.target)
+            except Exception as e:
+                logger.warning(f"Could not drop jobs {queued_ids} from the ready set: {str(e)}")
+        await run_in_threadpool(events.publish_events,
+                                [events.job_event(job, original_status, cancelled=True)]
+                                + [events.job_event(shard, previous, cancelled=True) for shard, previous in shards])
+        if job.parent_job_id is not None:
+            finished = await db.run_sync(lambda session: sharding.rollup(session, [job.parent_job_id], publish=False))
+            await run_in_threadpool(events.publish_events,
+                                    [events.job_event(row, sharding.SHARDED_STATUS) for row in finished])
         
         return {
             "job_id": job_id,
@@ -374,77 +755,109 @@ async def cancel_job(job_id: int, db: Session = Depends(get_db)):
         logger.error(f"Error cancelling job {job_id}: {str(e)}")
         raise
 
+def _job_to_dict(job) -> dict:
+    """Serialize a Job (or a row of its columns) for GET /jobs."""
+    return {
+        "id": job.id,
+        "org_id": job.org_id,
+        "app_version_id": job.app_version_id,
+        "test_path": job.test_path,
+        "priority": job.priority,
+        "target": job.target,
+        "status": job.status,
+        "device_id": job.device_id,
+        "assigned_device_name": job.assigned_device_name,
+        "parent_job_id": job.parent_job_id,
+        "shard_index": job.shard_index,
+        "shard_count": job.shard_count,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None
+    }
+
+async def _stream_jobs(query):
+    """
+    Yield jobs as NDJSON from a server-side cursor.
+    
+    Uses its own session: the request's session is closed once the endpoint
+    returns, before the response body is streamed.
+    """
+    # Plain column rows rather than ORM objects, so nothing accumulates in the identity map
+    query = query.with_only_columns(*Job.__table__.columns)
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield "".join(json.dumps(_job_to_dict(row)) + "\n" for row in rows)
+
 @app.get("/jobs")
 async def list_jobs(
+    response: Response,
     app_version_id: str = None,
     status: str = None,
     priority: int = None,
     target: str = None,
     org_id: str = None,
-    limit: int = 50,
+    limit: int = None,
     sort: str = "created",
     order: str = "desc",
-    db: Session = Depends(get_db)
+    cursor: str = None,
+    format: str = "json",
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """List jobs with optional filtering and sorting."""
+    """
+    List jobs with optional filtering and sorting.
+    
+    Pages are keyset-paginated on (sort field, id): when more rows may follow,
+    the X-Next-Cursor header holds the cursor for the next page. With
+    format=ndjson every matching row (up to limit, if given) is streamed one
+    JSON object per line in constant memory.
+    """
     try:
-        query = db.query(Job)
+        query = select(Job)
         
         # Apply filters
         if app_version_id:
-            query = query.filter(Job.app_version_id == app_version_id)
+            query = query.where(Job.app_version_id == app_version_id)
         if status:
             # Support comma-separated status values
             if ',' in status:
                 status_list = [s.strip() for s in status.split(',')]
-                query = query.filter(Job.status.in_(status_list))
+                query = query.where(Job.status.in_(status_list))
             else:
-                query = query.filter(Job.status == status)
+                query = query.where(Job.status == status)
         if priority:
-            query = query.filter(Job.priority == priority)
+            query = query.where(Job.priority == priority)
         if target:
-            query = query.filter(Job.target == target)
+            query = query.where(Job.target == target)
         if org_id:
-            query = query.filter(Job.org_id == org_id)
+            query = query.where(Job.org_id == org_id)
         
-        # Apply sorting
-        if sort == "priority":
-            if order == "desc":
-                query = query.order_by(Job.priority.desc())
-            else:
-                query = query.order_by(Job.priority.asc())
-        elif sort == "status":
-            if order == "desc":
-                query = query.order_by(Job.status.desc())
-            else:
-                query = query.order_by(Job.status.asc())
-        else:  # default to created
-            if order == "desc":
-                query = query.order_by(Job.created_at.desc())
-            else:
-                query = query.order_by(Job.created_at.asc())
+        # Apply sorting (unknown values fall back to created / asc), then the cursor
+        if sort not in pagination.SORT_COLUMNS:
+            sort = "created"
+        if order != "desc":
+            order = "asc"
+        try:
+            query = pagination.apply_keyset(query, sort, order, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if format == "ndjson":
+            if limit:
+                query = query.limit(limit)
+            return StreamingResponse(_stream_jobs(query), media_type="application/x-ndjson")
         
         # Apply limit
+        limit = limit or DEFAULT_PAGE_SIZE
         query = query.limit(limit)
         
-        jobs = query.all()
+        jobs = (await db.scalars(query)).all()
         
-        return [
-            {
-                "id": job.id,
-                "org_id": job.org_id,
-                "app_version_id": job.app_version_id,
-                "test_path": job.test_path,
-                "priority": job.priority,
-                "target": job.target,
-                "status": job.status,
-                "device_id": job.device_id,
-                "assigned_device_name": job.assigned_device_name,
-                "created_at": job.created_at.isoformat() if job.created_at else None,
-                "updated_at": job.updated_at.isoformat() if job.updated_at else None
-            }
-            for job in jobs
-        ]
+        if len(jobs) == limit:
+            response.headers["X-Next-Cursor"] = pagination.encode_cursor(jobs[-1], sort, order)
+        
+        return [_job_to_dict(job) for job in jobs]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error listing jobs: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
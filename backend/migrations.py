@@ -0,0 +1,81 @@
+"""
+In-place schema upgrades for existing databases.
+
+Base.metadata.create_all only creates missing tables, so objects added to a
+model after its table exists (columns and indexes) are created here. Every
+step is idempotent and runs on startup from init_db; on a large Postgres
+database run scripts/migrate_db.py --concurrently ahead of a deploy instead,
+so index builds don't block writes.
+
+New columns must be nullable or have a server_default so existing rows get a
+value; ADD COLUMN with a constant default does not rewrite the table.
+"""
+import logging
+from typing import List
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from .database import Base
+
+logger = logging.getLogger(__name__)
+
+def upgrade_schema(engine: Engine, concurrently: bool = False) -> List[str]:
+    """
+    Create model columns and indexes that are missing from existing tables.
+
+    Args:
+        engine: Engine of the database to upgrade
+        concurrently: Build Postgres indexes with CREATE INDEX CONCURRENTLY
+
+    Returns:
+        Names of the columns ("table.column") and indexes that were created
+    """
+    from .models import Job, Device, TestResult  # noqa: F401  (register tables)
+
+    inspector = inspect(engine)
+    concurrently = concurrently and engine.dialect.name == 'postgresql'
+    created = []
+
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        created.extend(_add_missing_columns(engine, table, inspector))
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name in existing:
+                continue
+
+            ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+            logger.info(f"Creating index {index.name} on {table.name}")
+            if concurrently:
+                # CONCURRENTLY cannot run inside a transaction block
+                ddl = ddl.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+                with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                    conn.exec_driver_sql(ddl)
+            else:
+                with engine.begin() as conn:
+                    conn.exec_driver_sql(ddl)
+            created.append(index.name)
+
+    return created
+
+def _add_missing_columns(engine: Engine, table, inspector) -> List[str]:
+    """ALTER TABLE ... ADD COLUMN for model columns the table does not have yet."""
+    existing = {column['name'] for column in inspector.get_columns(table.name)}
+    table_name = engine.dialect.identifier_preparer.format_table(table)
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        if not column.nullable and column.server_default is None:
+            logger.warning(f"Cannot add NOT NULL column {table.name}.{column.name} without a server default; skipped")
+            continue
+        ddl = f"ALTER TABLE {table_name} ADD COLUMN {CreateColumn(column).compile(dialect=engine.dialect)}"
+        logger.info(f"Adding column {column.name} to {table.name}")
+        with engine.begin() as conn:
+            conn.exec_driver_sql(ddl)
+        added.append(f"{table.name}.{column.name}")
+    return added
@@ -1,6 +1,7 @@
 # Import all models to ensure SQLAlchemy can resolve foreign key relationships
 from .job import Job
 from .device import Device
+from .test_result import TestResult
 
 # Export all models
-__all__ = ['Job', 'Device'] 
\ No newline at end of file
+__all__ = ['Job', 'Device', 'TestResult'] 
\ No newline at end of file
@@ -1,5 +1,7 @@
 from sqlalchemy import Column, Integer, String, DateTime, Boolean
 from datetime import datetime
+from typing import List
+import json
 from ..database import Base
 
 class Device(Base):
@@ -13,6 +15,8 @@ class Device(Base):
     current_jobs = Column(Integer, default=0)  # Currently running jobs
     location = Column(String, nullable=True)  # Optional: datacenter, region, etc.
     capabilities = Column(String, nullable=True)  # JSON string of device capabilities
+    installed_app_versions = Column(String, nullable=True)  # JSON list of app_version_ids, most recently used first
+    app_storage_slots = Column(Integer, default=3, server_default='3')  # How many app versions fit on the device
     last_health_check = Column(DateTime, default=datetime.utcnow)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -30,6 +34,27 @@ class Device(Base):
             return 0
         return (self.current_jobs / self.max_concurrent_jobs) * 100
     
+    @property
+    def installed_versions(self) -> List[str]:
+        """App versions installed on the device, most recently used first"""
+        return json.loads(self.installed_app_versions) if self.installed_app_versions else []
+    
+    def use_app_version(self, app_version_id: str) -> bool:
+        """
+        Mark an app version as used on this device, installing it if needed.
+        
+        The least recently used versions are evicted once more than
+        app_storage_slots are installed. Returns True if the version was
+        already installed (no install needed).
+        """
+        versions = self.installed_versions
+        hit = app_version_id in versions
+        if hit:
+            versions.remove(app_version_id)
+        versions.insert(0, app_version_id)
+        self.installed_app_versions = json.dumps(versions[:max(self.app_storage_slots or 1, 1)])
+        return hit
+    
     def can_handle_job(self, target_type: str) -> bool:
         """Check if this device can handle a specific target type"""
         return self.device_type == target_type and self.is_available
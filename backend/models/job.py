@@ -1,8 +1,11 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..database import Base
 
+# Statuses of jobs that still need a device; dashboards and preemption only look at these
+ACTIVE_STATUSES = ('queued', 'running')
+
 class Job(Base):
     __tablename__ = 'jobs'
 
@@ -12,11 +15,41 @@ class Job(Base):
     test_path = Column(String, nullable=False)
     priority = Column(Integer, default=1)
     target = Column(String, nullable=False)  # emulator, device, browserstack
-    status = Column(String, nullable=False)  # queued, running, completed, failed
+    status = Column(String, nullable=False)  # queued, running, completed, failed (sharded: parent of running shards)
     device_id = Column(Integer, ForeignKey('devices.id'), nullable=True)  # Assigned device
     assigned_device_name = Column(String, nullable=True)  # For tracking device name
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Sharding (services.sharding): a parent has shard_count and no shard_index and
+    # never runs itself; each child runs shard `shard_index` of `shard_count`
+    parent_job_id = Column(Integer, ForeignKey('jobs.id', ondelete='CASCADE'), nullable=True)
+    shard_index = Column(Integer, nullable=True)  # 1-based, as in --shard i/N
+    shard_count = Column(Integer, nullable=True)
     
     # Relationship to device
-    device = relationship("Device", backref="jobs") 
\ No newline at end of file
+    device = relationship("Device", backref="jobs")
+
+    # Indexes for the hot queries; existing databases get them from backend.migrations
+    __table_args__ = (
+        # Batch claim, /jobs/group and /batches/summary
+        Index('ix_jobs_app_version_target_status', 'app_version_id', 'target', 'status'),
+        # /queues/status and priority allocation stats, over active rows only
+        Index(
+            'ix_jobs_active_priority_status', 'priority', 'status',
+            postgresql_where=status.in_(ACTIVE_STATUSES),
+            sqlite_where=status.in_(ACTIVE_STATUSES)
+        ),
+        # Preemption: running jobs on a device below a priority
+        Index('ix_jobs_device_status_priority', 'device_id', 'status', 'priority'),
+        # GET /jobs keyset pagination (sort=created and sort=priority)
+        Index('ix_jobs_created_at_id', 'created_at', 'id'),
+        Index('ix_jobs_priority_id', 'priority', 'id'),
+        # Shard roll-up
+        Index('ix_jobs_parent_job_id', 'parent_job_id'),
+    )
+
+    @property
+    def shard(self):
+        """(index, count) of a shard job, else None."""
+        return (self.shard_index, self.shard_count) if self.shard_index is not None else None
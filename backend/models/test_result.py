@@ -0,0 +1,65 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from typing import Any, Dict, List
+import json
+from ..database import Base
+
+class TestResult(Base):
+    """Outcome of one test case (a test() on one project) of a job, parsed from the JSON reporter."""
+    __tablename__ = 'test_results'
+    __test__ = False  # Not a pytest test class
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey('jobs.id', ondelete='CASCADE'), nullable=False)
+    title = Column(String, nullable=False)  # describe() titles and test title, joined with " › "
+    file = Column(String, nullable=True)
+    line = Column(Integer, nullable=True)
+    project = Column(String, nullable=True)  # AppWright project, e.g. "android"
+    status = Column(String, nullable=False)  # passed, failed, flaky, skipped
+    duration_ms = Column(Integer, default=0)  # All attempts, retries included
+    retries = Column(Integer, default=0)
+    error = Column(String, nullable=True)  # First error message, truncated
+    attachments = Column(String, nullable=True)  # JSON list of {name, content_type, path}
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    job = relationship("Job", backref="test_results")
+
+    __table_args__ = (
+        # GET /jobs/{id}/results
+        Index('ix_test_results_job_id', 'job_id'),
+    )
+
+    @classmethod
+    def from_case(cls, job_id: int, case: Dict[str, Any]) -> "TestResult":
+        """Row for a case from services.report_parser.iter_test_cases."""
+        return cls(
+            job_id=job_id,
+            title=case["title"],
+            file=case.get("file"),
+            line=case.get("line"),
+            project=case.get("project"),
+            status=case["status"],
+            duration_ms=case.get("duration_ms", 0),
+            retries=case.get("retries", 0),
+            error=case.get("error"),
+            attachments=json.dumps(case["attachments"]) if case.get("attachments") else None
+        )
+
+    @property
+    def attachment_list(self) -> List[Dict[str, Any]]:
+        return json.loads(self.attachments) if self.attachments else []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "title": self.title,
+            "file": self.file,
+            "line": self.line,
+            "project": self.project,
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "retries": self.retries,
+            "error": self.error,
+            "attachments": self.attachment_list
+        }
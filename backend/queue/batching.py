@@ -0,0 +1,227 @@
+"""
+Batch dispatch signalling.
+
+Submissions do not enqueue one Celery task per job. Instead they signal the
+job's batch key (app_version_id, target and priority queue) and only the first
+signal for a key enqueues a dispatcher task; later signals are coalesced into
+the pending dispatcher by bumping a counter. The dispatcher clears the marker
+before it claims queued jobs, so anything submitted after that point signals a
+fresh dispatcher and is never stranded.
+
+Lower-priority dispatchers linger before claiming (BATCH_LINGER_SECONDS for
+priority 1, scaled down to nothing for priority 5) so more jobs of the app
+version arrive and share one install. A signal that must not wait that long
+replaces the marker and enqueues an earlier dispatcher.
+
+Claiming is a single set-based UPDATE ... RETURNING, so two dispatchers for
+the same app version can never both take (and run) the same job.
+
+Redis also keeps running totals of achieved batch sizes, installs and
+installs avoided (overall for /batches/summary, and per target type for the
+app cache hit rate in /devices/status).
+"""
+import os
+import logging
+import time
+from typing import Dict, List, Optional
+
+import redis
+from sqlalchemy import and_, select, update
+from sqlalchemy.orm import Session
+
+from .celery_app import REDIS_URL
+from ..models.device import Device
+from ..models.job import Job
+
+logger = logging.getLogger(__name__)
+
+# Markers expire so a lost dispatcher task cannot block its batch key forever
+BATCH_SIGNAL_TTL = int(os.getenv('BATCH_SIGNAL_TTL', '3600'))
+
+# Largest batch one dispatcher claims (0 = no limit); leftovers get a new dispatcher
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '0'))
+
+# Seconds a priority-1 dispatcher waits for more jobs of its batch before claiming
+BATCH_LINGER_SECONDS = float(os.getenv('BATCH_LINGER_SECONDS', '0'))
+
+BATCH_STATS_KEY = 'qualcli:batch_stats'
+
+_redis_client: Optional[redis.Redis] = None
+
+def get_redis() -> redis.Redis:
+    """Return the process-wide Redis client used for batch markers."""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(REDIS_URL)
+    return _redis_client
+
+def batch_key(app_version_id: str, target: str, queue_name: str) -> str:
+    """Redis key of the pending-dispatcher marker for a batch."""
+    return f"qualcli:batch:{queue_name}:{target}:{app_version_id}"
+
+def linger_seconds(priority: int) -> float:
+    """How long a dispatcher for this priority waits for its batch to grow (0 for priority 5)."""
+    return max(0.0, BATCH_LINGER_SECONDS * (5 - priority) / 4)
+
+def acquire_batch_signal(app_version_id: str, target: str, queue_name: str, due_at: Optional[float] = None) -> bool:
+    """
+    Signal a batch key.
+
+    Args:
+        due_at: When the signal needs a dispatcher to run (default: now)
+
+    Returns:
+        True if the caller must enqueue a dispatcher for the key, False if a
+        dispatcher is already pending (and due by due_at) and the signal was
+        coalesced into it
+    """
+    client = get_redis()
+    key = batch_key(app_version_id, target, queue_name)
+    due_at = time.time() if due_at is None else due_at
+    if client.set(key, due_at, nx=True, ex=BATCH_SIGNAL_TTL):
+        return True
+    pending_due = client.get(key)
+    if pending_due is not None and due_at < float(pending_due):
+        # The pending dispatcher is lingering longer than this signal may wait;
+        # a second dispatcher is harmless since claiming is atomic
+        client.set(key, due_at, ex=BATCH_SIGNAL_TTL)
+        return True
+    client.incr(f"{key}:coalesced")
+    client.expire(f"{key}:coalesced", BATCH_SIGNAL_TTL)
+    return False
+
+def release_batch_signal(app_version_id: str, target: str, queue_name: str) -> int:
+    """
+    Clear the pending marker for a batch key.
+
+    Returns:
+        Number of signals that were coalesced into the dispatcher, i.e. task
+        wakeups that no longer happen
+    """
+    key = batch_key(app_version_id, target, queue_name)
+    pipe = get_redis().pipeline()
+    pipe.get(f"{key}:coalesced")
+    pipe.delete(key, f"{key}:coalesced")
+    coalesced, _ = pipe.execute()
+    return int(coalesced or 0)
+
+def claim_batch(db: Session, app_version_id: str, target: str, device: Device,
+                max_batch_size: Optional[int] = None, job_ids: Optional[List[int]] = None) -> List[Job]:
+    """
+    Atomically claim queued jobs of a batch for a device.
+
+    Flips status to running and assigns the device in one UPDATE ... RETURNING,
+    only for rows that are still queued. On Postgres the candidate rows are
+    locked with FOR UPDATE SKIP LOCKED so a concurrent claimer takes the
+    remaining jobs instead of waiting. Highest priority, then oldest, first.
+
+    Args:
+        db: Database session (committed by this function)
+        app_version_id: App version of the batch
+        target: Target type of the batch
+        device: Device the claimed jobs are assigned to
+        max_batch_size: Claim at most this many jobs (0 = all; None =
+            MAX_BATCH_SIZE, or all of job_ids when given)
+        job_ids: Only claim these jobs (the ones the fair-share scheduler
+            released to this dispatcher; already taken from the ready set, so
+            every one of them must be claimed)
+
+    Returns:
+        The claimed jobs
+    """
+    if max_batch_size is None:
+        max_batch_size = 0 if job_ids is not None else MAX_BATCH_SIZE
+
+    candidates = (
+        select(Job.id)
+        .where(
+            and_(
+                Job.app_version_id == app_version_id,
+                Job.target == target,
+                Job.status == "queued"
+            )
+        )
+        .order_by(Job.priority.desc(), Job.created_at, Job.id)
+        .with_for_update(skip_locked=True)
+    )
+    if job_ids is not None:
+        candidates = candidates.where(Job.id.in_(job_ids))
+    if max_batch_size:
+        candidates = candidates.limit(max_batch_size)
+
+    claimed = db.execute(
+        update(Job)
+        .where(and_(Job.id.in_(candidates.scalar_subquery()), Job.status == "queued"))
+        .values(
+            status="running",
+            device_id=device.id,
+            assigned_device_name=device.device_id
+        )
+        .returning(Job)
+    ).scalars().all()
+    # Order from the RETURNING values before commit expires them
+    claimed.sort(key=lambda job: (-job.priority, job.created_at, job.id))
+    db.commit()
+    return claimed
+
+def record_batch_stats(target: str, jobs: int, installs: int, warm_hits: int):
+    """
+    Add a dispatched batch to the running totals.
+
+    Args:
+        target: Target type of the batch
+        jobs: Jobs in the batch
+        installs: Devices the app had to be installed on
+        warm_hits: Devices that already had the app version installed
+    """
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hincrby(BATCH_STATS_KEY, 'batches', 1)
+    pipe.hincrby(BATCH_STATS_KEY, 'jobs', jobs)
+    pipe.hincrby(BATCH_STATS_KEY, 'installs', installs)
+    pipe.hincrby(BATCH_STATS_KEY, 'warm_devices', warm_hits)
+    pipe.hincrby(BATCH_STATS_KEY, f'installs:{target}', installs)
+    pipe.hincrby(BATCH_STATS_KEY, f'warm_devices:{target}', warm_hits)
+    pipe.execute()
+
+def batch_stats() -> Dict[str, float]:
+    """
+    Totals over every dispatched batch.
+
+    Returns:
+        batches, jobs, installs, installs_avoided (jobs that did not need
+        an install of their own), warm_device_hits (devices that already
+        had the version) and average_batch_size
+    """
+    raw = _raw_batch_stats()
+    batches, jobs, installs = raw.get('batches', 0), raw.get('jobs', 0), raw.get('installs', 0)
+    return {
+        'batches': batches,
+        'jobs': jobs,
+        'installs': installs,
+        'installs_avoided': jobs - installs,
+        'warm_device_hits': raw.get('warm_devices', 0),
+        'average_batch_size': round(jobs / batches, 2) if batches else 0,
+    }
+
+def app_cache_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Warm-install hit rate per target type.
+
+    Returns:
+        {target: {"hits", "misses", "hit_rate"}}, a hit being a device that
+        already had the batch's app version installed
+    """
+    raw = _raw_batch_stats()
+    stats = {}
+    for field, value in sorted(raw.items()):
+        kind, _, target = field.partition(':')
+        if target and kind in ('warm_devices', 'installs'):
+            entry = stats.setdefault(target, {'hits': 0, 'misses': 0})
+            entry['hits' if kind == 'warm_devices' else 'misses'] += value
+    for entry in stats.values():
+        used = entry['hits'] + entry['misses']
+        entry['hit_rate'] = round(entry['hits'] / used, 3) if used else 0
+    return stats
+
+def _raw_batch_stats() -> Dict[str, int]:
+    return {field.decode(): int(value) for field, value in get_redis().hgetall(BATCH_STATS_KEY).items()}
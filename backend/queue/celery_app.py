@@ -10,11 +10,22 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Broker/result backend URLs (Redis also holds the batch dispatch markers)
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
+REDIS_URL = os.getenv('REDIS_URL', CELERY_BROKER_URL)
+
+# Seconds between reconciliations of the Redis dashboard counters with the database
+COUNTERS_RECONCILE_INTERVAL = float(os.getenv('COUNTERS_RECONCILE_INTERVAL', '60'))
+
+# Seconds between fair-share release rounds (a safety net; frees and submits trigger one too)
+FAIR_SHARE_RELEASE_INTERVAL = float(os.getenv('FAIR_SHARE_RELEASE_INTERVAL', '5'))
+
 # Create Celery app
 celery_app = Celery(
     'qualcli',
-    broker='redis://localhost:6379/0',
-    backend='redis://localhost:6379/0',
+    broker=CELERY_BROKER_URL,
+    backend=CELERY_RESULT_BACKEND,
     include=['backend.queue.tasks']  # Include our tasks module
 )
 
@@ -60,6 +71,9 @@ celery_app.conf.update(
     task_routes={
         'backend.queue.tasks.process_test_job': {
             'queue': 'normal_priority',  # Default, will be overridden by routing function
+        },
+        'backend.queue.tasks.dispatch_batch': {
+            'queue': 'normal_priority',  # Default, will be overridden by routing function
         }
     },
     
@@ -67,6 +81,20 @@ celery_app.conf.update(
     worker_direct=True,  # Enable direct task routing
     task_acks_late=True,  # Acknowledge tasks after completion
     worker_disable_rate_limits=False,  # Enable rate limiting
+    
+    # Periodic jobs (run `celery -A backend.queue.celery_app beat` alongside the workers)
+    beat_schedule={
+        'reconcile-queue-counters': {
+            'task': 'backend.queue.tasks.reconcile_counters',
+            'schedule': COUNTERS_RECONCILE_INTERVAL,
+            'options': {'queue': 'high_priority'},  # Short task; don't wait behind long batches
+        },
+        'schedule-ready-jobs': {
+            'task': 'backend.queue.tasks.schedule_ready_jobs',
+            'schedule': FAIR_SHARE_RELEASE_INTERVAL,
+            'options': {'queue': 'high_priority', 'expires': FAIR_SHARE_RELEASE_INTERVAL},
+        },
+    },
 )
 
 def get_queue_by_priority(priority: int) -> str:
@@ -0,0 +1,351 @@
+"""
+Weighted fair-share scheduling across orgs and priorities.
+
+Without it, queued jobs are dispatched as soon as they are submitted and
+devices go to whichever dispatcher asks first, with priority >= 4 allowed to
+preempt: one org flooding priority-5 jobs takes every device, and priority-1
+jobs can wait indefinitely.
+
+With FAIR_SHARE_SCHEDULING=true, submitted jobs go into a ready set instead.
+Each (org, priority) pair is a flow with weight
+
+    org weight (FAIR_SHARE_ORG_WEIGHTS, default 1) x priority weight
+    (FAIR_SHARE_PRIORITY_WEIGHTS, default 1=1,2=2,3=4,4=8,5=16)
+
+and jobs are tagged with start-time fair queuing: a job starts at
+max(virtual time, its flow's last finish tag) and advances the flow by
+1/weight, so busy flows share devices in proportion to their weights no
+matter how many jobs each has queued. Aging adds FAIR_SHARE_AGING_RATE
+virtual units of credit per second waited. Because the credit grows at the
+same rate for every waiting job, the rank
+
+    start tag + aging rate x enqueue time
+
+is fixed at submission, and every job eventually outranks new arrivals.
+
+Jobs leave the ready set only while their target type has free device
+slots: release_ready_jobs() (on submit, whenever a batch frees its slots, and
+from Celery beat) pops the best-ranked jobs and signals their batches, and
+the dispatcher claims just the jobs released to it.
+
+FairShareQueue is the in-memory form of the policy, used by
+scripts/simulate_scheduler.py; ReadySet keeps the same state in Redis so
+every API process and worker shares it.
+"""
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import redis
+
+from .batching import get_redis
+
+logger = logging.getLogger(__name__)
+
+def parse_weights(spec: str, key_type=str) -> Dict[Any, float]:
+    """Parse "key=weight,key=weight" into a dict."""
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        key, _, weight = item.partition('=')
+        weights[key_type(key.strip())] = float(weight)
+    return weights
+
+FAIR_SHARE_SCHEDULING = os.getenv('FAIR_SHARE_SCHEDULING', 'false').lower() == 'true'
+PRIORITY_WEIGHTS = parse_weights(os.getenv('FAIR_SHARE_PRIORITY_WEIGHTS', '1=1,2=2,3=4,4=8,5=16'), int)
+ORG_WEIGHTS = parse_weights(os.getenv('FAIR_SHARE_ORG_WEIGHTS', ''))
+
+# Virtual units of credit per second waited (0.005: 200s of waiting = one job at weight 1).
+# Higher rates drift towards first come first served, letting a burst hold devices longer.
+AGING_RATE = float(os.getenv('FAIR_SHARE_AGING_RATE', '0.005'))
+
+# Released jobs not claimed by a dispatcher within this many seconds go back to the ready set
+RELEASE_TIMEOUT = float(os.getenv('FAIR_SHARE_RELEASE_TIMEOUT', '300'))
+
+SCHEDULER_PREFIX = 'qualcli:sched'
+
+def flow_weight(org_id: str, priority: int, org_weights: Dict[str, float] = None,
+                priority_weights: Dict[int, float] = None) -> float:
+    """Share of a (org, priority) flow relative to a weight-1 flow."""
+    org_weights = ORG_WEIGHTS if org_weights is None else org_weights
+    priority_weights = PRIORITY_WEIGHTS if priority_weights is None else priority_weights
+    return org_weights.get(org_id, 1.0) * priority_weights.get(priority, 1.0)
+
+def tag(virtual_time: float, flow_finish: float, weight: float, cost: float = 1.0) -> Tuple[float, float]:
+    """Start and finish tags of a job joining a flow (start-time fair queuing)."""
+    start = max(virtual_time, flow_finish)
+    return start, start + cost / weight
+
+def rank(start: float, enqueued_at: float, aging_rate: float = None) -> float:
+    """Dispatch order key; lower goes first."""
+    return start + (AGING_RATE if aging_rate is None else aging_rate) * enqueued_at
+
+def enqueued_at(job: Any, now: float) -> float:
+    """When a job joined the queue (its naive-UTC created_at), or `now` if unknown."""
+    created_at = getattr(job, "created_at", None)
+    if created_at is None:
+        return now
+    return created_at.replace(tzinfo=timezone.utc).timestamp()
+
+class FairShareQueue:
+    """In-memory ready set with the fair-share policy."""
+
+    def __init__(self, org_weights: Dict[str, float] = None, priority_weights: Dict[int, float] = None,
+                 aging_rate: float = None):
+        self.org_weights = ORG_WEIGHTS if org_weights is None else org_weights
+        self.priority_weights = PRIORITY_WEIGHTS if priority_weights is None else priority_weights
+        self.aging_rate = AGING_RATE if aging_rate is None else aging_rate
+        self.virtual_time = 0.0
+        self.finish = {}
+        self._heap = []
+        self._seq = itertools.count()
+
+    def push(self, item: Any, org_id: str, priority: int, enqueued_at: float, cost: float = 1.0):
+        flow = (org_id, priority)
+        weight = flow_weight(org_id, priority, self.org_weights, self.priority_weights)
+        start, self.finish[flow] = tag(self.virtual_time, self.finish.get(flow, 0.0), weight, cost)
+        heapq.heappush(self._heap, (rank(start, enqueued_at, self.aging_rate), next(self._seq), start, item))
+
+    def pop(self) -> Any:
+        _, _, start, item = heapq.heappop(self._heap)
+        self.virtual_time = max(self.virtual_time, start)
+        return item
+
+    def __len__(self):
+        return len(self._heap)
+
+class ReadySet:
+    """
+    The ready set in Redis.
+
+    Keys (under qualcli:sched):
+        ready:{target}      sorted set, job id -> rank
+        jobs                job id -> {"start", "app_version_id", "priority"},
+                            kept until the job is claimed so it can be requeued
+        finish              "{org}:{priority}" -> finish tag of the flow's last job
+        vtime               virtual time (start tag of the last released job)
+        released:{target}   job id -> {"rank", "app_version_id", "released_at"}
+    """
+
+    def __init__(self, client: Optional[redis.Redis] = None, prefix: str = SCHEDULER_PREFIX):
+        self.client = client or get_redis()
+        self.prefix = prefix
+        self.jobs_key = f"{prefix}:jobs"
+        self.finish_key = f"{prefix}:finish"
+        self.vtime_key = f"{prefix}:vtime"
+        self.lock_key = f"{prefix}:lock"
+        self.pending_key = f"{prefix}:pending"
+
+    def ready_key(self, target: str) -> str:
+        return f"{self.prefix}:ready:{target}"
+
+    def released_key(self, target: str) -> str:
+        return f"{self.prefix}:released:{target}"
+
+    def enqueue(self, jobs: Iterable, now: float = None):
+        """
+        Add queued jobs to the ready set.
+
+        Accepts Jobs or rows with id, org_id, priority, target and
+        app_version_id. Tags are assigned under WATCH so concurrent
+        submissions to the same flow get consecutive tags. Jobs that carry
+        created_at age from then, so a job put back (e.g. after preemption)
+        keeps the wait it has already built up; others age from `now`.
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return
+        now = time.time() if now is None else now
+        while True:
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(self.finish_key, self.vtime_key)
+                    virtual_time = float(pipe.get(self.vtime_key) or 0)
+                    flows = sorted({f"{job.org_id}:{job.priority}" for job in jobs})
+                    finish = dict(zip(flows, pipe.hmget(self.finish_key, flows)))
+                    finish = {flow: float(value or 0) for flow, value in finish.items()}
+
+                    pipe.multi()
+                    for job in jobs:
+                        flow = f"{job.org_id}:{job.priority}"
+                        start, finish[flow] = tag(virtual_time, finish[flow], flow_weight(job.org_id, job.priority))
+                        pipe.zadd(self.ready_key(job.target), {job.id: rank(start, enqueued_at(job, now))})
+                        pipe.hset(self.jobs_key, job.id, json.dumps({
+                            "start": start, "app_version_id": job.app_version_id, "priority": job.priority
+                        }))
+                    pipe.hset(self.finish_key, mapping=finish)
+                    pipe.execute()
+                    return
+                except redis.WatchError:
+                    continue
+
+    def outstanding(self, target: str) -> int:
+        """Jobs released to dispatchers that have not been claimed yet."""
+        return self.client.hlen(self.released_key(target))
+
+    def release(self, free_slots: Dict[str, int], now: float = None) -> Dict[Tuple[str, str], int]:
+        """
+        Release the best-ranked ready jobs of each target, up to its free slots
+        minus jobs already released and not yet claimed.
+
+        Returns:
+            {(app_version_id, target): highest released priority} - the
+            batches that need a dispatcher
+        """
+        now = time.time() if now is None else now
+        batches = {}
+        for target, slots in free_slots.items():
+            self._requeue_stale(target, now)
+            count = slots - self.outstanding(target)
+            if count <= 0:
+                continue
+            popped = self.client.zpopmin(self.ready_key(target), count)
+            if not popped:
+                continue
+
+            job_ids = [job_id for job_id, _ in popped]
+            metas = [json.loads(meta) if meta else None for meta in self.client.hmget(self.jobs_key, job_ids)]
+            pipe = self.client.pipeline()
+            virtual_time = 0.0
+            for (job_id, job_rank), meta in zip(popped, metas):
+                if meta is None:
+                    continue  # Discarded while ready
+                virtual_time = max(virtual_time, meta["start"])
+                pipe.hset(self.released_key(target), job_id, json.dumps({
+                    "rank": job_rank, "app_version_id": meta["app_version_id"], "released_at": now
+                }))
+                key = (meta["app_version_id"], target)
+                batches[key] = max(batches.get(key, 0), meta["priority"])
+            pipe.execute()
+            self._advance_virtual_time(virtual_time)
+        return batches
+
+    def take_released(self, app_version_id: str, target: str) -> List[int]:
+        """Atomically take the jobs of a batch released to its dispatcher."""
+        key = self.released_key(target)
+        while True:
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    taken = [
+                        job_id for job_id, entry in pipe.hgetall(key).items()
+                        if json.loads(entry)["app_version_id"] == app_version_id
+                    ]
+                    pipe.multi()
+                    if taken:
+                        pipe.hdel(key, *taken)
+                        pipe.hdel(self.jobs_key, *taken)
+                    pipe.execute()
+                    return sorted(int(job_id) for job_id in taken)
+                except redis.WatchError:
+                    continue
+
+    def requeue_released(self, app_version_id: str, target: str) -> int:
+        """
+        Put a batch's released jobs back into the ready set with their
+        original rank, e.g. when its dispatcher found no free device after all.
+        """
+        key = self.released_key(target)
+        ranks = {
+            int(job_id): entry["rank"]
+            for job_id, entry in ((job_id, json.loads(raw)) for job_id, raw in self.client.hgetall(key).items())
+            if entry["app_version_id"] == app_version_id
+        }
+        return self._requeue(target, ranks)
+
+    def _requeue(self, target: str, ranks: Dict[int, float]) -> int:
+        if not ranks:
+            return 0
+        pipe = self.client.pipeline()
+        pipe.hdel(self.released_key(target), *ranks)
+        pipe.zadd(self.ready_key(target), ranks)
+        pipe.execute()
+        return len(ranks)
+
+    def _requeue_stale(self, target: str, now: float):
+        key = self.released_key(target)
+        stale = {
+            int(job_id): entry["rank"]
+            for job_id, entry in ((job_id, json.loads(raw)) for job_id, raw in self.client.hgetall(key).items())
+            if now - entry["released_at"] > RELEASE_TIMEOUT
+        }
+        if stale:
+            logger.warning(f"⏰ {len(stale)} released {target} jobs were never claimed; returning them to the ready set")
+            self._requeue(target, stale)
+
+    def _advance_virtual_time(self, virtual_time: float):
+        while True:
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(self.vtime_key)
+                    if virtual_time <= float(pipe.get(self.vtime_key) or 0):
+                        return
+                    pipe.multi()
+                    pipe.set(self.vtime_key, virtual_time)
+                    pipe.execute()
+                    return
+                except redis.WatchError:
+                    continue
+
+    def discard(self, job_ids: Iterable[int], target: str):
+        """Drop jobs (e.g. cancelled) from the ready set."""
+        job_ids = list(job_ids)
+        if job_ids:
+            pipe = self.client.pipeline()
+            pipe.zrem(self.ready_key(target), *job_ids)
+            pipe.hdel(self.jobs_key, *job_ids)
+            pipe.hdel(self.released_key(target), *job_ids)
+            pipe.execute()
+
+    @contextmanager
+    def releasing(self, ttl: int = 30):
+        """
+        Hold the release lock, so two releasers never hand out the same free
+        slots. Yields False if another process holds it; that process will
+        run another round for the caller (see release_ready_jobs).
+        """
+        token = uuid.uuid4().hex
+        if not self.client.set(self.lock_key, token, nx=True, ex=ttl):
+            self.client.set(self.pending_key, 1, ex=ttl)
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(self.lock_key)
+                    if pipe.get(self.lock_key) == token.encode():
+                        pipe.multi()
+                        pipe.delete(self.lock_key)
+                        pipe.execute()
+                except redis.WatchError:
+                    pass
+
+    def take_pending(self) -> bool:
+        """Whether a release round was requested while the lock was held (clears the request)."""
+        pipe = self.client.pipeline()
+        pipe.get(self.pending_key)
+        pipe.delete(self.pending_key)
+        pending, _ = pipe.execute()
+        return bool(pending)
+
+def free_slots_by_target(devices: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Free device slots per target type.
+
+    Args:
+        devices: Dicts with type, status, current_jobs and max_jobs (the
+            shape of QueueCounters.snapshot)
+    """
+    slots = {}
+    for device in devices:
+        free = device['max_jobs'] - device['current_jobs'] if device['status'] == 'available' else 0
+        slots[device['type']] = slots.get(device['type'], 0) + max(free, 0)
+    return slots
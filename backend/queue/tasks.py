@@ -1,17 +1,29 @@
-from .celery_app import celery_app
+from .celery_app import celery_app, get_queue_by_priority
+from .batching import (
+    acquire_batch_signal, release_batch_signal, claim_batch, MAX_BATCH_SIZE,
+    linger_seconds, record_batch_stats
+)
+from .scheduler import FAIR_SHARE_SCHEDULING, ReadySet, free_slots_by_target
+from .worker_loop import run_coroutine, execution_slot
 from ..models.job import Job
 from ..models.device import Device
+from ..models.test_result import TestResult
 from ..database import SessionLocal
 from ..services.test_runner import TestRunner
 from ..services.real_test_runner import RealTestRunner
 from ..services.device_manager import DeviceManager
-from typing import Dict, Any, List
+from ..services import events, preemption, sharding
+from ..services.preemption import PREEMPT_POLL_INTERVAL
+from ..services.counters import QueueCounters
+from ..services.runtime_stats import RuntimeModel, longest_first
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 import sys
-import json
 import asyncio
 import os
-from sqlalchemy import and_
+import time
+from sqlalchemy import and_, inspect, update
+from celery.exceptions import Retry
 
 # Configure logging
 logging.basicConfig(
@@ -30,33 +42,149 @@ logging.getLogger().setLevel(logging.DEBUG)
 # Configuration for test execution mode
 USE_REAL_EXECUTION = os.getenv("USE_REAL_APPWRIGHT_EXECUTION", "false").lower() == "true"
 
+# How long a dispatcher waits for a free device before retrying; the wait doubles
+# on every retry up to DEVICE_RETRY_MAX_DELAY, and the batch stays queued meanwhile
+DEVICE_RETRY_DELAY = int(os.getenv("DEVICE_RETRY_DELAY", "10"))
+DEVICE_RETRY_MAX_DELAY = int(os.getenv("DEVICE_RETRY_MAX_DELAY", "300"))
+
+# Upper bound on device slots (across devices of the target type) one batch may use
+BATCH_MAX_PARALLEL_SLOTS = int(os.getenv("BATCH_MAX_PARALLEL_SLOTS", "10"))
+
+DISPATCH_RETRY_POLICY = {
+    'max_retries': 3,
+    'interval_start': 0,
+    'interval_step': 0.2,
+    'interval_max': 0.2,
+}
+
+def enqueue_batch_dispatch(app_version_id: str, target: str, priority: int, producer=None,
+                           linger: bool = True) -> bool:
+    """
+    Signal the batch key of a newly recorded job.
+
+    Only the first signal for a key enqueues a dispatch_batch task; the rest
+    are coalesced into the pending dispatcher. Jobs must be committed before
+    signalling so the dispatcher is guaranteed to see them.
+
+    Args:
+        linger: Let the dispatcher wait linger_seconds(priority) for more jobs
+            of the batch (off for jobs that are already waiting, e.g. released
+            by the fair-share scheduler or left over past MAX_BATCH_SIZE)
+
+    Returns:
+        True if a dispatcher task was enqueued, False if one was already pending
+    """
+    queue_name = get_queue_by_priority(priority)
+    countdown = linger_seconds(priority) if linger else 0
+    if not acquire_batch_signal(app_version_id, target, queue_name, due_at=time.time() + countdown):
+        logger.info(f"Coalesced signal for batch {app_version_id}/{target} into pending {queue_name} dispatcher")
+        return False
+
+    try:
+        task = dispatch_batch.apply_async(
+            args=[app_version_id, target, priority],
+            queue=queue_name,
+            priority=priority,  # Set task priority within the queue
+            countdown=countdown or None,
+            retry=True,
+            retry_policy=DISPATCH_RETRY_POLICY,
+            producer=producer
+        )
+    except Exception:
+        # Drop the marker so the next submission can enqueue a dispatcher
+        release_batch_signal(app_version_id, target, queue_name)
+        raise
+
+    logger.info(f"Enqueued dispatcher {task.id} for batch {app_version_id}/{target} in {queue_name} queue"
+                + (f" (lingering {countdown:g}s)" if countdown else ""))
+    return True
+
+def release_ready_jobs() -> int:
+    """
+    Fair-share mode: release the best-ranked ready jobs into the device slots
+    that are free and signal their batches.
+
+    Only one process releases at a time; a call that finds the lock taken
+    leaves a request for the holder to run another round, so no trigger is lost.
+
+    Returns:
+        Number of batches signalled
+    """
+    ready = ReadySet()
+    signalled = 0
+    while True:
+        with ready.releasing() as acquired:
+            if not acquired:
+                return signalled
+            batches = ready.release(_free_device_slots())
+        for (app_version_id, target), priority in batches.items():
+            enqueue_batch_dispatch(app_version_id, target, priority, linger=False)
+            signalled += 1
+        if batches:
+            logger.info(f"⚖️ Released ready jobs to {len(batches)} batches: {sorted(batches)}")
+        if not ready.take_pending():
+            return signalled
+
+def _free_device_slots() -> Dict[str, int]:
+    """Free slots per target type, from the Redis counters or else the database."""
+    snapshot = QueueCounters().snapshot()
+    if snapshot is not None:
+        return free_slots_by_target(snapshot[0])
+    db = SessionLocal()
+    try:
+        return free_slots_by_target(
+            {'type': d.device_type, 'status': d.status, 'current_jobs': d.current_jobs, 'max_jobs': d.max_concurrent_jobs}
+            for d in db.query(Device).all()
+        )
+    finally:
+        db.close()
+
+def _refill_slots():
+    """Fair-share mode: hand slots a batch just freed to the next ready jobs."""
+    if not FAIR_SHARE_SCHEDULING:
+        return
+    try:
+        release_ready_jobs()
+    except Exception as e:
+        logger.error(f"Error releasing ready jobs: {str(e)}")
+
+@celery_app.task(name='backend.queue.tasks.schedule_ready_jobs')
+def schedule_ready_jobs() -> Dict[str, Any]:
+    """Periodic fair-share release round, in case a slot was freed without a trigger."""
+    if not FAIR_SHARE_SCHEDULING:
+        return {"status": "disabled"}
+    return {"status": "completed", "batches_signalled": release_ready_jobs()}
+
+@celery_app.task(bind=True, name='backend.queue.tasks.dispatch_batch')
+def dispatch_batch(self, app_version_id: str, target: str, priority: int) -> Dict[str, Any]:
+    """
+    Claim, allocate and execute every queued job of one batch key.
+
+    A single dispatcher runs per (app_version_id, target, priority queue);
+    submissions that arrived while it was pending were coalesced into it
+    instead of enqueuing their own task.
+    """
+    queue_name = get_queue_by_priority(priority)
+    coalesced = release_batch_signal(app_version_id, target, queue_name)
+    logger.info(f"🚀 Dispatching batch {app_version_id}/{target} from {queue_name} "
+                f"({coalesced} coalesced signals, task {self.request.id})")
+
+    result = _run_batch(self, app_version_id, target, priority)
+    result["batch_key"] = {"app_version_id": app_version_id, "target": target, "queue": queue_name}
+    result["redundant_wakeups_avoided"] = coalesced
+    return result
+
 @celery_app.task(bind=True, name='backend.queue.tasks.process_test_job')
 def process_test_job(self, job_id: int) -> Dict[str, Any]:
     """
     Process a test job with batching logic.
-    
-    This task:
-    1. Loads job details from database
-    2. Groups jobs by app_version_id and target
-    3. Claims all related queued jobs to process as a batch
-    4. Installs app once per batch (or simulates installation)
-    5. Executes all tests in the batch (real or mock execution)
-    6. Updates individual job statuses
+
+    Kept for tasks already sitting in the broker from per-job submission;
+    new submissions go through enqueue_batch_dispatch. Runs the batch the
+    job belongs to if the job is still queued.
     """
-    db = None
-    job = None
-    batch_jobs = []
-    
+    db = SessionLocal()
     try:
-        execution_mode = "REAL" if USE_REAL_EXECUTION else "MOCK"
-        logger.info(f"🚀 Starting to process job {job_id} in {execution_mode} mode")
-        logger.info(f"Task ID: {self.request.id}")
-        
-        # Get database session
-        db = SessionLocal()
-        logger.info(f"Connected to database for job {job_id}")
-        
-        # Get job details
         job = db.query(Job).filter(Job.id == job_id).first()
         if not job:
             error_msg = f"Job {job_id} not found"
@@ -67,8 +195,6 @@ def process_test_job(self, job_id: int) -> Dict[str, Any]:
                 "error": error_msg
             }
 
-        logger.info(f"Found job {job_id} in database with status {job.status}")
-        
         # Check if job is already being processed
         if job.status != "queued":
             logger.info(f"Job {job_id} already processed with status {job.status}")
@@ -78,130 +204,162 @@ def process_test_job(self, job_id: int) -> Dict[str, Any]:
                 "message": "Job already processed"
             }
 
+        app_version_id, target, priority = job.app_version_id, job.target, job.priority
+    finally:
+        db.close()
+
+    result = _run_batch(self, app_version_id, target, priority)
+    result["job_id"] = job_id
+    return result
+
+def _run_batch(task, app_version_id: str, target: str, priority: int) -> Dict[str, Any]:
+    """
+    Execute every queued job with the given app_version_id and target.
+
+    This:
+    1. Allocates a device for the target type
+    2. Claims all related queued jobs to process as a batch
+    3. Installs app once per batch (or simulates installation)
+    4. Executes all tests in the batch (real or mock execution)
+    5. Updates individual job statuses
+    """
+    db = None
+    batch_jobs = []
+    parent_ids = set()  # Sharded jobs the batch runs shards of
+    allocated_device = None
+    slots = []
+    execution_mode = "REAL" if USE_REAL_EXECUTION else "MOCK"
+    
+    try:
+        logger.info(f"🚀 Processing batch {app_version_id}/{target} in {execution_mode} mode")
+        logger.info(f"Task ID: {task.request.id}")
+        
+        # Get database session
+        db = SessionLocal()
+        
+        batch_filter = and_(
+            Job.app_version_id == app_version_id,
+            Job.target == target,  # Same target for device efficiency
+            Job.status == "queued"
+        )
+        if db.query(Job.id).filter(batch_filter).first() is None:
+            logger.info(f"No queued jobs left for batch {app_version_id}/{target}")
+            if FAIR_SHARE_SCHEDULING:
+                ReadySet().take_released(app_version_id, target)  # Cancelled while released
+            return {
+                "status": "completed",
+                "execution_mode": execution_mode,
+                "message": "No queued jobs to process"
+            }
+
         # DEVICE ALLOCATION: First try to allocate a device for this target type
         device_manager = DeviceManager(db)
-        allocated_device = device_manager.allocate_device(job.target, job.priority)
+        allocated_device = device_manager.allocate_device(target, priority, app_version_id=app_version_id)
         
         if not allocated_device:
-            error_msg = f"No available devices for target type {job.target}"
-            logger.error(error_msg)
-            job.status = "failed"
-            db.commit()
-            return {
-                "job_id": job_id,
-                "status": "failed",
-                "error": error_msg
-            }
+            if FAIR_SHARE_SCHEDULING:
+                # The slot went elsewhere after the release; wait for the next one
+                requeued = ReadySet().requeue_released(app_version_id, target)
+                logger.info(f"⏳ No free {target} device; returned {requeued} jobs to the ready set")
+                return {
+                    "status": "queued",
+                    "execution_mode": execution_mode,
+                    "message": "Returned to the fair-share ready set"
+                }
+            return _handle_no_device(task, db, batch_filter, app_version_id, target, priority, execution_mode)
         
-        logger.info(f"📱 Allocated device {allocated_device.device_id} for job {job_id}")
+        slots.append(allocated_device)
+        logger.info(f"📱 Allocated device {allocated_device.device_id} for batch {app_version_id}/{target}")
 
         # BATCH COORDINATION: Claim all related queued jobs atomically for the same device type
-        related_jobs = db.query(Job).filter(
-            and_(
-                Job.app_version_id == job.app_version_id,
-                Job.target == job.target,  # Same target for device efficiency
-                Job.status == "queued"
-            )
-        ).all()
+        # (in fair-share mode, only the ones the scheduler released to this batch)
+        if FAIR_SHARE_SCHEDULING:
+            released = ReadySet().take_released(app_version_id, target)
+            batch_jobs = claim_batch(db, app_version_id, target, allocated_device, job_ids=released)
+        else:
+            batch_jobs = claim_batch(db, app_version_id, target, allocated_device)
+        batch_job_ids = [batch_job.id for batch_job in batch_jobs]
+        parent_ids = {batch_job.parent_job_id for batch_job in batch_jobs} - {None}
+        
+        if not batch_jobs:
+            logger.info(f"Batch {app_version_id}/{target} was claimed by another dispatcher")
+            device_manager.release_device(allocated_device.id)
+            _refill_slots()
+            return {
+                "status": "completed",
+                "execution_mode": execution_mode,
+                "message": "No queued jobs to process"
+            }
         
-        # Update all related jobs to "running" and assign to the same device
-        batch_job_ids = []
-        for related_job in related_jobs:
-            related_job.status = "running"
-            related_job.device_id = allocated_device.id
-            related_job.assigned_device_name = allocated_device.device_id
-            batch_job_ids.append(related_job.id)
-            batch_jobs.append(related_job)
+        if MAX_BATCH_SIZE and len(batch_jobs) >= MAX_BATCH_SIZE and not FAIR_SHARE_SCHEDULING:
+            # Jobs may be left over past the size cap; make sure they get a dispatcher
+            enqueue_batch_dispatch(app_version_id, target, priority, linger=False)
         
-        db.commit()
+        events.publish_events(events.job_event(batch_job, "queued") for batch_job in batch_jobs)
         logger.info(f"📦 Claimed batch of {len(batch_jobs)} jobs: {batch_job_ids}")
-        logger.info(f"Batch details: app_version_id={job.app_version_id}, target={job.target}, device={allocated_device.device_id}")
+        logger.info(f"Batch details: app_version_id={app_version_id}, target={target}, device={allocated_device.device_id}")
+
+        # PARALLEL SLOTS: Take extra concurrency slots on this and other devices of the same type,
+        # leaving a free slot for every other batch waiting on the target
+        max_slots = min(len(batch_jobs), BATCH_MAX_PARALLEL_SLOTS,
+                        len(slots) + device_manager.spare_slots(target, app_version_id))
+        while len(slots) < max_slots:
+            extra_device = device_manager.allocate_device(target, priority, allow_preemption=False,
+                                                          app_version_id=app_version_id)
+            if not extra_device:
+                break
+            slots.append(extra_device)
+        slot_devices = sorted({device.device_id for device in slots})
+        logger.info(f"🧵 Running batch on {len(slots)} slots across devices {slot_devices}")
 
+        # App installation (once per device used by the batch, skipped where it is already installed)
+        cold_devices = device_manager.use_app_version(sorted({device.id for device in slots}), app_version_id)
+        warm_hits = len(slot_devices) - len(cold_devices)
+        
         # BATCH PROCESSING: Initialize test runner for the batch
         if USE_REAL_EXECUTION:
             logger.info("🚀 Using REAL AppWright test execution")
-            runner = RealTestRunner(target=job.target)
+            runner = RealTestRunner(target=target, app_installed=not cold_devices)
         else:
             logger.info("🎭 Using MOCK test execution (simulation mode)")
-            runner = TestRunner(target=job.target)
-        
-        # App installation (once per batch)
-        logger.info(f"📱 Installing app {job.app_version_id} on {job.target} for batch")
-        installation_time = await_app_installation(job.target)
-        logger.info(f"✅ App installation completed in {installation_time}s")
+            runner = TestRunner(target=target)
         
-        # Process all jobs in the batch
-        batch_results = []
-        successful_jobs = 0
-        failed_jobs = 0
-        
-        for batch_job in batch_jobs:
-            try:
-                logger.info(f"🧪 Processing job {batch_job.id}: {batch_job.test_path}")
-                
-                # Run the test using asyncio - use app_version_id only for tracking, not for modifying buildPath
-                loop = asyncio.get_event_loop()
-                test_result = loop.run_until_complete(
-                    runner.run_tests(batch_job.test_path, batch_job.app_version_id)
-                )
-                
-                if test_result["success"]:
-                    batch_job.status = "completed"
-                    successful_jobs += 1
-                    
-                    # Enhanced result for real execution
-                    result_data = test_result["results"]
-                    if USE_REAL_EXECUTION and result_data.get("video_info"):
-                        video_info = result_data["video_info"]
-                        if video_info.get("platform") == "browserstack":
-                            logger.info(f"📹 BrowserStack video recording enabled for job {batch_job.id}")
-                        elif video_info.get("video_path"):
-                            logger.info(f"📹 Video recorded for job {batch_job.id}: {video_info['video_path']}")
-                    
-                    result = {
-                        "job_id": batch_job.id,
-                        "status": "completed",
-                        "result": result_data,
-                        "execution_mode": execution_mode
-                    }
-                else:
-                    batch_job.status = "failed"
-                    failed_jobs += 1
-                    result = {
-                        "job_id": batch_job.id,
-                        "status": "failed",
-                        "error": test_result["error"],
-                        "execution_mode": execution_mode
-                    }
-                
-                batch_results.append(result)
-                logger.info(f"{'✅' if batch_job.status == 'completed' else '❌'} Job {batch_job.id} completed with status: {batch_job.status}")
-                
-            except Exception as e:
-                error_msg = f"Error processing job {batch_job.id}: {str(e)}"
-                logger.error(error_msg)
-                batch_job.status = "failed"
-                failed_jobs += 1
-                batch_results.append({
-                    "job_id": batch_job.id,
-                    "status": "failed",
-                    "error": error_msg,
-                    "execution_mode": execution_mode
-                })
+        if cold_devices:
+            logger.info(f"📱 Installing app {app_version_id} on {len(cold_devices)} {target} devices for batch "
+                        f"({warm_hits} already have it)")
+            installation_time = await_app_installation(target)
+            logger.info(f"✅ App installation completed in {installation_time}s")
+        else:
+            logger.info(f"♻️ App {app_version_id} already installed on {slot_devices}; skipping installation")
+            installation_time = 0
+        installations = len(cold_devices)
+        _record_batch(target, len(batch_jobs), installations, warm_hits)
         
-        # Commit all job status updates
-        db.commit()
+        # Longest tests first, so the batch does not end with one slot running a long test
+        batch_jobs = _longest_first(batch_jobs, target)
+
+        # Process all jobs in the batch on the worker's event loop, one coroutine per slot
+        started_at = time.monotonic()
+        slot_count = len(slots)
+        _detach(db, batch_jobs + slots)
+        execution = run_coroutine(_execute_batch(runner, batch_jobs, slots, execution_mode))
+        batch_results, preempted_jobs = execution["results"], execution["preempted"]
+        wall_time = time.monotonic() - started_at
+        successful_jobs = sum(1 for r in batch_results if r["status"] == "completed")
+        failed_jobs = len(batch_results) - successful_jobs
         
-        # DEVICE CLEANUP: Release the allocated device
-        device_manager.release_device(allocated_device.id)
-        logger.info(f"🔄 Released device {allocated_device.device_id} after batch completion")
+        # DEVICE CLEANUP: Release every slot that was not already given up to preemption
+        for device in slots:
+            device_manager.release_device(device.id)
+        logger.info(f"🔄 Released {len(slots)} slots on {slot_devices} after batch completion")
+        slots = []
+        _refill_slots()
+        _rollup_shards(db, parent_ids)
         
         # Log batch summary
-        total_time = installation_time + sum([
-            r.get("result", {}).get("execution_time", 0) 
-            for r in batch_results 
-            if r["status"] == "completed"
-        ])
+        total_time = installation_time + round(wall_time, 2)
+        installs_avoided = len(batch_jobs) - installations
+        install_cost = await_app_installation(target)
         
         # Count video recordings for real execution
         video_count = 0
@@ -214,54 +372,71 @@ def process_test_job(self, job_id: int) -> Dict[str, Any]:
                 )
             ])
         
-        logger.info(f"📊 Batch processing completed:")
+        logger.info("📊 Batch processing completed:")
         logger.info(f"  - Execution mode: {execution_mode}")
         logger.info(f"  - Total jobs: {len(batch_jobs)}")
         logger.info(f"  - Successful: {successful_jobs}")
         logger.info(f"  - Failed: {failed_jobs}")
-        logger.info(f"  - Device: {allocated_device.device_id}")
+        if preempted_jobs:
+            logger.info(f"  - Preempted and re-queued: {len(preempted_jobs)}")
+        logger.info(f"  - Devices: {slot_devices} ({slot_count} parallel slots)")
         logger.info(f"  - Total time: {total_time}s")
-        logger.info(f"  - Time saved: {(len(batch_jobs) - 1) * installation_time}s (avoided {len(batch_jobs) - 1} app installations)")
+        logger.info(f"  - Time saved: {installs_avoided * install_cost}s (avoided {installs_avoided} app installations)")
         if USE_REAL_EXECUTION:
             logger.info(f"  - Videos recorded: {video_count}")
         
-        # Return summary for the initiating job
         return {
-            "job_id": job_id,
-            "status": "completed" if job.status == "completed" else "failed",
+            "status": "completed" if failed_jobs == 0 else "failed",
             "device_id": allocated_device.device_id,
             "execution_mode": execution_mode,
             "batch_summary": {
                 "total_jobs": len(batch_jobs),
                 "successful_jobs": successful_jobs,
                 "failed_jobs": failed_jobs,
+                "preempted_jobs": [job.id for job in preempted_jobs],
                 "device_used": allocated_device.device_id,
-                "time_saved_seconds": (len(batch_jobs) - 1) * installation_time,
+                "devices_used": slot_devices,
+                "parallel_slots": slot_count,
+                "wall_time_seconds": round(wall_time, 2),
+                "installations": installations,
+                "warm_devices": warm_hits,
+                "time_saved_seconds": installs_avoided * install_cost,
                 "videos_recorded": video_count if USE_REAL_EXECUTION else 0,
                 "batch_results": batch_results
             }
         }
         
     except Exception as e:
-        error_msg = f"Error processing batch for job {job_id}: {str(e)}"
+        if isinstance(e, Retry):
+            raise
+
+        error_msg = f"Error processing batch {app_version_id}/{target}: {str(e)}"
         logger.error(error_msg)
         
-        # DEVICE CLEANUP: Release allocated device if it exists
-        if 'allocated_device' in locals() and allocated_device and db:
+        # DEVICE CLEANUP: Release allocated slots if any
+        if slots and db:
             device_manager = DeviceManager(db)
-            device_manager.release_device(allocated_device.id)
-            logger.info(f"🔄 Released device {allocated_device.device_id} due to batch error")
+            for device in slots:
+                device_manager.release_device(device.id)
+            logger.info(f"🔄 Released {len(slots)} device slots due to batch error")
+            _refill_slots()
         
-        # Mark all claimed jobs as failed
+        # Mark all claimed jobs that are still running as failed
         if batch_jobs and db:
-            for batch_job in batch_jobs:
-                if batch_job.status == "running":
-                    batch_job.status = "failed"
+            db.rollback()
+            failed_jobs = db.execute(
+                update(Job).where(Job.id.in_([batch_job.id for batch_job in batch_jobs if batch_job.status == "running"]),
+                                  Job.status == "running").values(status="failed")
+                .returning(Job.id, Job.status, Job.priority, Job.target, Job.app_version_id,
+                           Job.test_path, Job.assigned_device_name)
+                .execution_options(synchronize_session=False)
+            ).all()
             db.commit()
-            logger.info(f"❌ Marked {len(batch_jobs)} jobs as failed due to batch error")
+            events.publish_events(events.job_event(row, "running") for row in failed_jobs)
+            logger.info(f"❌ Marked {len(failed_jobs)} jobs as failed due to batch error")
+            _rollup_shards(db, parent_ids)
             
         return {
-            "job_id": job_id,
             "status": "failed",
             "error": error_msg,
             "execution_mode": execution_mode
@@ -269,7 +444,335 @@ def process_test_job(self, job_id: int) -> Dict[str, Any]:
     finally:
         if db:
             db.close()
-            logger.info(f"🔐 Closed database connection for job {job_id}")
+            logger.info(f"🔐 Closed database connection for batch {app_version_id}/{target}")
+
+async def _execute_batch(runner, batch_jobs: List[Job], slots: List[Device],
+                         execution_mode: str) -> Dict[str, Any]:
+    """
+    Fan the batch out over the allocated device slots with one worker per slot.
+
+    The loop is shared by every batch of the worker process, so nothing here
+    blocks it: `batch_jobs` and `slots` are detached rows the workers only
+    read and update in memory, and database writes (each with its own
+    session) and Redis calls run in threads via asyncio.to_thread. Each job's
+    status is committed as soon as its test finishes.
+
+    Workers give up their slot when a higher priority batch asks for it (see
+    services.preemption): the running test is cancelled, the job goes back to
+    the queue and the slot is released (and removed from `slots`) only after
+    the test has stopped. Jobs left unstarted when every worker is gone are
+    re-queued as well.
+
+    Returns:
+        {"results": per-job results, "preempted": re-queued jobs}
+    """
+    pending = asyncio.Queue()
+    for batch_job in batch_jobs:
+        pending.put_nowait(batch_job)
+    results = []
+    preempted = []
+
+    async def give_up_slot(device: Device, requester: Dict[str, Any]):
+        slots.remove(device)
+        await asyncio.to_thread(_give_up_slot, device, requester)
+
+    async def slot_worker(device: Device):
+        while True:
+            try:
+                batch_job = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            requester = await asyncio.to_thread(_take_preemption, device, batch_job.priority)
+            if requester:
+                pending.put_nowait(batch_job)  # Left to the other slots, or re-queued
+                await give_up_slot(device, requester)
+                return
+            if batch_job.device_id != device.id:
+                batch_job.device_id = device.id
+                batch_job.assigned_device_name = device.device_id
+                if not await asyncio.to_thread(_save_job, batch_job):
+                    continue  # Cancelled before it started
+            run = asyncio.ensure_future(_execute_job(runner, batch_job, execution_mode))
+            requester = await _run_preemptible(run, device, batch_job.priority)
+            if requester:
+                logger.info(f"⏹️ Stopped job {batch_job.id} on {device.device_id} (preempted)")
+                preempted.append(batch_job)
+                await give_up_slot(device, requester)
+                return
+            result, test_cases = run.result()
+            if not await asyncio.to_thread(_save_job, batch_job, test_cases, publish=True):
+                batch_job.status = "failed"
+                result = {"job_id": batch_job.id, "status": "failed", "error": "Cancelled while running",
+                          "execution_mode": execution_mode}
+            results.append(result)
+
+    await asyncio.gather(*(slot_worker(device) for device in list(slots)))
+    while not pending.empty():
+        preempted.append(pending.get_nowait())
+    if preempted:
+        await asyncio.to_thread(_requeue_jobs, preempted)
+    return {"results": results, "preempted": preempted}
+
+async def _run_preemptible(run: asyncio.Future, device: Device, priority: int) -> Optional[Dict[str, Any]]:
+    """
+    Wait for a job's test, polling for a preemption ask on its device that
+    may stop a job of `priority`.
+
+    Returns:
+        None once the test finished, or the requester if the test was
+        cancelled to give up the slot
+    """
+    while True:
+        done, _ = await asyncio.wait({run}, timeout=PREEMPT_POLL_INTERVAL)
+        if done:
+            return None
+        requester = await asyncio.to_thread(_take_preemption, device, priority)
+        if requester:
+            run.cancel()
+            try:
+                await run
+            except asyncio.CancelledError:
+                pass
+            return requester
+
+def _take_preemption(device: Device, priority: int) -> Optional[Dict[str, Any]]:
+    """preemption.take, treating an unreachable Redis as no ask."""
+    try:
+        return preemption.take(device.id, priority)
+    except Exception as e:
+        logger.warning(f"Could not check preemption requests for {device.device_id}: {str(e)}")
+        return None
+
+def _detach(db, instances: List[Any]):
+    """Load the rows' columns and detach them from the task's session, for the event loop."""
+    for instance in instances:
+        if inspect(instance).expired:
+            db.refresh(instance)
+    db.expunge_all()
+
+def _save_job(batch_job: Job, test_cases: Optional[List[Dict[str, Any]]] = None, publish: bool = False) -> bool:
+    """
+    Write a detached job's status and device, and its per-test results, in a session of its own.
+
+    Returns:
+        False (nothing written) if the job is no longer running, e.g. cancelled
+    """
+    db = SessionLocal()
+    try:
+        saved = db.execute(
+            update(Job).where(Job.id == batch_job.id, Job.status == "running")
+            .values(status=batch_job.status, device_id=batch_job.device_id,
+                    assigned_device_name=batch_job.assigned_device_name)
+            .returning(Job.id)
+            .execution_options(synchronize_session=False)
+        ).first() is not None
+        if saved and test_cases:
+            db.add_all(TestResult.from_case(batch_job.id, case) for case in test_cases)
+        db.commit()
+    finally:
+        db.close()
+    if not saved:
+        logger.info(f"Job {batch_job.id} was cancelled while running; dropped its {batch_job.status} status")
+    elif publish:
+        events.publish_event(events.job_event(batch_job, "running"))
+    return saved
+
+def _give_up_slot(device: Device, requester: Dict[str, Any]):
+    """Release a slot asked for by a higher priority batch and signal that batch."""
+    db = SessionLocal()
+    try:
+        DeviceManager(db).release_device(device.id)
+    finally:
+        db.close()
+    logger.info(f"⏏️ Gave up slot on {device.device_id} for priority {requester['priority']} "
+                f"batch {requester['app_version_id']}/{requester['target']}")
+    if requester.get("app_version_id"):
+        enqueue_batch_dispatch(requester["app_version_id"], requester["target"], requester["priority"],
+                               linger=False)
+
+def _requeue_jobs(jobs: List[Job]):
+    """
+    Put preempted or unstarted jobs back in the queue with their original priority.
+
+    Jobs no longer running (cancelled meanwhile) are left alone.
+    """
+    db = SessionLocal()
+    try:
+        requeued = set(db.execute(
+            update(Job).where(Job.id.in_([job.id for job in jobs]), Job.status == "running")
+            .values(status="queued", device_id=None, assigned_device_name=None)
+            .returning(Job.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all())
+        db.commit()
+    finally:
+        db.close()
+    jobs = [job for job in jobs if job.id in requeued]
+    if not jobs:
+        return
+    for job in jobs:
+        job.status = "queued"
+        job.device_id = None
+        job.assigned_device_name = None
+    events.publish_events(events.job_event(job, "running", preempted=True) for job in jobs)
+    logger.info(f"🔁 Re-queued {len(jobs)} preempted jobs: {[job.id for job in jobs]}")
+
+    if FAIR_SHARE_SCHEDULING:
+        ReadySet().enqueue(jobs)
+        _refill_slots()
+        return
+    for app_version_id, target, priority in sorted({(job.app_version_id, job.target, job.priority) for job in jobs}):
+        enqueue_batch_dispatch(app_version_id, target, priority, linger=False)
+
+async def _execute_job(runner, batch_job: Job,
+                       execution_mode: str) -> Tuple[Dict[str, Any], Optional[List[Dict[str, Any]]]]:
+    """
+    Run one job's test and set its final status (the caller saves it).
+
+    Returns:
+        The job's result and its per-test cases (None without a report)
+    """
+    try:
+        logger.info(f"🧪 Processing job {batch_job.id} on {batch_job.assigned_device_name}: {batch_job.test_path}")
+        
+        # Use app_version_id only for tracking, not for modifying buildPath
+        async with execution_slot():  # Worker-wide cap on concurrent tests
+            test_started = time.monotonic()
+            test_result = await runner.run_tests(batch_job.test_path, batch_job.app_version_id, job_id=batch_job.id,
+                                                 shard=batch_job.shard)
+            runtime = time.monotonic() - test_started
+        
+        # Per-test cases go to test_results, not into the task result
+        test_cases = test_result.pop("test_cases", None) or test_result.get("results", {}).pop("test_cases", None)
+        
+        if test_result["success"]:
+            batch_job.status = "completed"
+            await asyncio.to_thread(_record_runtime, batch_job, runtime)
+            
+            # Enhanced result for real execution
+            result_data = test_result["results"]
+            if USE_REAL_EXECUTION and result_data.get("video_info"):
+                video_info = result_data["video_info"]
+                if video_info.get("platform") == "browserstack":
+                    logger.info(f"📹 BrowserStack video recording enabled for job {batch_job.id}")
+                elif video_info.get("video_path"):
+                    logger.info(f"📹 Video recorded for job {batch_job.id}: {video_info['video_path']}")
+            
+            result = {
+                "job_id": batch_job.id,
+                "status": "completed",
+                "result": result_data,
+                "execution_mode": execution_mode
+            }
+        else:
+            batch_job.status = "failed"
+            result = {
+                "job_id": batch_job.id,
+                "status": "failed",
+                "error": test_result["error"],
+                "log_path": test_result.get("log_path"),
+                "execution_mode": execution_mode
+            }
+        
+        logger.info(f"{'✅' if batch_job.status == 'completed' else '❌'} Job {batch_job.id} completed with status: {batch_job.status}")
+        return result, test_cases
+        
+    except Exception as e:
+        error_msg = f"Error processing job {batch_job.id}: {str(e)}"
+        logger.error(error_msg)
+        batch_job.status = "failed"
+        return {
+            "job_id": batch_job.id,
+            "status": "failed",
+            "error": error_msg,
+            "execution_mode": execution_mode
+        }, None
+
+def _handle_no_device(task, db, batch_filter, app_version_id: str, target: str, priority: int,
+                      execution_mode: str) -> Dict[str, Any]:
+    """
+    Retry the dispatcher later when no device is free, with capped exponential backoff.
+
+    Busy devices only delay the batch, however long; its jobs are failed only
+    when no device of the target type is registered at all.
+    """
+    if db.query(Device.id).filter(Device.device_type == target).first() is None:
+        return _fail_queued_jobs(db, batch_filter, f"No {target} devices configured", execution_mode)
+
+    logger.warning(f"No available devices for target type {target}")
+    # Re-take the marker so submissions keep coalescing into this dispatcher;
+    # if another dispatcher is already pending it will pick the jobs up instead
+    countdown = min(DEVICE_RETRY_DELAY * 2 ** task.request.retries, DEVICE_RETRY_MAX_DELAY)
+    if acquire_batch_signal(app_version_id, target, get_queue_by_priority(priority),
+                            due_at=time.time() + countdown):
+        logger.info(f"⏳ Retrying batch {app_version_id}/{target} in {countdown}s")
+        raise task.retry(countdown=countdown, max_retries=None)
+    return {
+        "status": "queued",
+        "execution_mode": execution_mode,
+        "message": "Deferred to the pending dispatcher for this batch"
+    }
+
+def _fail_queued_jobs(db, batch_filter, error_msg: str, execution_mode: str) -> Dict[str, Any]:
+    """Fail a batch's queued jobs that can never run."""
+    failed = db.execute(
+        update(Job).where(batch_filter).values(status="failed")
+        .returning(Job.id, Job.status, Job.priority, Job.target, Job.app_version_id,
+                   Job.test_path, Job.assigned_device_name, Job.parent_job_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    events.publish_events(events.job_event(row, "queued") for row in failed)
+    logger.error(f"❌ Marked {len(failed)} queued jobs as failed: {error_msg}")
+    _rollup_shards(db, {row.parent_job_id for row in failed})
+    return {
+        "status": "failed",
+        "error": error_msg,
+        "execution_mode": execution_mode
+    }
+
+def _record_batch(target: str, jobs: int, installs: int, warm_hits: int):
+    """Add the batch to the batch and app cache totals (best effort)."""
+    try:
+        record_batch_stats(target, jobs, installs, warm_hits)
+    except Exception as e:
+        logger.warning(f"Could not record stats for a {target} batch: {str(e)}")
+
+def _longest_first(batch_jobs: List[Job], target: str) -> List[Job]:
+    """Order the batch by historical runtime, longest first (best effort: claim order otherwise)."""
+    try:
+        estimates = RuntimeModel().estimates((job.test_path, target) for job in batch_jobs)
+    except Exception as e:
+        logger.warning(f"Could not read runtimes for a {target} batch: {str(e)}")
+        return batch_jobs
+    return longest_first(batch_jobs, estimates)
+
+def _record_runtime(batch_job: Job, seconds: float):
+    """Add a completed test's duration to the runtime history (best effort)."""
+    try:
+        # A shard's runtime stands for the whole file's, so auto-sharding and ETAs stay per file
+        RuntimeModel().record(batch_job.test_path, batch_job.target, seconds * (batch_job.shard_count or 1))
+    except Exception as e:
+        logger.warning(f"Could not record the runtime of job {batch_job.id}: {str(e)}")
+
+def _rollup_shards(db, parent_ids):
+    """Finish the sharded jobs whose last shard is done (best effort)."""
+    if not parent_ids:
+        return
+    try:
+        sharding.rollup(db, parent_ids)
+    except Exception as e:
+        logger.warning(f"Could not roll up sharded jobs: {str(e)}")
+        db.rollback()
+
+@celery_app.task(name='backend.queue.tasks.reconcile_counters')
+def reconcile_counters() -> Dict[str, Any]:
+    """Recompute the Redis dashboard counters from the database and report drift."""
+    db = SessionLocal()
+    try:
+        return QueueCounters().reconcile(db)
+    finally:
+        db.close()
 
 def await_app_installation(target: str) -> int:
     """
@@ -0,0 +1,134 @@
+"""
+Long-lived event loop for the test coroutines of a Celery worker process.
+
+Celery tasks are synchronous. Rather than building and tearing down an event
+loop for every batch, each worker process starts one loop in a daemon thread
+the first time a task needs it and submits coroutines to it with
+run_coroutine(). Every batch the process runs (several at once with
+`--pool threads`) shares the loop, so one process can wait on many AppWright
+subprocesses at the same time. WORKER_TEST_CONCURRENCY caps how many tests
+run on the loop at once; execution_slot() hands those slots out.
+
+The loop is started lazily and tied to the process that started it, so a
+prefork child never inherits its parent's (stopped) loop thread.
+
+    WORKER_EVENT_LOOP=persistent    one loop per worker process (default)
+    WORKER_EVENT_LOOP=per_batch     asyncio.run() per batch, no process-wide cap
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+from typing import Any, Coroutine, Optional
+
+from celery.signals import worker_process_shutdown
+
+logger = logging.getLogger(__name__)
+
+WORKER_EVENT_LOOP = os.getenv('WORKER_EVENT_LOOP', 'persistent').lower()
+
+# Tests one worker process runs at once across all of its batches
+WORKER_TEST_CONCURRENCY = int(os.getenv('WORKER_TEST_CONCURRENCY', '16'))
+
+class WorkerLoop:
+    """An event loop running forever in a daemon thread, with a cap on concurrent tests."""
+
+    def __init__(self, concurrency: int = WORKER_TEST_CONCURRENCY):
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._slots = None
+
+    def _ensure_running(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return self._loop
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=run, name='qualcli-worker-loop', daemon=True)
+            thread.start()
+            started.wait()
+            self._loop, self._thread, self._pid = loop, thread, os.getpid()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            logger.info(f"🔁 Started worker event loop (pid {self._pid}, {self.concurrency} concurrent tests)")
+            return loop
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the loop and block the calling thread until it finishes.
+
+        Raises:
+            Whatever the coroutine raises; concurrent.futures.TimeoutError
+            after `timeout` seconds (the coroutine is cancelled)
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_running())
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def owns_running_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def execution_slot(self):
+        """Async context manager holding one of the loop's concurrent test slots."""
+        return self._slots
+
+    def shutdown(self, timeout: float = 10):
+        """Cancel what is still running on the loop and stop its thread."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None or self._pid != os.getpid():
+                return
+            self._loop = self._thread = self._slots = None
+
+        async def cancel_all():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_all(), loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"Worker event loop did not cancel its tasks cleanly: {str(e)}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
+
+_worker_loop = WorkerLoop()
+
+def run_coroutine(coro: Coroutine) -> Any:
+    """Run a coroutine to completion from synchronous task code."""
+    if WORKER_EVENT_LOOP == 'per_batch':
+        return asyncio.run(coro)
+    return _worker_loop.run(coro)
+
+def execution_slot():
+    """
+    Async context manager bounding concurrent tests in this worker process.
+
+    Only the persistent loop has a process-wide cap; on a per-batch loop the
+    batch's device slots are the only bound.
+    """
+    if _worker_loop.owns_running_loop():
+        return _worker_loop.execution_slot()
+    return contextlib.nullcontext()
+
+@worker_process_shutdown.connect
+def _stop_worker_loop(**kwargs):
+    _worker_loop.shutdown()
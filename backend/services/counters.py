@@ -0,0 +1,259 @@
+"""
+Queue and device counters kept in Redis.
+
+Dashboards (/queues/status, /devices/status) used to recount jobs in the
+database on every call. Instead, every state-change event carries enough to
+update a set of counters, and events.publish_events applies those updates in
+the same MULTI/EXEC as the PUBLISH, so readers get the numbers with a couple
+of HGETALLs:
+
+    {prefix}:jobs            "{priority}:{status}:{target}" -> active jobs
+    {prefix}:device_jobs     device_id -> jobs running on the device
+    {prefix}:device_status   device_id -> available / busy / offline
+    {prefix}:device_type     device_id -> emulator / device / browserstack
+    {prefix}:device_max      device_id -> max_concurrent_jobs
+
+Job counters only cover active statuses (queued, running), matching what the
+dashboards show, and move by increments so out-of-order events still add up.
+
+Publishing is best effort, so a Redis hiccup (or a write that bypassed the
+event path, like a seed script) can leave the counters off. reconcile()
+recomputes them from the database, reports the drift and replaces them; it
+runs on API startup and periodically from Celery beat
+(COUNTERS_RECONCILE_INTERVAL). Until the first reconciliation the counters
+are not trusted and readers fall back to the database.
+"""
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..models.device import Device
+from ..models.job import Job, ACTIVE_STATUSES
+from ..queue.batching import get_redis
+
+logger = logging.getLogger(__name__)
+
+COUNTERS_PREFIX = os.getenv('COUNTERS_PREFIX', 'qualcli:counters')
+
+PRIORITY_LEVELS = range(1, 6)
+
+JobKey = Tuple[int, str, str]
+
+class QueueCounters:
+    """Reads, updates and reconciles the Redis counters."""
+
+    def __init__(self, client: Optional[redis.Redis] = None, prefix: str = COUNTERS_PREFIX):
+        self.client = client or get_redis()
+        self.jobs_key = f"{prefix}:jobs"
+        self.device_keys = {
+            field: f"{prefix}:device_{field}" for field in ('jobs', 'status', 'type', 'max')
+        }
+        self.reconciled_key = f"{prefix}:reconciled_at"
+
+    # -- updates ----------------------------------------------------------
+
+    def record(self, pipe, event: Dict[str, Any]):
+        """Queue the counter updates an event implies on a pipeline."""
+        event_type = event.get("type", "")
+        try:
+            if event_type.startswith("job."):
+                self._record_job(pipe, event)
+            elif event_type.startswith("device."):
+                self._record_device(pipe, event_type.split(".", 1)[1], event)
+        except KeyError as e:
+            logger.warning(f"Event {event_type} has no {e} field; counters not updated")
+
+    def _record_job(self, pipe, event: Dict[str, Any]):
+        previous, status = event.get("previous_status"), event.get("status")
+        if previous == status:
+            return
+        if previous in ACTIVE_STATUSES:
+            pipe.hincrby(self.jobs_key, _job_field(event["priority"], previous, event["target"]), -1)
+        if status in ACTIVE_STATUSES:
+            pipe.hincrby(self.jobs_key, _job_field(event["priority"], status, event["target"]), 1)
+
+    def _record_device(self, pipe, action: str, event: Dict[str, Any]):
+        device_id = event["device_id"]
+        if action == "removed":
+            for key in self.device_keys.values():
+                pipe.hdel(key, device_id)
+            return
+
+        pipe.hset(self.device_keys['status'], device_id, event["status"])
+        pipe.hset(self.device_keys['type'], device_id, event["device_type"])
+        pipe.hset(self.device_keys['max'], device_id, event["max_concurrent_jobs"])
+        if action == "registered":
+            pipe.hset(self.device_keys['jobs'], device_id, event["current_jobs"])
+        elif event.get("jobs_delta"):
+            pipe.hincrby(self.device_keys['jobs'], device_id, event["jobs_delta"])
+
+    # -- reads ------------------------------------------------------------
+
+    def job_counts(self) -> Optional[Dict[JobKey, int]]:
+        """
+        Active job counts by (priority, status, target).
+
+        Returns None until the counters have been reconciled at least once.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        pipe.exists(self.reconciled_key)
+        pipe.hgetall(self.jobs_key)
+        reconciled, raw = pipe.execute()
+        if not reconciled:
+            return None
+        return {_parse_job_field(field): int(count) for field, count in raw.items() if int(count)}
+
+    def active_job_counts(self) -> Optional[Dict[int, Dict[str, int]]]:
+        """Counts in the shape of queue_stats.count_active_jobs, or None if not reconciled."""
+        counts = self.job_counts()
+        if counts is None:
+            return None
+        return _by_priority(counts)
+
+    def snapshot(self) -> Optional[Tuple[List[Dict[str, Any]], Dict[JobKey, int]]]:
+        """
+        Devices and active job counts, read in one round trip.
+
+        Returns:
+            (devices, job_counts), devices being dicts with device_id, type,
+            status, current_jobs and max_jobs sorted by device_id; None if
+            the counters have not been reconciled yet
+        """
+        pipe = self.client.pipeline(transaction=False)
+        pipe.exists(self.reconciled_key)
+        pipe.hgetall(self.jobs_key)
+        for key in self.device_keys.values():
+            pipe.hgetall(key)
+        reconciled, raw_jobs, jobs, statuses, types, maxes = pipe.execute()
+        if not reconciled:
+            return None
+
+        devices = [
+            {
+                'device_id': device_id.decode(),
+                'type': types.get(device_id, b'').decode(),
+                'status': status.decode(),
+                'current_jobs': int(jobs.get(device_id, 0)),
+                'max_jobs': int(maxes.get(device_id, 1)),
+            }
+            for device_id, status in sorted(statuses.items())
+        ]
+        job_counts = {_parse_job_field(field): int(count) for field, count in raw_jobs.items() if int(count)}
+        return devices, job_counts
+
+    # -- reconciliation ---------------------------------------------------
+
+    def reconcile(self, db: Session, attempts: int = 3) -> Dict[str, Any]:
+        """
+        Recompute the counters from the database and replace the Redis copy.
+
+        The replacement is a WATCHed transaction: if an event updates the
+        counters while the database is being read, the write is abandoned and
+        retried so that update is not overwritten with an older count.
+
+        Returns:
+            Drift report: {"jobs": {field: {"counter": n, "actual": n}},
+            "devices": {...}, "drifted": number of drifted counters}, with
+            "skipped": True if the counters never held still long enough
+        """
+        for attempt in range(attempts):
+            with self.client.pipeline() as pipe:
+                keys = [self.jobs_key, *self.device_keys.values()]
+                pipe.watch(*keys)
+                before = {key: pipe.hgetall(key) for key in keys}
+
+                actual = self._actual_counters(db)
+                drift = {
+                    "jobs": _diff(before[self.jobs_key], actual[self.jobs_key]),
+                    "devices": {},
+                }
+                for field, key in self.device_keys.items():
+                    for device_id, values in _diff(before[key], actual[key]).items():
+                        drift["devices"].setdefault(device_id, {})[field] = values
+
+                pipe.multi()
+                for key in keys:
+                    pipe.delete(key)
+                    if actual[key]:
+                        pipe.hset(key, mapping=actual[key])
+                pipe.set(self.reconciled_key, time.time())
+                try:
+                    pipe.execute()
+                except redis.WatchError:
+                    logger.info(f"Counters changed during reconciliation, retrying ({attempt + 1}/{attempts})")
+                    continue
+
+            drift["drifted"] = len(drift["jobs"]) + sum(len(fields) for fields in drift["devices"].values())
+            if drift["drifted"]:
+                logger.warning(f"⚖️ Reconciled {drift['drifted']} drifted counters: {drift}")
+            else:
+                logger.info("⚖️ Counters match the database")
+            return drift
+
+        logger.warning(f"⚖️ Counters kept changing during reconciliation; skipped after {attempts} attempts")
+        return {"jobs": {}, "devices": {}, "drifted": 0, "skipped": True}
+
+    def _actual_counters(self, db: Session) -> Dict[str, Dict[str, Any]]:
+        """Every counter hash as the database says it should be."""
+        rows = db.execute(
+            select(Job.priority, Job.status, Job.target, func.count(Job.id))
+            .where(Job.status.in_(ACTIVE_STATUSES))
+            .group_by(Job.priority, Job.status, Job.target)
+        ).all()
+        devices = db.execute(
+            select(Device.device_id, Device.device_type, Device.status,
+                   Device.current_jobs, Device.max_concurrent_jobs)
+        ).all()
+        db.rollback()  # End the read transaction so a retry sees fresh rows
+        return {
+            self.jobs_key: {_job_field(priority, status, target): count for priority, status, target, count in rows},
+            self.device_keys['jobs']: {d.device_id: d.current_jobs or 0 for d in devices},
+            self.device_keys['status']: {d.device_id: d.status for d in devices},
+            self.device_keys['type']: {d.device_id: d.device_type for d in devices},
+            self.device_keys['max']: {d.device_id: d.max_concurrent_jobs or 0 for d in devices},
+        }
+
+def priority_allocation(job_counts: Dict[JobKey, int]) -> Dict[str, Any]:
+    """Counters in the shape of DeviceManager._get_priority_allocation_stats."""
+    stats = {}
+    for priority, counts in _by_priority(job_counts).items():
+        stats[f"priority_{priority}"] = {
+            'running_jobs': counts['running'],
+            'queued_jobs': counts['queued'],
+            'devices_by_type': {
+                target: count for (p, status, target), count in sorted(job_counts.items())
+                if p == priority and status == 'running' and count
+            }
+        }
+    return stats
+
+def _by_priority(job_counts: Dict[JobKey, int]) -> Dict[int, Dict[str, int]]:
+    counts = {priority: {status: 0 for status in ACTIVE_STATUSES} for priority in PRIORITY_LEVELS}
+    for (priority, status, _), count in job_counts.items():
+        counts.setdefault(priority, {s: 0 for s in ACTIVE_STATUSES})[status] += count
+    return counts
+
+def _job_field(priority: int, status: str, target: str) -> str:
+    return f"{priority}:{status}:{target}"
+
+def _parse_job_field(field: bytes) -> JobKey:
+    priority, status, target = field.decode().split(":", 2)
+    return int(priority), status, target
+
+def _diff(counter: Dict[bytes, bytes], actual: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Fields whose Redis value differs from the database value."""
+    current = {field.decode(): value.decode() for field, value in counter.items()}
+    drift = {}
+    for field in set(current) | set(actual):
+        expected = str(actual[field]) if field in actual else None
+        value = current.get(field)
+        # A zero counter left behind by decrements is the same as a missing one
+        if value == expected or (expected is None and value == "0"):
+            continue
+        drift[field] = {"counter": value, "actual": expected}
+    return drift
@@ -1,8 +1,15 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func, desc
+from sqlalchemy import and_, func, desc, select, update, case
+from datetime import datetime
 from ..models.device import Device
-from ..models.job import Job
+from ..models.job import ACTIVE_STATUSES, Job
+from . import events, preemption
+from .counters import priority_allocation
+from ..queue.batching import app_cache_stats
+from .runtime_stats import RuntimeModel, estimate_start, shard_estimate
+import asyncio
 import logging
 import json
 
@@ -17,47 +24,55 @@ class DeviceManager:
     def __init__(self, db: Session):
         self.db = db
     
-    def allocate_device(self, target_type: str, priority: int = 1) -> Optional[Device]:
+    def allocate_device(self, target_type: str, priority: int = 1, allow_preemption: bool = True,
+                        app_version_id: Optional[str] = None) -> Optional[Device]:
         """
         Allocate an available device for the given target type with priority consideration.
         
         Args:
             target_type: Type of device needed (emulator, device, browserstack)
             priority: Job priority (1-5, higher priority gets better allocation)
+            allow_preemption: Whether a high priority job may preempt lower priority work
+                when nothing is free (disabled for opportunistic extra batch slots)
+            app_version_id: App version the device will run; devices that already
+                have it installed are preferred
             
         Returns:
             Device object if allocation successful, None if no devices available
+            (a high priority caller may have asked a running batch to give up a
+            slot; its batch is signalled once the slot is free)
         """
         try:
-            # Find available devices of the requested type
-            available_devices = self.db.query(Device).filter(
-                and_(
-                    Device.device_type == target_type,
-                    Device.status == "available",
-                    Device.current_jobs < Device.max_concurrent_jobs
-                )
-            ).all()
+            # Claim one slot with a single UPDATE ... RETURNING. The candidate row is
+            # locked with FOR UPDATE SKIP LOCKED so concurrent allocators move on to
+            # other devices instead of queueing behind it, and the capacity guard is
+            # re-checked on the locked row so a device can never be over-allocated.
+            selected_device = self.db.execute(
+                self._allocation_statement(target_type, priority, app_version_id)
+            ).scalars().first()
+            if selected_device is None:
+                # SKIP LOCKED finds nothing while other allocators hold every candidate,
+                # even if one still has a free slot: wait for their locks once
+                selected_device = self.db.execute(
+                    self._allocation_statement(target_type, priority, app_version_id, skip_locked=False)
+                ).scalars().first()
+            self.db.commit()
             
-            if not available_devices:
+            if not selected_device:
                 # For high priority jobs, check if we can preempt lower priority jobs
-                if priority >= 4:
+                if priority >= 4 and allow_preemption:
                     logger.info(f"No available devices for priority {priority} job, checking for preemption opportunities")
-                    preempted_device = self._try_preempt_device(target_type, priority)
-                    if preempted_device:
-                        return preempted_device
+                    if self._request_preemption(target_type, priority, app_version_id):
+                        return None  # Signalled once the preempted work has stopped
                 
                 logger.warning(f"No available devices of type {target_type} for priority {priority}")
                 return None
             
-            # Select best device based on priority and allocation strategy
-            selected_device = self._select_optimal_device(available_devices, priority)
-            
-            # Allocate the device
-            selected_device.allocate_job()
-            self.db.commit()
-            
             logger.info(f"Allocated device {selected_device.device_id} for {target_type} job "
                        f"(priority: {priority}, utilization: {selected_device.utilization_percent}%)")
+            events.publish_event(events.device_event(selected_device, "allocated", jobs_delta=1))
+            if priority >= 4 and allow_preemption:
+                self._withdraw_preemption(app_version_id, target_type)
             return selected_device
             
         except Exception as e:
@@ -65,6 +80,76 @@ class DeviceManager:
             self.db.rollback()
             return None
     
+    def _allocation_statement(self, target_type: str, priority: int, app_version_id: Optional[str] = None,
+                              skip_locked: bool = True):
+        """
+        Build the atomic slot-claiming UPDATE for a target type.
+        
+        The candidate subquery applies the same strategy as _select_optimal_device
+        in SQL: least loaded device for normal and high priority, most loaded (but
+        still available) device for low priority. Devices that already have
+        app_version_id installed come first regardless of load. With
+        skip_locked=False the candidate lock waits for concurrent allocators.
+        """
+        if priority >= 2:
+            load_order = Device.current_jobs.asc()
+        else:
+            load_order = Device.current_jobs.desc()
+        order = [load_order, Device.id]
+        if app_version_id:
+            warm = Device.installed_app_versions.contains(json.dumps(app_version_id), autoescape=True)
+            order.insert(0, case((warm, 0), else_=1))
+        
+        has_capacity = Device.current_jobs < Device.max_concurrent_jobs
+        candidate = (
+            select(Device.id)
+            .where(
+                and_(
+                    Device.device_type == target_type,
+                    Device.status == "available",
+                    has_capacity
+                )
+            )
+            .order_by(*order)
+            .limit(1)
+            .with_for_update(skip_locked=skip_locked)
+            .scalar_subquery()
+        )
+        
+        return (
+            update(Device)
+            .where(and_(Device.id == candidate, Device.status == "available", has_capacity))
+            .values(
+                current_jobs=Device.current_jobs + 1,
+                status=case(
+                    (Device.current_jobs + 1 >= Device.max_concurrent_jobs, "busy"),
+                    else_=Device.status
+                ),
+                updated_at=datetime.utcnow()
+            )
+            .returning(Device)
+        )
+    
+    def spare_slots(self, target_type: str, app_version_id: str) -> int:
+        """
+        Free slots of a target type a batch may take beyond its first one.
+
+        One free slot is left for every other app version with queued jobs on
+        the target, so extra batch slots never starve a waiting batch.
+        """
+        free_slots = self.db.query(
+            func.coalesce(func.sum(Device.max_concurrent_jobs - Device.current_jobs), 0)
+        ).filter(
+            Device.device_type == target_type,
+            Device.status == "available"
+        ).scalar()
+        waiting_batches = self.db.query(func.count(func.distinct(Job.app_version_id))).filter(
+            Job.target == target_type,
+            Job.status == "queued",
+            Job.app_version_id != app_version_id
+        ).scalar()
+        return max(0, free_slots - waiting_batches)
+
     def _select_optimal_device(self, available_devices: List[Device], priority: int) -> Device:
         """
         Select the optimal device based on priority and allocation strategy.
@@ -86,63 +171,103 @@ class DeviceManager:
             # Use most loaded device (but still available) to preserve capacity
             return max(available_devices, key=lambda d: d.current_jobs)
     
-    def _try_preempt_device(self, target_type: str, priority: int) -> Optional[Device]:
+    def _request_preemption(self, target_type: str, priority: int, app_version_id: Optional[str] = None) -> bool:
         """
-        Try to preempt a device running lower priority jobs for a high priority job.
+        Ask a device running lower priority jobs to give up a slot for a high priority batch.
+        
+        Preemption is cooperative (see services.preemption): the running batch
+        stops one of its tests, re-queues the job and releases the slot itself,
+        then signals the requesting batch. Nothing is taken away here, so the
+        device is never oversubscribed.
         
         Args:
             target_type: Type of device needed
             priority: Priority of the requesting job (must be >= 4 for preemption)
+            app_version_id: App version of the requesting batch, signalled once the slot is free
             
         Returns:
-            Device if preemption successful, None otherwise
+            True if a running batch was asked to give up a slot
         """
         if priority < 4:
-            return None
+            return False
             
         try:
-            # Find busy devices with lower priority jobs
-            busy_devices = self.db.query(Device).filter(
-                and_(
-                    Device.device_type == target_type,
-                    Device.status == "busy"
-                )
-            ).all()
-            
-            for device in busy_devices:
-                # Check if this device has lower priority jobs we can preempt
-                low_priority_jobs = self.db.query(Job).filter(
-                    and_(
-                        Job.device_id == device.id,
-                        Job.status == "running",
-                        Job.priority < priority - 1  # Only preempt if significantly lower priority
-                    )
-                ).all()
-                
-                if low_priority_jobs:
-                    logger.info(f"Preempting {len(low_priority_jobs)} lower priority jobs on device {device.device_id}")
-                    
-                    # Mark preempted jobs as queued again (they'll be rescheduled)
-                    for job in low_priority_jobs:
-                        job.status = "queued"
-                        job.device_id = None
-                        job.assigned_device_name = None
-                    
-                    # Make device available for the high priority job
-                    device.current_jobs = device.current_jobs - len(low_priority_jobs)
-                    if device.current_jobs == 0:
-                        device.status = "available"
-                    
-                    self.db.commit()
-                    logger.info(f"Successfully preempted device {device.device_id} for high priority job")
-                    return device
+            victim = select_preemption_victim(self._preemption_candidates(target_type, priority))
+            self.db.rollback()  # End the read transaction
+            if victim is None:
+                return False
             
-            return None
+            if preemption.request(victim.id, app_version_id, target_type, priority):
+                logger.info(f"Asked the batch on device {victim.device_id} to give up a slot "
+                            f"for priority {priority} batch {app_version_id}/{target_type} "
+                            f"({victim.evictable_jobs} preemptible jobs, lowest priority {victim.min_priority})")
+            else:
+                logger.info(f"Batch {app_version_id}/{target_type} is already waiting for a preempted slot")
+            return True
             
         except Exception as e:
             logger.error(f"Error during device preemption: {str(e)}")
             self.db.rollback()
-            return None
+            return False
+    
+    def _preemption_candidates(self, target_type: str, priority: int) -> List[Any]:
+        """
+        Busy devices of a target type running work a job of `priority` may preempt.
+        
+        One grouped join over running jobs (served by ix_jobs_device_status_priority)
+        instead of a job query per busy device.
+        
+        Returns:
+            Rows with id, device_id, running_jobs, evictable_jobs (running jobs
+            below priority - 1), min_priority and last_started (most recent
+            claim of a running job)
+        """
+        evictable = Job.priority < priority - 1
+        return self.db.execute(
+            select(
+                Device.id,
+                Device.device_id,
+                func.count(Job.id).label('running_jobs'),
+                func.sum(case((evictable, 1), else_=0)).label('evictable_jobs'),
+                func.min(Job.priority).label('min_priority'),
+                func.max(Job.updated_at).label('last_started'),
+            )
+            .join(Job, and_(Job.device_id == Device.id, Job.status == "running"))
+            .where(and_(Device.device_type == target_type, Device.status == "busy"))
+            .group_by(Device.id, Device.device_id)
+            .having(func.min(Job.priority) < priority - 1)
+        ).all()
+    
+    def _withdraw_preemption(self, app_version_id: Optional[str], target_type: str):
+        """Drop an outstanding preemption ask once the batch found a device (best effort)."""
+        try:
+            preemption.withdraw(app_version_id, target_type)
+        except Exception as e:
+            logger.warning(f"Could not withdraw preemption request for {app_version_id}/{target_type}: {str(e)}")
+    
+    def use_app_version(self, device_ids: List[int], app_version_id: str) -> List[str]:
+        """
+        Record that a batch of app_version_id runs on these devices.
+        
+        Updates each device's installed versions (most recently used first,
+        evicting past app_storage_slots).
+        
+        Args:
+            device_ids: IDs of the devices the batch uses
+            app_version_id: App version of the batch
+            
+        Returns:
+            device_id names of the devices that need the app installed
+        """
+        try:
+            devices = self.db.query(Device).filter(Device.id.in_(device_ids)).order_by(Device.id).with_for_update().all()
+            cold = [device.device_id for device in devices if not device.use_app_version(app_version_id)]
+            self.db.commit()
+            return cold
+        except Exception as e:
+            logger.error(f"Error recording app version {app_version_id} on devices {device_ids}: {str(e)}")
+            self.db.rollback()
+            return [device.device_id for device in self.db.query(Device).filter(Device.id.in_(device_ids))]
     
     def release_device(self, device_id: int):
         """
@@ -152,13 +277,31 @@ class DeviceManager:
             device_id: ID of the device to release
         """
         try:
-            device = self.db.query(Device).filter(Device.id == device_id).first()
+            # One atomic decrement, like allocation's increment, so a concurrent
+            # allocation is never overwritten by a stale current_jobs
+            device = self.db.execute(
+                update(Device)
+                .where(and_(Device.id == device_id, Device.current_jobs > 0))
+                .values(
+                    current_jobs=Device.current_jobs - 1,
+                    status=case(
+                        (and_(Device.status == "busy", Device.current_jobs - 1 < Device.max_concurrent_jobs),
+                         "available"),
+                        else_=Device.status
+                    ),
+                    updated_at=datetime.utcnow()
+                )
+                .returning(Device.device_id, Device.device_type, Device.status, Device.current_jobs,
+                           Device.max_concurrent_jobs)
+                .execution_options(synchronize_session=False)
+            ).first()
+            self.db.commit()
             if device:
-                device.release_job()
-                self.db.commit()
-                logger.info(f"Released device {device.device_id} (utilization: {device.utilization_percent}%)")
+                utilization = device.current_jobs / device.max_concurrent_jobs * 100 if device.max_concurrent_jobs else 0
+                logger.info(f"Released device {device.device_id} (utilization: {utilization}%)")
+                events.publish_event(events.device_event(device, "released", jobs_delta=-1))
             else:
-                logger.warning(f"Device {device_id} not found for release")
+                logger.warning(f"Device {device_id} not found for release, or had no jobs")
         except Exception as e:
             logger.error(f"Error releasing device {device_id}: {str(e)}")
             self.db.rollback()
@@ -171,185 +314,162 @@ class DeviceManager:
             Dictionary with device status information
         """
         try:
-            devices = self.db.query(Device).all()
-            
-            status_summary = {
-                'total_devices': len(devices),
-                'available_devices': 0,
-                'busy_devices': 0,
-                'offline_devices': 0,
-                'by_type': {},
-                'priority_allocation': self._get_priority_allocation_stats(),
-                'devices': []
-            }
-            
-            # Group by device type
-            for device in devices:
-                if device.device_type not in status_summary['by_type']:
-                    status_summary['by_type'][device.device_type] = {
-                        'total': 0,
-                        'available': 0,
-                        'busy': 0,
-                        'offline': 0,
-                        'avg_utilization': 0
-                    }
-                
-                type_stats = status_summary['by_type'][device.device_type]
-                type_stats['total'] += 1
-                
-                if device.status == 'available':
-                    status_summary['available_devices'] += 1
-                    type_stats['available'] += 1
-                elif device.status == 'busy':
-                    status_summary['busy_devices'] += 1
-                    type_stats['busy'] += 1
-                else:
-                    status_summary['offline_devices'] += 1
-                    type_stats['offline'] += 1
-                
-                # Add device details
-                status_summary['devices'].append({
-                    'device_id': device.device_id,
-                    'type': device.device_type,
-                    'status': device.status,
-                    'current_jobs': device.current_jobs,
-                    'max_jobs': device.max_concurrent_jobs,
-                    'utilization_percent': device.utilization_percent,
-                    'is_available': device.is_available
-                })
-            
-            # Calculate average utilization by type
-            for device_type, stats in status_summary['by_type'].items():
-                if stats['total'] > 0:
-                    total_utilization = sum(
-                        d['utilization_percent'] for d in status_summary['devices'] 
-                        if d['type'] == device_type
-                    )
-                    stats['avg_utilization'] = total_utilization / stats['total']
-            
-            return status_summary
+            devices, priority_stats = self._device_status_rows()
+            return summarize_device_status(devices, priority_stats, read_app_cache_stats())
             
         except Exception as e:
             logger.error(f"Error getting device status: {str(e)}")
             return {'error': str(e)}
     
+    def _device_status_rows(self) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """The database half of get_device_status: device rows and priority allocation stats."""
+        devices = [
+            {
+                'device_id': device.device_id,
+                'type': device.device_type,
+                'status': device.status,
+                'current_jobs': device.current_jobs,
+                'max_jobs': device.max_concurrent_jobs
+            }
+            for device in self.db.query(Device).all()
+        ]
+        return devices, self._get_priority_allocation_stats()
+    
     def _get_priority_allocation_stats(self) -> Dict[str, Any]:
-        """Get statistics about priority-based device allocation."""
+        """Get statistics about priority-based device allocation (one grouped count)."""
         try:
-            priority_stats = {}
-            
-            for priority in range(1, 6):
-                running_jobs = self.db.query(Job).filter(
-                    and_(Job.priority == priority, Job.status == "running")
-                ).count()
-                
-                queued_jobs = self.db.query(Job).filter(
-                    and_(Job.priority == priority, Job.status == "queued")
-                ).count()
-                
-                # Get device types being used by this priority
-                devices_in_use = self.db.query(Device.device_type, func.count(Job.id)).join(
-                    Job, Device.id == Job.device_id
-                ).filter(
-                    and_(Job.priority == priority, Job.status == "running")
-                ).group_by(Device.device_type).all()
-                
-                priority_stats[f"priority_{priority}"] = {
-                    'running_jobs': running_jobs,
-                    'queued_jobs': queued_jobs,
-                    'devices_by_type': dict(devices_in_use)
-                }
-            
-            return priority_stats
+            rows = self.db.execute(
+                select(Job.priority, Job.status, Job.target, func.count(Job.id))
+                .where(Job.status.in_(ACTIVE_STATUSES))
+                .group_by(Job.priority, Job.status, Job.target)
+            ).all()
+            return priority_allocation({(priority, status, target): count
+                                        for priority, status, target, count in rows})
             
         except Exception as e:
             logger.error(f"Error getting priority allocation stats: {str(e)}")
             return {}
     
-    def get_device_recommendations(self, target_type: str, priority: int = 1) -> Dict[str, Any]:
+    def get_device_recommendations(self, target_type: str, priority: int = 1,
+                                   test_path: Optional[str] = None) -> Dict[str, Any]:
         """
         Get recommendations for device allocation based on current load and priority.
         
         Args:
             target_type: Type of device needed
             priority: Job priority level
+            test_path: Test to be run, for its own historical runtime
             
         Returns:
             Dictionary with recommendations and estimated wait times
         """
         try:
-            devices = self.db.query(Device).filter(Device.device_type == target_type).all()
+            recommendation = self._recommendation(target_type, priority)
+            if recommendation is None:
+                recommendation = queue_and_wait(target_type, priority,
+                                                self.estimate_wait(target_type, priority, test_path=test_path))
+            return recommendation
             
-            if not devices:
-                return {
-                    'recommendation': 'no_devices_available',
-                    'message': f'No {target_type} devices configured',
-                    'estimated_wait_time': None
-                }
-            
-            available_devices = [d for d in devices if d.is_available]
-            
-            if available_devices:
-                best_device = self._select_optimal_device(available_devices, priority)
-                return {
-                    'recommendation': 'immediate_allocation',
-                    'device_id': best_device.device_id,
-                    'current_utilization': best_device.utilization_percent,
-                    'estimated_wait_time': 0,
-                    'priority_advantage': priority >= 4
-                }
-            
-            # Check preemption possibilities for high priority jobs
-            if priority >= 4:
-                preemption_possible = any(
-                    self.db.query(Job).filter(
-                        and_(
-                            Job.device_id == device.id,
-                            Job.status == "running", 
-                            Job.priority < priority - 1
-                        )
-                    ).count() > 0
-                    for device in devices if device.status == "busy"
-                )
-                
-                if preemption_possible:
-                    return {
-                        'recommendation': 'preemption_available',
-                        'message': f'High priority job can preempt lower priority jobs',
-                        'estimated_wait_time': 5,  # Time to preempt
-                        'priority_advantage': True
-                    }
+        except Exception as e:
+            logger.error(f"Error getting device recommendations: {str(e)}")
+            return {'error': str(e)}
+    
+    def _recommendation(self, target_type: str, priority: int) -> Optional[Dict[str, Any]]:
+        """
+        The database half of get_device_recommendations.
+        
+        Returns:
+            The recommendation, or None when every device is busy (the caller
+            adds the wait estimate with queue_and_wait)
+        """
+        devices = self.db.query(Device).filter(Device.device_type == target_type).all()
+        
+        if not devices:
+            return {
+                'recommendation': 'no_devices_available',
+                'message': f'No {target_type} devices configured',
+                'estimated_wait_time': None
+            }
+        
+        available_devices = [d for d in devices if d.is_available]
+        
+        if available_devices:
+            best_device = self._select_optimal_device(available_devices, priority)
+            return {
+                'recommendation': 'immediate_allocation',
+                'device_id': best_device.device_id,
+                'current_utilization': best_device.utilization_percent,
+                'estimated_wait_time': 0,
+                'priority_advantage': priority >= 4
+            }
+        
+        # Check preemption possibilities for high priority jobs
+        if priority >= 4:
+            victim = select_preemption_victim(self._preemption_candidates(target_type, priority))
             
-            # Calculate estimated wait time based on running jobs
-            busy_devices = [d for d in devices if d.status == "busy"]
-            if busy_devices:
-                # Estimate based on priority of waiting jobs
-                avg_job_time = 30  # Assume 30 seconds average job time
-                min_wait = min(d.current_jobs for d in busy_devices) * avg_job_time
-                
-                # Adjust based on priority
-                if priority >= 4:
-                    min_wait = min_wait * 0.5  # High priority gets priority in queue
-                elif priority == 1:
-                    min_wait = min_wait * 1.5  # Low priority waits longer
-                
+            if victim is not None:
                 return {
-                    'recommendation': 'queue_and_wait',
-                    'message': f'All {target_type} devices busy',
-                    'estimated_wait_time': int(min_wait),
-                    'priority_advantage': priority >= 4
+                    'recommendation': 'preemption_available',
+                    'message': 'High priority job can preempt lower priority jobs',
+                    'device_id': victim.device_id,
+                    'estimated_wait_time': 5,  # Time to preempt
+                    'priority_advantage': True
                 }
+        
+        # Busy devices: the wait is estimated from the historical runtimes of running and queued jobs
+        if any(d.status == "busy" for d in devices):
+            return None
+        
+        return {
+            'recommendation': 'devices_offline',
+            'message': f'All {target_type} devices offline',
+            'estimated_wait_time': None,
+            'priority_advantage': False
+        }
+    
+    def estimate_wait(self, target_type: str, priority: int = 1, test_path: Optional[str] = None,
+                      before_job_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Estimate when a job of this priority would start, from historical runtimes.
+        
+        Running jobs on the target free their slot after their estimated runtime
+        less the time since they started; queued jobs of higher priority (and of
+        the same priority submitted earlier) take the slots first. See
+        runtime_stats.estimate_start().
+        
+        Args:
+            target_type: Type of device needed
+            priority: Job priority level
+            test_path: Test to be run, for run_seconds
+            before_job_id: The job being estimated, if already queued (only
+                earlier jobs of its priority count as ahead of it)
             
-            return {
-                'recommendation': 'devices_offline',
-                'message': f'All {target_type} devices offline',
-                'estimated_wait_time': None,
-                'priority_advantage': False
-            }
-            
-        except Exception as e:
-            logger.error(f"Error getting device recommendations: {str(e)}")
-            return {'error': str(e)}
+        Returns:
+            {"wait_seconds", "run_seconds", "wait_seconds_p90", "run_seconds_p90",
+            "running", "queued_ahead", "slots"}: expected figures from the runtime
+            EWMAs, conservative ones from their p90s; the waits are None when
+            every device of the type is offline
+        """
+        inputs = self._wait_inputs(target_type, priority, before_job_id)
+        estimates = RuntimeModel().estimates_by_stat(runtime_keys(inputs, target_type, test_path))
+        return wait_estimate(inputs, estimates, target_type, test_path)
+    
+    def _wait_inputs(self, target_type: str, priority: int,
+                     before_job_id: Optional[int] = None) -> Dict[str, Any]:
+        """The database half of estimate_wait: usable slots, running jobs and queued jobs ahead."""
+        slots = self.db.query(func.coalesce(func.sum(Device.max_concurrent_jobs), 0)).filter(
+            Device.device_type == target_type, Device.status != "offline"
+        ).scalar()
+        running = self.db.query(Job.test_path, Job.shard_count, Job.updated_at).filter(
+            Job.target == target_type, Job.status == "running"
+        ).all()
+        same_priority = Job.priority == priority
+        if before_job_id is not None:
+            same_priority = and_(same_priority, Job.id < before_job_id)
+        queued = self.db.query(Job.test_path, Job.shard_count, func.count(Job.id)).filter(
+            Job.target == target_type, Job.status == "queued", (Job.priority > priority) | same_priority
+        ).group_by(Job.test_path, Job.shard_count, Job.priority).order_by(desc(Job.priority), func.min(Job.id)).all()
+        return {'slots': slots, 'running': running, 'queued': queued}
     
     def health_check_devices(self) -> Dict[str, Any]:
         """
@@ -358,6 +478,12 @@ class DeviceManager:
         Returns:
             Dictionary with health check results
         """
+        results, device_events = self._health_check()
+        events.publish_events(device_events)
+        return results
+    
+    def _health_check(self) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """The database half of health_check_devices: results and the device events to publish."""
         try:
             devices = self.db.query(Device).all()
             results = {
@@ -367,15 +493,18 @@ class DeviceManager:
                 'details': []
             }
             
+            changes = []
             for device in devices:
                 # Simulate health check (in real system, this would ping the device)
                 is_healthy = True  # Simulated check
                 
                 if is_healthy and device.status == "offline":
                     device.status = "available"
+                    changes.append((device, "online"))
                     logger.info(f"Device {device.device_id} is back online")
                 elif not is_healthy and device.status in ["available", "busy"]:
                     device.status = "offline"
+                    changes.append((device, "offline"))
                     logger.warning(f"Device {device.device_id} went offline")
                 
                 device.last_health_check = func.now()
@@ -392,9 +521,196 @@ class DeviceManager:
                     results['unhealthy'] += 1
             
             self.db.commit()
-            return results
+            return results, [events.device_event(device, action) for device, action in changes]
             
         except Exception as e:
             logger.error(f"Error during health check: {str(e)}")
             self.db.rollback()
-            return {'error': str(e)} 
\ No newline at end of file
+            return {'error': str(e)}, []
+
+
+def runtime_keys(inputs: Dict[str, Any], target_type: str, test_path: Optional[str] = None) -> List[Tuple[str, str]]:
+    """(test_path, target) of every job DeviceManager._wait_inputs found, and of the job estimated."""
+    paths = {row.test_path for row in inputs['running']} | {row.test_path for row in inputs['queued']}
+    if test_path:
+        paths.add(test_path)
+    return [(path, target_type) for path in sorted(paths)]
+
+def wait_estimate(inputs: Dict[str, Any], estimates: Dict[str, Dict[Tuple[str, str], float]], target_type: str,
+                  test_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    The estimate_wait payload from DeviceManager._wait_inputs and the
+    RuntimeModel.estimates_by_stat of runtime_keys.
+    """
+    now = datetime.utcnow()
+    queued_count = sum(count for _, _, count in inputs['queued'])
+    estimate = {
+        'running': len(inputs['running']),
+        'queued_ahead': queued_count,
+        'slots': inputs['slots'],
+    }
+    for stat, suffix in (('ewma', ''), ('p90', '_p90')):
+        runtimes = estimates[stat]
+        running_remaining = [
+            shard_estimate(runtimes[(row.test_path, target_type)], row.shard_count)
+            - (now - row.updated_at).total_seconds()
+            for row in inputs['running']
+        ]
+        queued_ahead = [shard_estimate(runtimes[(path, target_type)], shard_count)
+                        for path, shard_count, count in inputs['queued'] for _ in range(count)]
+        wait = estimate_start(inputs['slots'], running_remaining, queued_ahead)
+        estimate['wait_seconds' + suffix] = None if wait is None else int(round(wait))
+        estimate['run_seconds' + suffix] = int(round(runtimes[(test_path, target_type)])) if test_path else None
+    return estimate
+
+def queue_and_wait(target_type: str, priority: int, estimate: Dict[str, Any]) -> Dict[str, Any]:
+    """The recommendation when every device of the type is busy."""
+    return {
+        'recommendation': 'queue_and_wait',
+        'message': f'All {target_type} devices busy',
+        'estimated_wait_time': estimate['wait_seconds'],
+        'estimated_run_time': estimate['run_seconds'],
+        # Conservative: from the p90 runtimes
+        'estimated_wait_time_p90': estimate['wait_seconds_p90'],
+        'estimated_run_time_p90': estimate['run_seconds_p90'],
+        'jobs_ahead': estimate['queued_ahead'],
+        'priority_advantage': priority >= 4
+    }
+
+def select_preemption_victim(candidates: List[Any]) -> Optional[Any]:
+    """
+    Pick the device to preempt from DeviceManager._preemption_candidates rows.
+    
+    Policy: fewest preemptible jobs (least work disrupted), then lowest
+    priority, then least progress (most recently claimed work).
+    """
+    by_progress = sorted(candidates, key=lambda c: c.last_started or datetime.min, reverse=True)
+    return min(by_progress, key=lambda c: (c.evictable_jobs, c.min_priority), default=None)
+
+def read_app_cache_stats() -> Dict[str, Dict[str, float]]:
+    """app_cache_stats, or nothing if Redis is unavailable."""
+    try:
+        return app_cache_stats()
+    except Exception as e:
+        logger.warning(f"App cache stats unavailable: {str(e)}")
+        return {}
+
+def summarize_device_status(devices: List[Dict[str, Any]], priority_allocation: Dict[str, Any],
+                            app_cache: Optional[Dict[str, Dict[str, float]]] = None) -> Dict[str, Any]:
+    """
+    Build the /devices/status payload.
+    
+    Args:
+        devices: Dicts with device_id, type, status, current_jobs and max_jobs,
+            from the database or from the Redis counters
+        priority_allocation: Per-priority running/queued job stats
+        app_cache: Warm-install hits, misses and hit rate per device type
+        
+    Returns:
+        Dictionary with device status information
+    """
+    status_summary = {
+        'total_devices': len(devices),
+        'available_devices': 0,
+        'busy_devices': 0,
+        'offline_devices': 0,
+        'by_type': {},
+        'priority_allocation': priority_allocation,
+        'devices': []
+    }
+    
+    # Group by device type
+    for device in devices:
+        if device['type'] not in status_summary['by_type']:
+            status_summary['by_type'][device['type']] = {
+                'total': 0,
+                'available': 0,
+                'busy': 0,
+                'offline': 0,
+                'avg_utilization': 0,
+                'app_cache': (app_cache or {}).get(device['type'], {'hits': 0, 'misses': 0, 'hit_rate': 0})
+            }
+        
+        type_stats = status_summary['by_type'][device['type']]
+        type_stats['total'] += 1
+        
+        if device['status'] == 'available':
+            status_summary['available_devices'] += 1
+            type_stats['available'] += 1
+        elif device['status'] == 'busy':
+            status_summary['busy_devices'] += 1
+            type_stats['busy'] += 1
+        else:
+            status_summary['offline_devices'] += 1
+            type_stats['offline'] += 1
+        
+        # Add device details (same rules as Device.utilization_percent and is_available)
+        max_jobs = device['max_jobs']
+        status_summary['devices'].append({
+            **device,
+            'utilization_percent': (device['current_jobs'] / max_jobs) * 100 if max_jobs else 0,
+            'is_available': device['status'] == 'available' and device['current_jobs'] < max_jobs
+        })
+    
+    # Calculate average utilization by type
+    for device_type, stats in status_summary['by_type'].items():
+        if stats['total'] > 0:
+            total_utilization = sum(
+                d['utilization_percent'] for d in status_summary['devices'] 
+                if d['type'] == device_type
+            )
+            stats['avg_utilization'] = total_utilization / stats['total']
+    
+    return status_summary
+
+
+class AsyncDeviceManager:
+    """
+    DeviceManager for AsyncSession callers (the API).
+    
+    The database half of each call runs the synchronous DeviceManager logic on
+    the session's connection via AsyncSession.run_sync, so the rules live in
+    one place. The Redis half (runtime history, app cache stats, device events)
+    is synchronous too and runs in a thread, so neither blocks the event loop.
+    """
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def get_device_status(self) -> Dict[str, Any]:
+        try:
+            devices, priority_stats = await self.db.run_sync(
+                lambda session: DeviceManager(session)._device_status_rows()
+            )
+        except Exception as e:
+            logger.error(f"Error getting device status: {str(e)}")
+            return {'error': str(e)}
+        return summarize_device_status(devices, priority_stats, await asyncio.to_thread(read_app_cache_stats))
+    
+    async def get_device_recommendations(self, target_type: str, priority: int = 1,
+                                         test_path: Optional[str] = None) -> Dict[str, Any]:
+        try:
+            recommendation = await self.db.run_sync(
+                lambda session: DeviceManager(session)._recommendation(target_type, priority)
+            )
+            if recommendation is None:
+                recommendation = queue_and_wait(target_type, priority,
+                                                await self.estimate_wait(target_type, priority, test_path))
+            return recommendation
+        except Exception as e:
+            logger.error(f"Error getting device recommendations: {str(e)}")
+            return {'error': str(e)}
+    
+    async def estimate_wait(self, target_type: str, priority: int = 1, test_path: Optional[str] = None,
+                            before_job_id: Optional[int] = None) -> Dict[str, Any]:
+        inputs = await self.db.run_sync(
+            lambda session: DeviceManager(session)._wait_inputs(target_type, priority, before_job_id)
+        )
+        estimates = await asyncio.to_thread(RuntimeModel().estimates_by_stat,
+                                            runtime_keys(inputs, target_type, test_path))
+        return wait_estimate(inputs, estimates, target_type, test_path)
+    
+    async def health_check_devices(self) -> Dict[str, Any]:
+        results, device_events = await self.db.run_sync(lambda session: DeviceManager(session)._health_check())
+        await asyncio.to_thread(events.publish_events, device_events)
+        return results
@@ -0,0 +1,140 @@
+"""
+Job and device state-change events.
+
+Every status transition (submit, claim, finish, cancel, preempt) and every
+device slot allocation or release is published on one Redis pub/sub channel.
+GET /events relays the channel to clients as Server-Sent Events, so watchers
+get pushed updates instead of polling the database.
+
+Publishing is best effort: a Redis hiccup is logged and never fails the
+transition that triggered it. The dashboard counters (services.counters) are
+updated in the same transaction as each publish.
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+import redis
+import redis.asyncio
+
+from ..queue.batching import get_redis
+from ..queue.celery_app import REDIS_URL
+from .counters import QueueCounters
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = os.getenv('EVENTS_CHANNEL', 'qualcli:events')
+
+# Seconds between keep-alive comments on an idle event stream
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', '15'))
+
+_async_redis_client: Optional[redis.asyncio.Redis] = None
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """Return the process-wide asyncio Redis client used by event subscribers."""
+    global _async_redis_client
+    if _async_redis_client is None:
+        _async_redis_client = redis.asyncio.Redis.from_url(REDIS_URL)
+    return _async_redis_client
+
+def job_event(job, previous_status: Optional[str] = None, **extra) -> Dict[str, Any]:
+    """
+    Build the event for a job that moved to its current status.
+
+    Accepts a Job or a row with the same column names.
+    """
+    event = {
+        "type": f"job.{job.status}",
+        "job_id": job.id,
+        "status": job.status,
+        "previous_status": previous_status,
+        "priority": job.priority,
+        "target": job.target,
+        "app_version_id": job.app_version_id,
+        "test_path": job.test_path,
+        "assigned_device_name": job.assigned_device_name,
+    }
+    event.update(extra)
+    return event
+
+def device_event(device, action: str, jobs_delta: int = 0) -> Dict[str, Any]:
+    """
+    Build the event for a device change (slot allocated or released, device
+    registered, removed or taken offline).
+
+    jobs_delta is how much the action changed current_jobs by.
+    """
+    return {
+        "type": f"device.{action}",
+        "device_id": device.device_id,
+        "device_type": device.device_type,
+        "status": device.status,
+        "current_jobs": device.current_jobs,
+        "max_concurrent_jobs": device.max_concurrent_jobs,
+        "jobs_delta": jobs_delta,
+    }
+
+def publish_events(events: Iterable[Dict[str, Any]]) -> int:
+    """
+    Publish events, and apply the counter updates they imply, in one
+    MULTI/EXEC round trip.
+
+    Returns:
+        Number of events published (0 if Redis was unavailable)
+    """
+    events = list(events)
+    if not events:
+        return 0
+    try:
+        client = get_redis()
+        counters = QueueCounters(client)
+        pipe = client.pipeline(transaction=True)
+        for event in events:
+            event.setdefault("timestamp", time.time())
+            pipe.publish(EVENTS_CHANNEL, json.dumps(event, default=str))
+            counters.record(pipe, event)
+        pipe.execute()
+        return len(events)
+    except Exception as e:
+        logger.warning(f"Could not publish {len(events)} events: {str(e)}")
+        return 0
+
+def publish_event(event: Dict[str, Any]) -> int:
+    """Publish a single event."""
+    return publish_events([event])
+
+async def subscribe(types: Optional[List[str]] = None,
+                    heartbeat: float = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    Yield events from the channel as they are published.
+
+    The first item is always None, yielded once the subscription is active:
+    anything published after that point is guaranteed to be delivered.
+
+    Args:
+        types: Only yield events whose type starts with one of these prefixes
+            (e.g. ["job", "device.allocated"]); None yields everything
+        heartbeat: Yield None after this many idle seconds so callers can
+            keep the connection alive (default EVENTS_HEARTBEAT)
+    """
+    heartbeat = EVENTS_HEARTBEAT if heartbeat is None else heartbeat
+    pubsub = get_async_redis().pubsub()
+    await pubsub.subscribe(EVENTS_CHANNEL)
+    try:
+        yield None
+        while True:
+            message = await pubsub.get_message(timeout=heartbeat)
+            if message is None:
+                yield None
+                continue
+            if message["type"] != "message":
+                continue  # Subscribe confirmation
+            event = json.loads(message["data"])
+            if types and not any(event.get("type", "").startswith(prefix) for prefix in types):
+                continue
+            yield event
+    finally:
+        await pubsub.unsubscribe(EVENTS_CHANNEL)
+        await pubsub.aclose()
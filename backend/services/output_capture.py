@@ -0,0 +1,110 @@
+"""
+Bounded-memory capture of AppWright subprocess output.
+
+A test run with `--trace on` can print tens of MB. Instead of buffering it,
+OutputCapture streams stdout and stderr line by line into a per-job log under
+TEST_LOG_DIR (rotated at TEST_LOG_MAX_BYTES, keeping TEST_LOG_BACKUPS old
+files) and keeps only the last TEST_OUTPUT_TAIL_LINES lines of each stream in
+memory. The JSON reporter writes its report to a file next to the log
+(PLAYWRIGHT_JSON_OUTPUT_NAME), read by services.report_parser.
+
+    logs/tests/job-42.log            stdout, and stderr lines prefixed "[stderr] "
+    logs/tests/job-42.log.1          previous contents once the log rotated
+    logs/tests/job-42.report.json    JSON reporter output
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from pathlib import Path
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TEST_LOG_DIR = os.getenv('TEST_LOG_DIR', 'logs/tests')
+TEST_LOG_MAX_BYTES = int(os.getenv('TEST_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+TEST_LOG_BACKUPS = int(os.getenv('TEST_LOG_BACKUPS', '2'))
+
+# Lines of each stream kept in memory and returned with the result
+TEST_OUTPUT_TAIL_LINES = int(os.getenv('TEST_OUTPUT_TAIL_LINES', '50'))
+
+# Longer lines are split in the log and truncated in the tail
+MAX_LINE_BYTES = 8192
+
+READ_CHUNK_BYTES = 64 * 1024
+
+def output_paths(job_id: Optional[int], test_path: str) -> Tuple[str, str]:
+    """Log and JSON report paths for one test run."""
+    name = f"job-{job_id}" if job_id is not None else f"{Path(test_path).stem}-{int(time.time() * 1000)}"
+    os.makedirs(TEST_LOG_DIR, exist_ok=True)
+    base = os.path.join(TEST_LOG_DIR, name)
+    return f"{base}.log", f"{base}.report.json"
+
+class RotatingLog:
+    """Append-only file that rolls over to .1, .2, ... once it reaches max_bytes."""
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None, backups: Optional[int] = None):
+        self.path = path
+        self.max_bytes = TEST_LOG_MAX_BYTES if max_bytes is None else max_bytes
+        self.backups = TEST_LOG_BACKUPS if backups is None else backups
+        self._file = open(path, 'wb')
+        self._size = 0
+
+    def write(self, data: bytes):
+        if self._size and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def _rotate(self):
+        self._file.close()
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{i}"):
+                    os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, 'wb')
+        self._size = 0
+
+    def close(self):
+        self._file.close()
+
+class OutputCapture:
+    """Streams a subprocess's stdout and stderr into a RotatingLog, keeping the tail of each."""
+
+    def __init__(self, log_path: Optional[str] = None, tail_lines: int = TEST_OUTPUT_TAIL_LINES):
+        self.log_path = log_path
+        self._log = RotatingLog(log_path) if log_path else None
+        self._tails = {'stdout': deque(maxlen=tail_lines), 'stderr': deque(maxlen=tail_lines)}
+        self.bytes = {'stdout': 0, 'stderr': 0}
+
+    async def pump(self, stream: asyncio.StreamReader, name: str):
+        """Read `stream` to EOF a chunk at a time, handing each line to the log and the tail."""
+        partial = b''
+        while True:
+            chunk = await stream.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            self.bytes[name] += len(chunk)
+            lines = (partial + chunk).split(b'\n')
+            partial = lines.pop()
+            for line in lines:
+                self._line(name, line)
+            while len(partial) > MAX_LINE_BYTES:
+                self._line(name, partial[:MAX_LINE_BYTES])
+                partial = partial[MAX_LINE_BYTES:]
+        if partial:
+            self._line(name, partial)
+
+    def _line(self, name: str, line: bytes):
+        if self._log:
+            self._log.write((b'[stderr] ' if name == 'stderr' else b'') + line + b'\n')
+        self._tails[name].append(line[:MAX_LINE_BYTES].decode('utf-8', errors='replace').rstrip('\r'))
+
+    def tail(self, name: str) -> str:
+        return '\n'.join(self._tails[name])
+
+    def close(self):
+        if self._log:
+            self._log.close()
@@ -0,0 +1,70 @@
+"""
+Keyset (cursor) pagination for GET /jobs.
+
+Pages are ordered by (sort column, id) and the next page starts strictly
+after the last row of the previous one, so each page is an index range scan
+no matter how deep into the history it is. The cursor is opaque to clients:
+URL-safe base64 of the sort, order and last row's key.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict
+
+from sqlalchemy import Select, tuple_
+
+from ..models.job import Job
+
+# Sort option -> column that leads the (column, id) key
+SORT_COLUMNS = {
+    'created': Job.created_at,
+    'priority': Job.priority,
+    'status': Job.status,
+}
+
+def encode_cursor(job: Job, sort: str, order: str) -> str:
+    """Build the cursor pointing just past a job."""
+    value = getattr(job, SORT_COLUMNS[sort].key)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps({'s': sort, 'o': order, 'v': value, 'id': job.id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str, sort: str, order: str) -> Dict[str, Any]:
+    """
+    Decode a cursor for a page request.
+
+    Raises ValueError if the cursor is malformed or was issued for a
+    different sort or order.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key = {'value': payload['v'], 'id': int(payload['id'])}
+        issued_for = (payload['s'], payload['o'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+    if issued_for != (sort, order):
+        raise ValueError(f"Cursor was issued for sort={issued_for[0]} order={issued_for[1]}")
+    if sort == 'created' and key['value'] is not None:
+        key['value'] = datetime.fromisoformat(key['value'])
+    return key
+
+def apply_keyset(query: Select, sort: str, order: str, cursor: str = None) -> Select:
+    """
+    Order a jobs query by (sort column, id) and, given a cursor, start it
+    right after the row the cursor points at.
+    """
+    column = SORT_COLUMNS[sort]
+    if order == 'desc':
+        query = query.order_by(column.desc(), Job.id.desc())
+    else:
+        query = query.order_by(column.asc(), Job.id.asc())
+
+    if cursor:
+        key = decode_cursor(cursor, sort, order)
+        position = tuple_(column, Job.id)
+        after = (key['value'], key['id'])
+        query = query.where(position < after if order == 'desc' else position > after)
+    return query
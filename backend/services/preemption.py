@@ -0,0 +1,112 @@
+"""
+Cooperative preemption of running batches.
+
+A high-priority dispatcher that finds no free device does not take a slot
+away from under a running batch (the batch would keep running its test and
+the device would be oversubscribed). It asks for one instead: request()
+queues the ask on a device running lower-priority work and the dispatcher
+retries later as usual.
+
+Slot workers of running batches poll take() before each test and while a
+test runs, passing the priority of their job. A worker only takes an ask its
+job may be preempted for (more than one level below the requester, the rule
+DeviceManager._preemption_candidates picks devices by), so a batch sharing
+the device with the intended victim never gives up higher priority work. The
+worker that takes an ask cancels its test (RealTestRunner
+terminates the subprocess), puts the job back in the queue with its original
+priority, releases its slot and signals the requester's batch, so the slot
+is only freed once the work on it has stopped.
+
+    qualcli:preempt:{device pk}              list of requesters waiting for a slot on the device
+    qualcli:preempt:req:{target}:{app}       set while a requester batch has an ask outstanding
+
+Asks expire after PREEMPT_REQUEST_TTL seconds, so one whose requester found
+a slot elsewhere (or gave up) cannot stop unrelated work later.
+"""
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import redis
+
+from ..queue.batching import get_redis
+
+logger = logging.getLogger(__name__)
+
+PREEMPT_PREFIX = 'qualcli:preempt'
+
+# Seconds between checks for a preemption ask while a test runs
+PREEMPT_POLL_INTERVAL = float(os.getenv('PREEMPT_POLL_INTERVAL', '0.5'))
+
+# Seconds an unanswered ask stays valid
+PREEMPT_REQUEST_TTL = int(os.getenv('PREEMPT_REQUEST_TTL', '120'))
+
+def _device_key(device_pk: int) -> str:
+    return f"{PREEMPT_PREFIX}:{device_pk}"
+
+def _requester_key(app_version_id: Optional[str], target: str) -> str:
+    return f"{PREEMPT_PREFIX}:req:{target}:{app_version_id}"
+
+def request(device_pk: int, app_version_id: Optional[str], target: str, priority: int) -> bool:
+    """
+    Ask the batch running on a device to give up one slot.
+
+    Args:
+        device_pk: Primary key of the device to preempt
+        app_version_id: App version of the requesting batch (None: nobody to signal)
+        target: Target type of the requesting batch
+        priority: Priority of the requesting batch
+
+    Returns:
+        True if the ask was queued, False if the batch already has one outstanding
+    """
+    client = get_redis()
+    entry = json.dumps({"app_version_id": app_version_id, "target": target, "priority": priority})
+    if not client.set(_requester_key(app_version_id, target), f"{device_pk}|{entry}", nx=True, ex=PREEMPT_REQUEST_TTL):
+        return False
+    pipe = client.pipeline()
+    pipe.rpush(_device_key(device_pk), entry)
+    pipe.expire(_device_key(device_pk), PREEMPT_REQUEST_TTL)
+    pipe.execute()
+    return True
+
+def may_preempt(requester_priority: int, priority: int) -> bool:
+    """Whether a requester may take the slot of a job of `priority`."""
+    return priority < requester_priority - 1
+
+def take(device_pk: int, priority: int) -> Optional[Dict[str, Any]]:
+    """
+    Take the oldest ask for a slot on this device that may preempt a job of
+    `priority`, or None. Other asks stay queued for the batch they target.
+    """
+    client = get_redis()
+    key = _device_key(device_pk)
+    while True:
+        with client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                for raw in pipe.lrange(key, 0, -1):
+                    requester = json.loads(raw)
+                    if may_preempt(requester["priority"], priority):
+                        pipe.multi()
+                        pipe.lrem(key, 1, raw)
+                        pipe.delete(_requester_key(requester["app_version_id"], requester["target"]))
+                        pipe.execute()
+                        return requester
+                return None
+            except redis.WatchError:
+                continue
+
+def withdraw(app_version_id: Optional[str], target: str):
+    """Drop a batch's outstanding ask, e.g. because it found a free device."""
+    client = get_redis()
+    key = _requester_key(app_version_id, target)
+    marker = client.get(key)
+    if marker is None:
+        return
+    device_pk, entry = marker.decode().split('|', 1)
+    pipe = client.pipeline()
+    pipe.lrem(_device_key(int(device_pk)), 1, entry)
+    pipe.delete(key)
+    pipe.execute()
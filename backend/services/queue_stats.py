@@ -0,0 +1,77 @@
+from typing import Dict, Any
+from datetime import datetime
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from ..models.job import Job, ACTIVE_STATUSES
+from ..queue.celery_app import get_queue_by_priority, get_priority_info
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_LEVELS = range(1, 6)
+
+def count_active_jobs(db: Session) -> Dict[int, Dict[str, int]]:
+    """
+    Count queued and running jobs per priority with one GROUP BY query.
+    
+    Only active rows are scanned (served by the partial ix_jobs_active_priority_status
+    index), so the cost does not grow with job history.
+    
+    Returns:
+        {priority: {"queued": n, "running": n}} for every priority level
+    """
+    counts = {priority: {status: 0 for status in ACTIVE_STATUSES} for priority in PRIORITY_LEVELS}
+    
+    rows = db.query(Job.priority, Job.status, func.count(Job.id)).filter(
+        Job.status.in_(ACTIVE_STATUSES)
+    ).group_by(Job.priority, Job.status).all()
+    
+    for priority, status, count in rows:
+        counts.setdefault(priority, {s: 0 for s in ACTIVE_STATUSES})[status] = count
+    
+    return counts
+
+def get_queue_status(db: Session) -> Dict[str, Any]:
+    """Build the /queues/status payload from the database."""
+    return build_queue_status(count_active_jobs(db))
+
+def build_queue_status(counts: Dict[int, Dict[str, int]]) -> Dict[str, Any]:
+    """
+    Build the /queues/status payload: per-priority counts and per-queue rollups.
+    
+    Queue membership comes from get_queue_by_priority, so the rollups follow any
+    change to the priority routing.
+    
+    Args:
+        counts: {priority: {"queued": n, "running": n}}, from count_active_jobs
+            or the Redis counters
+    """
+    priority_stats = {}
+    for priority in PRIORITY_LEVELS:
+        queued_count = counts[priority]["queued"]
+        running_count = counts[priority]["running"]
+        priority_stats[f"priority_{priority}"] = {
+            "queue_name": get_queue_by_priority(priority),
+            "queued_jobs": queued_count,
+            "running_jobs": running_count,
+            "total_active": queued_count + running_count
+        }
+    
+    # Group by queue
+    queue_summary = {
+        queue: {"queued_jobs": 0, "running_jobs": 0, "total_active": 0}
+        for queue in get_priority_info()['queue_order']
+    }
+    for stats in priority_stats.values():
+        queue_stats = queue_summary.setdefault(
+            stats["queue_name"], {"queued_jobs": 0, "running_jobs": 0, "total_active": 0}
+        )
+        queue_stats["queued_jobs"] += stats["queued_jobs"]
+        queue_stats["running_jobs"] += stats["running_jobs"]
+        queue_stats["total_active"] += stats["total_active"]
+    
+    return {
+        "queue_summary": queue_summary,
+        "priority_breakdown": priority_stats,
+        "timestamp": datetime.utcnow().isoformat()
+    }
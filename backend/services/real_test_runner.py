@@ -3,11 +3,14 @@ import json
 import os
 import tempfile
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import asyncio
 import time
 from pathlib import Path
 
+from .output_capture import OutputCapture, output_paths
+from . import report_parser
+
 # Configure logger
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)  # Ensure this specific logger is set to DEBUG level
@@ -15,12 +18,27 @@ logger.setLevel(logging.DEBUG)  # Ensure this specific logger is set to DEBUG le
 class RealTestRunner:
     """Real test runner that actually executes AppWright tests on devices."""
     
-    def __init__(self, target: str):
+    def __init__(self, target: str, app_installed: bool = False):
+        """
+        Args:
+            target: Target type (emulator, device, browserstack)
+            app_installed: The app version is already installed on every device
+                of the batch, so tests run against it without reinstalling
+        """
         self.target = target
+        self.app_installed = app_installed
         self.workspace_dir = Path.cwd()
+        self._configs = {}  # app_version_id -> target config, set up once per batch
+        
+    async def run_tests(self, test_path: str, app_version_id: str, job_id: Optional[int] = None,
+                        shard: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+        """
+        Run actual AppWright tests on the specified target.
         
-    async def run_tests(self, test_path: str, app_version_id: str) -> Dict[str, Any]:
-        """Run actual AppWright tests on the specified target."""
+        Output goes to a per-job log on disk (see services.output_capture); the
+        result carries only its tail and the log and report paths. With `shard`
+        (index, count) only that shard of the file's tests runs (--shard i/N).
+        """
         try:
             logger.info(f"🚀 Starting REAL AppWright test execution: {test_path} on {self.target}")
             
@@ -39,13 +57,16 @@ class RealTestRunner:
                 }
             
             # Step 3: Set up target-specific configuration - pass app_version_id only for tracking
-            config = await self._setup_target_config(app_version_id)
-            if not config["success"]:
-                return config
+            config = self._configs.get(app_version_id)
+            if config is None:
+                config = await self._setup_target_config(app_version_id)
+                if not config["success"]:
+                    return config
+                self._configs[app_version_id] = config
                 
             # Step 4: Execute the actual test
             start_time = time.time()
-            execution_result = await self._execute_appwright_test(test_path, config["config"])
+            execution_result = await self._execute_appwright_test(test_path, config["config"], job_id, shard)
             execution_time = time.time() - start_time
             
             if execution_result["success"]:
@@ -60,13 +81,17 @@ class RealTestRunner:
                         "tests_run": execution_result.get("tests_run", 1),
                         "tests_passed": execution_result.get("tests_passed", 1),
                         "tests_failed": execution_result.get("tests_failed", 0),
+                        "test_cases": execution_result.get("test_cases", []),
                         "video_path": execution_result.get("video_path"),
                         "screenshots": execution_result.get("screenshots", []),
                         "details": {
                             "target_config": config["config"],
                             "timestamp": time.time(),
                             "device_info": execution_result.get("device_info", {}),
-                            "test_output": execution_result.get("output", "")
+                            "output_tail": execution_result.get("output", ""),
+                            "output_bytes": execution_result.get("output_bytes", 0),
+                            "log_path": execution_result.get("log_path"),
+                            "report_path": execution_result.get("report_path")
                         }
                     }
                 }
@@ -74,7 +99,9 @@ class RealTestRunner:
                 logger.error(f"❌ Test failed: {execution_result.get('error', 'Unknown error')}")
                 return {
                     "success": False,
-                    "error": execution_result.get("error", "Test execution failed")
+                    "error": execution_result.get("error") or "Test execution failed",
+                    "log_path": execution_result.get("log_path"),
+                    "test_cases": execution_result.get("test_cases", [])
                 }
                 
         except Exception as e:
@@ -116,17 +143,12 @@ class RealTestRunner:
                 "error": "ADB not available. For real device testing, please use BrowserStack target instead of emulator. Android SDK setup not required for BrowserStack."
             }
         
-        # Look for APK file
-        apk_path = self._find_apk_file(app_version_id)
-        if not apk_path:
-            apk_path = "apps/test123.apk"  # Default from project structure
-        
         config = {
             "platform": "ANDROID",
             "device": {"provider": "emulator"},
-            "buildPath": apk_path,
             "automationName": "uiautomator2"
         }
+        config.update(self._install_config(app_version_id))
         
         logger.info(f"📱 Emulator config: {config}")
         return {"success": True, "config": config}
@@ -143,20 +165,28 @@ class RealTestRunner:
                 "error": "No physical devices detected. Please connect a device."
             }
         
-        apk_path = self._find_apk_file(app_version_id)
-        if not apk_path:
-            apk_path = "apps/test123.apk"
-        
         config = {
             "platform": "ANDROID",
             "device": {"provider": "device"},
-            "buildPath": apk_path,
             "automationName": "uiautomator2"
         }
+        config.update(self._install_config(app_version_id))
         
         logger.info(f"📲 Device config: {config}")
         return {"success": True, "config": config}
     
+    def _install_config(self, app_version_id: str) -> Dict[str, Any]:
+        """buildPath to install from, or noReset to reuse the installed app on a warm device."""
+        if self.app_installed:
+            logger.info(f"♻️ App {app_version_id} already installed; skipping install")
+            return {"noReset": True}
+        
+        # Look for APK file
+        apk_path = self._find_apk_file(app_version_id)
+        if not apk_path:
+            apk_path = "apps/test123.apk"  # Default from project structure
+        return {"buildPath": apk_path}
+    
     async def _setup_browserstack_config(self, app_version_id: str) -> Dict[str, Any]:
         """Configure BrowserStack for testing."""
         logger.info("🔧 Setting up BrowserStack configuration...")
@@ -201,31 +231,47 @@ class RealTestRunner:
         logger.info(f"☁️  BrowserStack config: {config}")
         return {"success": True, "config": config}
     
-    async def _execute_appwright_test(self, test_path: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    async def _execute_appwright_test(self, test_path: str, config: Dict[str, Any], job_id: Optional[int] = None,
+                                      shard: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
         """Execute the actual AppWright test."""
         try:
             logger.info(f"🏃 Executing AppWright test with config from appwright.config.ts")
             
-            # Build the command with project specification and trace recording
+            # Build the command with project specification and trace recording; progress
+            # lines go to the job log, the JSON report to its own file
+            log_path, report_path = output_paths(job_id, test_path)
             cmd = [
                 "npx", "appwright", "test", test_path,
                 "--config", "appwright.config.ts",  # Use the TypeScript config directly
-                "--reporter", "json",
+                "--reporter", "line,json",
                 "--project", "android",  # Specify the android project
                 "--trace", "on"
             ]
+            if shard:
+                cmd += ["--shard", f"{shard[0]}/{shard[1]}"]
+            env = {**os.environ, "PLAYWRIGHT_JSON_OUTPUT_NAME": os.path.abspath(report_path)}
             
-            logger.info(f"🚀 Running: {' '.join(cmd)}")
-            result = await self._run_command(cmd)
+            logger.info(f"🚀 Running: {' '.join(cmd)} (output in {log_path})")
+            result = await self._run_command(cmd, log_path=log_path, env=env)
             
+            if os.path.exists(report_path):
+                result["report_path"] = report_path
+                result.update(self._read_report(report_path))
             return result
             
         except Exception as e:
             logger.error(f"❌ AppWright execution error: {str(e)}")
             return {"success": False, "error": str(e)}
     
-    async def _run_command(self, cmd: List[str], timeout: int = 60) -> Dict[str, Any]:
-        """Run a shell command asynchronously."""
+    async def _run_command(self, cmd: List[str], timeout: int = 60, log_path: Optional[str] = None,
+                           env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Run a shell command asynchronously.
+        
+        Output is streamed rather than buffered: every line goes to `log_path`
+        (if given) and only the last lines of stdout and stderr are kept and
+        returned as "output" and "error".
+        """
         try:
             logger.info(f"🔧 Running command: {' '.join(cmd)}")
             
@@ -233,27 +279,36 @@ class RealTestRunner:
                 *cmd,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
-                cwd=self.workspace_dir
+                cwd=self.workspace_dir,
+                env=env
             )
+            capture = OutputCapture(log_path)
+            pumps = asyncio.ensure_future(asyncio.gather(
+                capture.pump(process.stdout, "stdout"),
+                capture.pump(process.stderr, "stderr")
+            ))
             
             try:
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+                await asyncio.wait_for(asyncio.gather(asyncio.shield(pumps), process.wait()), timeout=timeout)
                 return_code = process.returncode
                 
-                output = stdout.decode('utf-8') if stdout else ""
-                error = stderr.decode('utf-8') if stderr else ""
+                output = capture.tail("stdout")
+                error = capture.tail("stderr")
                 
-                logger.info(f"📤 Command completed with return code: {return_code}")
+                logger.info(f"📤 Command completed with return code: {return_code} "
+                            f"({capture.bytes['stdout']} bytes of output)")
                 if output:
-                    logger.debug(f"📝 Output: {output[:500]}...")
+                    logger.debug(f"📝 Output: {output[-500:]}")
                 if error:
-                    logger.warning(f"⚠️  Error output: {error[:500]}...")
+                    logger.warning(f"⚠️  Error output: {error[-500:]}")
                 
                 return {
                     "success": return_code == 0,
                     "return_code": return_code,
                     "output": output,
-                    "error": error
+                    "error": error,
+                    "output_bytes": capture.bytes["stdout"] + capture.bytes["stderr"],
+                    "log_path": log_path
                 }
                 
             except asyncio.TimeoutError:
@@ -261,8 +316,16 @@ class RealTestRunner:
                 await process.wait()
                 return {
                     "success": False,
-                    "error": f"Command timed out after {timeout} seconds"
+                    "error": f"Command timed out after {timeout} seconds\n{capture.tail('stderr')}".rstrip(),
+                    "log_path": log_path
                 }
+            except asyncio.CancelledError:
+                # Preempted: stop the test on the device before the slot is given up
+                await self._terminate(process)
+                raise
+            finally:
+                await self._drain(pumps)
+                capture.close()
                 
         except Exception as e:
             return {
@@ -270,6 +333,48 @@ class RealTestRunner:
                 "error": f"Failed to run command: {str(e)}"
             }
     
+    async def _drain(self, pumps: asyncio.Future, grace: float = 5.0):
+        """Let the output readers finish after the process exits (grandchildren may hold the pipes open)."""
+        try:
+            await asyncio.wait_for(asyncio.shield(pumps), timeout=grace)
+        except asyncio.TimeoutError:
+            pumps.cancel()
+        except asyncio.CancelledError:
+            pumps.cancel()
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️  Output capture failed: {str(e)}")
+    
+    def _read_report(self, report_path: str) -> Dict[str, Any]:
+        """Test counts, per-test cases and device info from the JSON report, streamed rather than loaded."""
+        try:
+            sections = report_parser.read_report_sections(report_path, ("stats", "config"))
+            test_cases = list(report_parser.iter_test_cases(report_path))
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Could not read JSON report {report_path}: {str(e)}")
+            return {}
+        report = {"test_cases": test_cases}
+        stats = sections.get("stats")
+        if stats:
+            passed = stats.get("expected", 0) + stats.get("flaky", 0)
+            failed = stats.get("unexpected", 0)
+            report.update({"tests_run": passed + failed, "tests_passed": passed, "tests_failed": failed})
+        project = test_cases[0]["project"] if test_cases else None
+        report["device_info"] = self._extract_device_info(sections.get("config", {}), project)
+        return report
+    
+    async def _terminate(self, process, grace: float = 5.0):
+        """Terminate a subprocess, killing it if it does not exit within `grace` seconds."""
+        if process.returncode is not None:
+            return
+        logger.info(f"🛑 Terminating pid {process.pid}")
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout=grace)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+    
     def _find_apk_file(self, app_version_id: str) -> Optional[str]:
         """Find APK file for the given app version."""
         # For BrowserStack, always use the configured path
@@ -291,11 +396,10 @@ class RealTestRunner:
         
         return None
     
-    def _extract_device_info(self, output: str) -> Dict[str, Any]:
-        """Extract device information from test output."""
-        # This would parse actual AppWright output for device details
+    def _extract_device_info(self, config: Dict[str, Any], project: Optional[str]) -> Dict[str, Any]:
+        """Device the test ran on, from the project config recorded in the JSON report."""
         return {
             "target_type": self.target,
             "timestamp": time.time(),
-            "parsed_from_output": True
+            **report_parser.device_info(config, project)
         } 
\ No newline at end of file
@@ -0,0 +1,301 @@
+"""
+Streaming parser for the AppWright (Playwright) JSON reporter.
+
+A report holds every test's results, stdout and stderr and can run to tens
+of MB, so it is never loaded whole. _JsonStream scans the file a chunk at a
+time, yielding brackets and object keys and skipping string values, and
+decodes only the values a caller asks for:
+
+    read_report_sections()   small top-level sections ("stats", "config")
+    iter_specs()             one spec (a test() call with its per-project
+                             results) at a time, with its describe() titles
+    iter_test_cases()        specs flattened into TestResult rows
+
+Report shape (only what is read here):
+
+    {"config": {"projects": [{"name", "use": {"platform", "device"}}]},
+     "suites": [{"title": <file>, "specs": [...], "suites": [<describe blocks>]}],
+     "stats": {"expected", "unexpected", "flaky", "skipped", "duration"}}
+    spec:   {"title", "file", "line", "tests": [test]}
+    test:   {"projectName", "status": expected|unexpected|flaky|skipped, "results": [result]}
+    result: {"status", "duration" (ms), "retry", "error": {"message"}, "attachments": [{"name", "contentType", "path"}]}
+"""
+import json
+import logging
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import output_capture
+
+logger = logging.getLogger(__name__)
+
+# Larger specs (a test with huge stdout) are skipped rather than decoded
+MAX_SPEC_BYTES = 8 * 1024 * 1024
+
+# Error messages are cut to this many characters
+MAX_ERROR_CHARS = 2000
+
+# Strings longer than this that run past a read are values, never keys, and are skipped unread
+MAX_KEY_CHARS = 1024
+
+# A complete JSON string (no "close" group if it runs past the buffer), or a bracket
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(?P<close>")?|[\[\]{}]')
+_WHITESPACE = re.compile(r'\s*')
+_STRING_REST = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"')
+_TRAILING_BACKSLASHES = re.compile(r'\\*$')
+
+# Test status in the report -> outcome stored in test_results
+OUTCOMES = {'expected': 'passed', 'unexpected': 'failed', 'flaky': 'flaky', 'skipped': 'skipped'}
+
+class _JsonStream:
+    """A JSON file read a chunk at a time; tokens() and value() share its position."""
+
+    def __init__(self, f):
+        self._f = f
+        self._decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _more(self) -> bool:
+        chunk = self._f.read(output_capture.READ_CHUNK_BYTES)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return bool(chunk)
+
+    def tokens(self) -> Iterator[Tuple[str, Optional[str]]]:
+        """
+        Yield ('{' | '}' | '[' | ']', None), ('key', key) and ('string', raw JSON string).
+
+        After a 'key' the caller may call value() to decode and consume the
+        value; otherwise scanning continues into it.
+        """
+        in_string = False  # Inside a long string split across reads
+        while True:
+            if in_string:
+                rest = _STRING_REST.match(self.buf, self.pos)
+                if rest is None:
+                    # Skip what was read, keeping an escape that may continue in the next read
+                    self.pos = _TRAILING_BACKSLASHES.search(self.buf, self.pos).start()
+                    if not self._more():
+                        return
+                    continue
+                in_string = False
+                self.pos = rest.end()
+                continue
+            match = _TOKEN.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                if not self._more():
+                    return
+                continue
+            token = match.group()
+            if token[0] != '"':
+                self.pos = match.end()
+                yield token, None
+                continue
+            if match.group('close') is None and len(token) > MAX_KEY_CHARS:
+                in_string = True
+                self.pos = match.start() + 1
+                continue
+            if match.group('close') is None or match.end() == len(self.buf):
+                # String (or what follows it) runs past the buffer
+                self.pos = match.start()
+                if not self._more():
+                    return
+                continue
+            after = _WHITESPACE.match(self.buf, match.end()).end()
+            if after == len(self.buf):
+                self.pos = match.start()
+                if not self._more():
+                    return
+                continue
+            if self.buf[after] == ':':
+                self.pos = after + 1
+                yield 'key', json.loads(token)
+            else:
+                self.pos = match.end()
+                yield 'string', token
+
+    def peek(self) -> Optional[str]:
+        """Next non-whitespace character, without consuming it (None at the end)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                return None
+
+    def skip(self):
+        """Consume the character peek() returned."""
+        self.pos += 1
+
+    def value(self, max_bytes: int) -> Any:
+        """
+        Decode and consume the value at the current position.
+
+        Raises:
+            ValueError: The value is truncated or longer than max_bytes (nothing is consumed)
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+                if end - self.pos > max_bytes:
+                    raise ValueError(f"JSON value over {max_bytes} bytes")
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise ValueError("truncated JSON value")
+            if len(self.buf) - self.pos > max_bytes:
+                raise ValueError(f"JSON value over {max_bytes} bytes")
+            self._more()
+
+def _open(path: str):
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+def read_report_sections(path: str, keys: Iterable[str] = ('stats', 'errors'),
+                         max_value_bytes: int = 1024 * 1024) -> Dict[str, Any]:
+    """
+    Top-level values of a JSON document, read incrementally.
+
+    Args:
+        path: JSON file, e.g. the JSON reporter's output
+        keys: Top-level keys to return
+        max_value_bytes: Values larger than this are left out
+
+    Returns:
+        {key: value} for the requested keys present in the document
+    """
+    wanted = set(keys)
+    found = {}
+    depth = 0
+    with _open(path) as f:
+        stream = _JsonStream(f)
+        for kind, text in stream.tokens():
+            if kind in ('{', '['):
+                depth += 1
+            elif kind in ('}', ']'):
+                depth -= 1
+            elif kind == 'key' and depth == 1 and text in wanted:
+                try:
+                    found[text] = stream.value(max_value_bytes)
+                except ValueError as e:
+                    logger.warning(f"Skipped report section {text!r} in {path}: {str(e)}")
+                if not wanted - found.keys():
+                    break
+    return found
+
+def iter_specs(path: str) -> Iterator[Tuple[List[str], Dict[str, Any]]]:
+    """
+    Yield (describe titles, spec) for every spec in a JSON report.
+
+    Only one spec is decoded at a time; the titles are those of the
+    enclosing describe() blocks, outermost first (the file-level suite is
+    left out).
+    """
+    stack = []  # [bracket, key it is the value of, title] per open container
+    pending_key = None
+    with _open(path) as f:
+        stream = _JsonStream(f)
+        for kind, text in stream.tokens():
+            if kind == 'key':
+                pending_key = text
+                if text == 'specs' and _in_suite(stack) and stream.peek() == '[':
+                    stream.skip()
+                    stack.append(['[', 'specs', None])
+                    pending_key = None
+                    titles = _describe_titles(stack)
+                    while True:
+                        char = stream.peek()
+                        if char == ',':
+                            stream.skip()
+                            continue
+                        if char == ']' or char is None:
+                            if char == ']':
+                                stream.skip()
+                            stack.pop()
+                            break
+                        try:
+                            spec = stream.value(MAX_SPEC_BYTES)
+                        except ValueError as e:
+                            # Let the scanner step over the rest of the array
+                            logger.warning(f"Skipped the remaining specs of a suite in {path}: {str(e)}")
+                            break
+                        yield titles, spec
+                continue
+            if kind == 'string':
+                if pending_key == 'title' and stack and stack[-1][0] == '{':
+                    stack[-1][2] = json.loads(text)
+            elif kind in ('{', '['):
+                stack.append([kind, pending_key, None])
+            elif stack:
+                stack.pop()
+            pending_key = None
+
+def _in_suite(stack: List[list]) -> bool:
+    return len(stack) >= 2 and stack[-1][0] == '{' and stack[-2][0] == '[' and stack[-2][1] == 'suites'
+
+def _describe_titles(stack: List[list]) -> List[str]:
+    suites = [stack[i][2] for i in range(1, len(stack))
+              if stack[i][0] == '{' and stack[i - 1][0] == '[' and stack[i - 1][1] == 'suites']
+    return [title for title in suites[1:] if title]
+
+def iter_test_cases(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one test case per spec and project from a JSON report.
+
+    Each case has the TestResult columns: title (describe titles and the
+    test title joined with " › "), file, line, project, status (passed,
+    failed, flaky or skipped), duration_ms (all attempts), retries, error
+    and attachments (name, content_type and path of files on disk).
+    """
+    for titles, spec in iter_specs(path):
+        title = " › ".join(titles + [spec.get("title", "")])
+        for test in spec.get("tests", []):
+            results = test.get("results", [])
+            status = OUTCOMES.get(test.get("status"), "failed")
+            if status == "passed" and results and results[-1].get("status") == "skipped":
+                status = "skipped"
+            yield {
+                "title": title,
+                "file": spec.get("file"),
+                "line": spec.get("line"),
+                "project": test.get("projectName"),
+                "status": status,
+                "duration_ms": int(sum(result.get("duration", 0) for result in results)),
+                "retries": max(len(results) - 1, 0),
+                "error": _first_error(results),
+                "attachments": [
+                    {"name": attachment.get("name"), "content_type": attachment.get("contentType"),
+                     "path": attachment["path"]}
+                    for result in results for attachment in result.get("attachments", [])
+                    if attachment.get("path")
+                ],
+            }
+
+def _first_error(results: List[Dict[str, Any]]) -> Optional[str]:
+    for result in results:
+        error = result.get("error") or next(iter(result.get("errors", [])), None)
+        if error:
+            message = error.get("message") or error.get("value") or ""
+            return message[:MAX_ERROR_CHARS]
+    return None
+
+def device_info(config: Dict[str, Any], project: Optional[str]) -> Dict[str, Any]:
+    """Platform and device of a project from the report's "config" section."""
+    for candidate in config.get("projects", []):
+        if project is None or candidate.get("name") == project:
+            use = candidate.get("use", {})
+            device = use.get("device") or {}
+            return {
+                "project": candidate.get("name"),
+                "platform": use.get("platform"),
+                "provider": device.get("provider"),
+                "name": device.get("name"),
+                "os_version": device.get("osVersion"),
+            }
+    return {}
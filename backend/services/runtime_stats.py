@@ -0,0 +1,162 @@
+"""
+Historical test runtimes, per (test_path, target), kept in Redis.
+
+Every completed job pushes its duration onto two capped lists, one for the
+test on its target and one for the target as a whole:
+
+    qualcli:runtime:{target}:{test_path}   last RUNTIME_WINDOW durations, newest first
+    qualcli:runtime:{target}               the same across every test on the target
+
+Statistics are computed when read, so recording is a single LPUSH/LTRIM
+pipeline with no read-modify-write race between workers:
+
+    ewma    exponentially weighted mean (RUNTIME_EWMA_ALPHA on the newest run)
+    p90     90th percentile of the window
+
+Failed and cancelled runs are not recorded: they stop early and would drag
+the statistics down.
+
+A test with no history is estimated from its target's statistics, and a
+target with none from DEFAULT_RUNTIME_SECONDS.
+
+The EWMA orders batch execution longest-first (so a batch does not end with
+one slot running a long test started last) and gives the expected ETAs of
+/devices/recommendations and POST /jobs/submit (estimate_start()); the p90
+gives their conservative ETAs.
+"""
+import heapq
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import redis
+
+from ..queue.batching import get_redis
+
+logger = logging.getLogger(__name__)
+
+RUNTIME_PREFIX = 'qualcli:runtime'
+
+# Durations kept per test and target
+RUNTIME_WINDOW = int(os.getenv('RUNTIME_WINDOW', '50'))
+
+# Weight of the newest run in the EWMA
+RUNTIME_EWMA_ALPHA = float(os.getenv('RUNTIME_EWMA_ALPHA', '0.3'))
+
+# Estimate for a target with no recorded runs
+DEFAULT_RUNTIME_SECONDS = float(os.getenv('DEFAULT_RUNTIME_SECONDS', '30'))
+
+# Statistics an estimate can be taken from: expected and conservative
+RUNTIME_STATS = ("ewma", "p90")
+
+RuntimeKey = Tuple[str, str]  # (test_path, target)
+
+def _test_key(test_path: str, target: str) -> str:
+    return f"{RUNTIME_PREFIX}:{target}:{test_path}"
+
+def _target_key(target: str) -> str:
+    return f"{RUNTIME_PREFIX}:{target}"
+
+def summarize(samples: Sequence[float], alpha: Optional[float] = None) -> Dict[str, Any]:
+    """
+    EWMA and p90 of durations, newest first.
+
+    Returns:
+        {"samples", "ewma", "p90"} (ewma and p90 are None without samples)
+    """
+    if not samples:
+        return {"samples": 0, "ewma": None, "p90": None}
+    alpha = RUNTIME_EWMA_ALPHA if alpha is None else alpha
+    ewma = samples[-1]
+    for seconds in reversed(samples[:-1]):
+        ewma = alpha * seconds + (1 - alpha) * ewma
+    ordered = sorted(samples)
+    p90 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+    return {"samples": len(samples), "ewma": round(ewma, 3), "p90": round(p90, 3)}
+
+class RuntimeModel:
+    """Records job durations and estimates how long tests will take."""
+
+    def __init__(self, client: Optional[redis.Redis] = None, window: int = RUNTIME_WINDOW):
+        self.client = client or get_redis()
+        self.window = window
+
+    def record(self, test_path: str, target: str, seconds: float):
+        """Add a completed run's duration."""
+        pipe = self.client.pipeline()
+        for key in (_test_key(test_path, target), _target_key(target)):
+            pipe.lpush(key, round(seconds, 3))
+            pipe.ltrim(key, 0, self.window - 1)
+        pipe.execute()
+
+    def stats(self, keys: Iterable[RuntimeKey]) -> Dict[RuntimeKey, Dict[str, Any]]:
+        """summarize() of the window of each (test_path, target), in one round trip."""
+        keys = list(dict.fromkeys(keys))
+        pipe = self.client.pipeline(transaction=False)
+        for test_path, target in keys:
+            pipe.lrange(_test_key(test_path, target), 0, -1)
+        return {key: summarize([float(s) for s in samples]) for key, samples in zip(keys, pipe.execute())}
+
+    def target_stats(self, target: str) -> Dict[str, Any]:
+        return summarize([float(s) for s in self.client.lrange(_target_key(target), 0, -1)])
+
+    def estimates(self, keys: Iterable[RuntimeKey], stat: str = "ewma") -> Dict[RuntimeKey, float]:
+        """
+        Seconds for each (test_path, target): expected (ewma) or conservative (p90).
+
+        The test's statistic, else its target's, else DEFAULT_RUNTIME_SECONDS.
+        """
+        return self.estimates_by_stat(keys, (stat,))[stat]
+
+    def estimates_by_stat(self, keys: Iterable[RuntimeKey],
+                          stats: Sequence[str] = RUNTIME_STATS) -> Dict[str, Dict[RuntimeKey, float]]:
+        """estimates() for each statistic, from one read of the windows."""
+        summaries = self.stats(keys)
+        fallbacks = {}
+        estimates = {stat: {} for stat in stats}
+        for (test_path, target), summary in summaries.items():
+            if summary["ewma"] is None and target not in fallbacks:
+                fallbacks[target] = self.target_stats(target)
+            for stat in stats:
+                if summary[stat] is None:
+                    estimates[stat][(test_path, target)] = fallbacks[target][stat] or DEFAULT_RUNTIME_SECONDS
+                else:
+                    estimates[stat][(test_path, target)] = summary[stat]
+        return estimates
+
+    def estimate(self, test_path: str, target: str, stat: str = "ewma") -> float:
+        return self.estimates([(test_path, target)], stat)[(test_path, target)]
+
+def shard_estimate(estimate: float, shard_count: Optional[int]) -> float:
+    """A shard's share of its file's estimated runtime (history is kept per file)."""
+    return estimate / (shard_count or 1)
+
+def longest_first(jobs: List[Any], estimates: Dict[RuntimeKey, float]) -> List[Any]:
+    """Jobs (with test_path, target and shard_count) by estimated runtime, longest first; ties keep their order."""
+    return sorted(jobs, key=lambda job: -shard_estimate(estimates.get((job.test_path, job.target), 0),
+                                                        job.shard_count))
+
+def estimate_start(slots: int, running_remaining: Iterable[float], queued_ahead: Iterable[float]) -> Optional[float]:
+    """
+    Seconds until a new job would start on a pool of slots.
+
+    Simulates list scheduling: every slot frees up when its running job's
+    remaining time is over (idle slots at once), and each queued job ahead
+    takes the slot that frees up first, in order.
+
+    Args:
+        slots: Usable slots (max_concurrent_jobs over devices that are not offline)
+        running_remaining: Estimated seconds left of each running job
+        queued_ahead: Estimated seconds of each job that will start first, in start order
+
+    Returns:
+        Seconds until a slot is free for the job, or None without slots
+    """
+    if slots <= 0:
+        return None
+    free_at = sorted(max(0.0, remaining) for remaining in running_remaining)[:slots]
+    free_at += [0.0] * (slots - len(free_at))
+    heapq.heapify(free_at)
+    for seconds in queued_ahead:
+        heapq.heappush(free_at, heapq.heappop(free_at) + seconds)
+    return free_at[0]
@@ -0,0 +1,145 @@
+"""
+Splitting one spec file across devices with AppWright's `--shard i/N`.
+
+A sharded submission is recorded as a parent job and N child jobs:
+
+    parent   status "sharded" until every shard is done, then completed (all
+             shards completed) or failed; never claimed or counted as active
+    shard    an ordinary job of the same app version, target and priority with
+             parent_job_id, shard_index (1..N) and shard_count, so shards batch
+             and spread over the device pool like any other jobs
+
+While the parent is "sharded", /jobs/{id} reports the roll-up of its shards
+(queued until one starts, then running). Auto mode picks N from the file's
+runtime history (services.runtime_stats): enough shards for each to take about
+SHARD_TARGET_SECONDS, at most MAX_SHARDS and the target's device slots.
+"""
+import logging
+import math
+import os
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import case, func, update
+from sqlalchemy.orm import Session
+
+from ..models.device import Device
+from ..models.job import ACTIVE_STATUSES, Job
+from . import events
+from .runtime_stats import RuntimeModel
+
+logger = logging.getLogger(__name__)
+
+SHARDED_STATUS = 'sharded'
+
+# Upper bound on shards per spec file
+MAX_SHARDS = int(os.getenv('MAX_SHARDS', '16'))
+
+# Auto mode: runtime each shard should take
+SHARD_TARGET_SECONDS = float(os.getenv('SHARD_TARGET_SECONDS', '120'))
+
+def auto_shard_count(db: Session, test_path: str, target: str) -> int:
+    """
+    Shards for a spec file from its historical runtime (1 = don't shard).
+
+    History is kept for the whole file (shards record their runtime times
+    their shard count), so the estimate does not depend on earlier splits.
+    """
+    estimate = RuntimeModel().estimate(test_path, target)
+    slots = db.query(func.coalesce(func.sum(Device.max_concurrent_jobs), 0)).filter(
+        Device.device_type == target, Device.status != "offline"
+    ).scalar()
+    return max(1, min(math.ceil(estimate / SHARD_TARGET_SECONDS), MAX_SHARDS, slots))
+
+def create_shards(parent: Job, shard_count: int) -> List[Job]:
+    """Turn a new job into the parent of `shard_count` shards and return the shards (not yet added)."""
+    parent.status = SHARDED_STATUS
+    parent.shard_count = shard_count
+    return [
+        Job(org_id=parent.org_id, app_version_id=parent.app_version_id, test_path=parent.test_path,
+            priority=parent.priority, target=parent.target, status="queued", parent_job_id=parent.id,
+            shard_index=index, shard_count=shard_count)
+        for index in range(1, shard_count + 1)
+    ]
+
+def shard_counts(db: Session, parent_ids: Iterable[int]) -> Dict[int, Dict[str, int]]:
+    """{parent_id: {status: shards}} in one grouped query."""
+    counts = {}
+    rows = db.query(Job.parent_job_id, Job.status, func.count(Job.id)).filter(
+        Job.parent_job_id.in_(list(parent_ids))
+    ).group_by(Job.parent_job_id, Job.status).all()
+    for parent_id, status, count in rows:
+        counts.setdefault(parent_id, {})[status] = count
+    return counts
+
+def rolled_up_status(status: str, counts: Dict[str, int]) -> str:
+    """Status to report for a parent: its own once final, else queued or running from its shards."""
+    if status != SHARDED_STATUS:
+        return status
+    return "queued" if counts.get("queued", 0) == sum(counts.values()) else "running"
+
+def shard_summary(db: Session, parent: Job) -> Dict[str, Any]:
+    """Roll-up of a parent's shards for the status endpoints."""
+    counts = shard_counts(db, [parent.id]).get(parent.id, {})
+    return {
+        "status": rolled_up_status(parent.status, counts),
+        "shard_count": parent.shard_count,
+        "shards": {status: counts.get(status, 0) for status in ("queued", "running", "completed", "failed")},
+    }
+
+def rollup(db: Session, parent_ids: Iterable[int], publish: bool = True) -> List[Any]:
+    """
+    Finish parents whose shards are all done: completed if every shard
+    completed, else failed. Commits, and publishes the parents' events unless
+    `publish` is False (the caller publishes them off the event loop).
+
+    Safe to call repeatedly and concurrently: only parents still "sharded" are
+    updated.
+
+    Returns:
+        Rows (id, status, ...) of the parents that finished
+    """
+    parent_ids = {parent_id for parent_id in parent_ids if parent_id is not None}
+    if not parent_ids:
+        return []
+    rows = db.query(
+        Job.parent_job_id,
+        func.sum(case((Job.status.in_(ACTIVE_STATUSES), 1), else_=0)),
+        func.sum(case((Job.status == "failed", 1), else_=0)),
+    ).filter(Job.parent_job_id.in_(parent_ids)).group_by(Job.parent_job_id).all()
+
+    finished = []
+    for status in ("completed", "failed"):
+        ids = [parent_id for parent_id, active, failed in rows
+               if not active and (status == "failed") == bool(failed)]
+        if not ids:
+            continue
+        finished.extend(db.execute(
+            update(Job).where(Job.id.in_(ids), Job.status == SHARDED_STATUS).values(status=status)
+            .returning(Job.id, Job.status, Job.priority, Job.target, Job.app_version_id,
+                       Job.test_path, Job.assigned_device_name)
+            .execution_options(synchronize_session=False)
+        ).all())
+    db.commit()
+    if finished and publish:
+        events.publish_events(events.job_event(row, SHARDED_STATUS) for row in finished)
+    if finished:
+        logger.info(f"🧩 Sharded jobs finished: {[(row.id, row.status) for row in finished]}")
+    return finished
+
+def cancel_shards(db: Session, parent_id: int) -> List[Tuple[Any, str]]:
+    """
+    Fail a parent's unfinished shards (the caller commits and publishes their events).
+
+    Returns:
+        (row, previous status) of each cancelled shard
+    """
+    cancelled = []
+    for previous in ACTIVE_STATUSES:
+        rows = db.execute(
+            update(Job).where(Job.parent_job_id == parent_id, Job.status == previous).values(status="failed")
+            .returning(Job.id, Job.status, Job.priority, Job.target, Job.app_version_id,
+                       Job.test_path, Job.assigned_device_name)
+            .execution_options(synchronize_session=False)
+        ).all()
+        cancelled.extend((row, previous) for row in rows)
+    return cancelled
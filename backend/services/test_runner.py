@@ -1,4 +1,4 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 import os
 import json
 import logging
@@ -8,10 +8,18 @@ import time
 logger = logging.getLogger(__name__)
 
 class TestRunner:
+    # Simulated seconds per test by target
+    EXECUTION_TIMES = {
+        'emulator': 3,
+        'device': 5,
+        'browserstack': 8
+    }
+
     def __init__(self, target: str):
         self.target = target
 
-    async def run_tests(self, test_path: str, app_version_id: str) -> Dict[str, Any]:
+    async def run_tests(self, test_path: str, app_version_id: str, job_id: Optional[int] = None,
+                        shard: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
         """Run a simplified test validation for the given test path and app version."""
         try:
             logger.info(f"Running simplified test for {test_path} on {self.target}")
@@ -31,11 +39,7 @@ class TestRunner:
                 }
             
             # Step 3: Simulate test execution time based on target
-            execution_time = {
-                'emulator': 3,
-                'device': 5,
-                'browserstack': 8
-            }.get(self.target, 3)
+            execution_time = self.EXECUTION_TIMES.get(self.target, 3)
             
             logger.info(f"Simulating {execution_time}s test execution on {self.target}")
             await asyncio.sleep(execution_time)
@@ -73,10 +77,20 @@ class TestRunner:
                 "test_file": test_path,
                 "app_version_id": app_version_id,
                 "target": self.target,
+                "shard": f"{shard[0]}/{shard[1]}" if shard else None,
                 "execution_time": execution_time,
                 "tests_run": 1,
                 "tests_passed": 1,
                 "tests_failed": 0,
+                "test_cases": [{
+                    "title": os.path.basename(test_path) + (f" (shard {shard[0]}/{shard[1]})" if shard else ""),
+                    "file": test_path,
+                    "project": self.target,
+                    "status": "passed",
+                    "duration_ms": int(execution_time * 1000),
+                    "retries": 0,
+                    "attachments": []
+                }],
                 "details": {
                     "file_size": len(content),
                     "file_type": "javascript" if test_path.endswith('.js') else "typescript",
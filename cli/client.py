@@ -1,44 +1,132 @@
-import requests
-from typing import Dict, Any, List
+import atexit
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Union
+
 from dotenv import load_dotenv
-import httpx
+
+# httpx is imported where it is used: it is the slowest import of the CLI and
+# most invocations (help, argument errors) never make a request
+if TYPE_CHECKING:
+    import httpx
 
 # Load environment variables
 load_dotenv()
 
+# HTTP settings shared by every command
+API_TIMEOUT = float(os.getenv('API_TIMEOUT', '30'))  # Seconds per request (read/write/pool)
+API_CONNECT_TIMEOUT = float(os.getenv('API_CONNECT_TIMEOUT', '5'))
+API_RETRIES = int(os.getenv('API_RETRIES', '3'))  # Extra attempts after a failed request
+API_RETRY_BACKOFF = float(os.getenv('API_RETRY_BACKOFF', '0.5'))  # Seconds, doubled per attempt
+
+# Only requests that are safe to repeat are retried once they reached the server
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+RETRY_STATUS_CODES = (502, 503, 504)
+
+_http_client: Optional['httpx.Client'] = None
+
 class APIError(Exception):
     """Custom exception for API errors."""
     pass
 
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def get_http_client() -> 'httpx.Client':
+    """
+    Return the process-wide HTTP client.
+
+    Connections are pooled and kept alive across calls (and across commands
+    that make several), and requests are multiplexed over HTTP/2 when the
+    `h2` package is installed and the server supports it.
+    """
+    global _http_client
+    if _http_client is None:
+        import httpx
+        _http_client = httpx.Client(
+            http2=_http2_available(),
+            timeout=httpx.Timeout(API_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+        atexit.register(_http_client.close)
+    return _http_client
+
+def run_concurrently(*calls: Callable[[], Any]) -> List[Any]:
+    """
+    Run independent API calls at the same time over the shared client.
+
+    Returns each call's result, or the exception it raised, in order.
+    """
+    def capture(call):
+        try:
+            return call()
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+        return list(executor.map(capture, calls))
+
 class APIClient:
-    def __init__(self):
-        self.base_url = os.getenv('API_URL', 'http://localhost:8002')
+    def __init__(self, base_url: Optional[str] = None):
+        self.base_url = (base_url or os.getenv('API_URL', 'http://localhost:8002')).rstrip('/')
+        self.http = get_http_client()
+
+    def request(self, method: str, path: str, **kwargs) -> 'httpx.Response':
+        """
+        Send a request over the pooled client, retrying with exponential backoff.
 
-    def _handle_response(self, response: requests.Response) -> Dict[str, Any]:
+        Connection failures are always retried (the request never reached the
+        server); timeouts, dropped connections and 502/503/504 responses only
+        for idempotent methods. Raises APIError once the retries are used up.
+        """
+        import httpx
+        url = f"{self.base_url}{path}"
+        repeatable = method.upper() in IDEMPOTENT_METHODS
+        for attempt in range(API_RETRIES + 1):
+            last_attempt = attempt == API_RETRIES
+            try:
+                response = self.http.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                if last_attempt:
+                    raise APIError(f"API error: {str(e)}")
+            except httpx.HTTPError as e:
+                if last_attempt or not repeatable:
+                    raise APIError(f"API error: {str(e)}")
+            else:
+                if last_attempt or not repeatable or response.status_code not in RETRY_STATUS_CODES:
+                    return response
+            time.sleep(API_RETRY_BACKOFF * 2 ** attempt)
+
+    def _handle_response(self, response: 'httpx.Response') -> Any:
         """Handle API response and errors."""
+        if response.status_code != 200:
+            if response.status_code == 404:
+                raise APIError("Resource not found")
+            elif response.status_code == 400:
+                raise APIError(f"Bad request: {response.text}")
+            elif response.status_code >= 500:
+                raise APIError("Server error - please try again later")
+            else:
+                raise APIError(f"API error: {response.text}")
         try:
-            if response.status_code != 200:
-                if response.status_code == 404:
-                    raise APIError("Resource not found")
-                elif response.status_code == 400:
-                    raise APIError(f"Bad request: {response.text}")
-                elif response.status_code >= 500:
-                    raise APIError("Server error - please try again later")
-                else:
-                    raise APIError(f"API error: {response.text}")
             return response.json()
-        except requests.exceptions.RequestException as e:
-            raise APIError(f"API error: {str(e)}")
+        except ValueError as e:
+            raise APIError(f"API error: invalid response ({str(e)})")
 
     def submit_job(self, 
                   org_id: str, 
                   app_version_id: str, 
                   test_path: str,
                   priority: int = 1,
-                  target: str = "emulator") -> Dict[str, Any]:
-        """Submit a new job to the backend."""
-        url = f"{self.base_url}/jobs/submit"
+                  target: str = "emulator",
+                  shards: Union[int, str] = 1) -> Dict[str, Any]:
+        """Submit a new job to the backend (shards > 1 or "auto" splits it with --shard i/N)."""
         payload = {
             "org_id": org_id,
             "app_version_id": app_version_id,
@@ -46,75 +134,119 @@ class APIClient:
             "priority": priority,
             "target": target
         }
-        
-        try:
-            response = requests.post(url, json=payload)
-            return self._handle_response(response)
-        except requests.exceptions.RequestException as e:
-            raise APIError(f"API error: {str(e)}")
+        if shards != 1:
+            payload["shards"] = shards
+        return self._handle_response(self.request("POST", "/jobs/submit", json=payload))
+
+    def submit_jobs_bulk(self, jobs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Submit a list of job payloads in a single request."""
+        return self._handle_response(self.request("POST", "/jobs/submit/bulk", json={"jobs": jobs}))
 
     def get_job_status(self, job_id: str) -> Dict[str, Any]:
         """Get the status of a job."""
-        url = f"{self.base_url}/jobs/{job_id}"
+        return self._handle_response(self.request("GET", f"/jobs/{job_id}"))
+
+    def get_job_shards(self, job_id: int) -> Dict[str, Any]:
+        """Get a sharded job's rolled-up status and its shard jobs."""
+        return self._handle_response(self.request("GET", f"/jobs/{job_id}/shards"))
+
+    def list_jobs(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Get one page of jobs; see iter_job_pages to follow the cursor."""
+        return next(self.iter_job_pages(params))
+
+    def iter_job_pages(self, params: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield pages of jobs, following the X-Next-Cursor header lazily.
+
+        The next page is only requested when the caller asks for it.
+        """
+        params = dict(params)
+        while True:
+            response = self.request("GET", "/jobs", params=params)
+            yield self._handle_response(response)
+
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                return
+            params['cursor'] = cursor
+
+    def stream_events(self, types: Optional[List[str]] = None) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Yield job and device state changes pushed by GET /events (Server-Sent Events).
+
+        Yields None for keep-alives, so time-based displays can refresh while
+        nothing changes. Raises APIError if the stream cannot be opened or drops.
+        """
+        import httpx
+        params = {'types': ','.join(types)} if types else None
+        # Keep-alives arrive every few seconds; a minute of silence means the connection is gone
+        timeout = httpx.Timeout(API_TIMEOUT, connect=API_CONNECT_TIMEOUT, read=60)
         try:
-            response = requests.get(url)
-            return self._handle_response(response)
-        except requests.exceptions.RequestException as e:
+            with self.http.stream("GET", f"{self.base_url}/events", params=params, timeout=timeout) as response:
+                if response.status_code != 200:
+                    response.read()
+                    raise APIError(f"API error: {response.text}")
+                data = []
+                for line in response.iter_lines():
+                    if line.startswith(':'):
+                        yield None
+                    elif line.startswith('data:'):
+                        data.append(line[5:].lstrip())
+                    elif not line and data:
+                        yield json.loads('\n'.join(data))
+                        data = []
+        except httpx.HTTPError as e:
             raise APIError(f"API error: {str(e)}")
 
+    def wait_for_jobs(self, job_ids: List[int], mode: str = "all", timeout: float = 30) -> Dict[str, Any]:
+        """
+        Long-poll POST /jobs/wait until the jobs finish (mode=all) or one does
+        (mode=any), for at most `timeout` seconds (the server caps one call).
+        """
+        import httpx
+        response = self.request(
+            "POST", "/jobs/wait",
+            json={"job_ids": job_ids, "mode": mode, "timeout": timeout},
+            timeout=httpx.Timeout(API_TIMEOUT + timeout, connect=API_CONNECT_TIMEOUT)
+        )
+        return self._handle_response(response)
+
+    def cancel_job(self, job_id: int) -> 'httpx.Response':
+        """Cancel a job; returns the raw response so callers can explain 400/404."""
+        return self.request("DELETE", f"/jobs/{job_id}")
+
     def get_grouped_jobs(self, app_version_id: str) -> List[Dict[str, Any]]:
         """Get all jobs for a specific app version."""
-        url = f"{self.base_url}/jobs/group/{app_version_id}"
-        try:
-            response = requests.get(url)
-            return self._handle_response(response)
-        except requests.exceptions.RequestException as e:
-            raise APIError(f"API error: {str(e)}")
+        return self._handle_response(self.request("GET", f"/jobs/group/{app_version_id}"))
+
+    def get_queue_status(self) -> Dict[str, Any]:
+        """Get active job counts per priority and queue."""
+        return self._handle_response(self.request("GET", "/queues/status"))
+
+    def get_priority_info(self) -> Dict[str, Any]:
+        """Get the priority queue routing configuration."""
+        return self._handle_response(self.request("GET", "/queues/priority-info"))
     
     def get_devices(self) -> Dict[str, Any]:
         """Get all devices and their current status."""
-        url = f"{self.base_url}/devices"
-        
-        try:
-            response = requests.get(url)
-            return self._handle_response(response)
-        except requests.exceptions.RequestException as e:
-            raise APIError(f"API error: {str(e)}")
+        return self._handle_response(self.request("GET", "/devices"))
     
     def get_device_status(self) -> Dict[str, Any]:
         """Get device pool status and utilization metrics."""
-        url = f"{self.base_url}/devices/status"
-        
-        try:
-            response = requests.get(url)
-            return self._handle_response(response)
-        except requests.exceptions.RequestException as e:
-            raise APIError(f"API error: {str(e)}")
+        return self._handle_response(self.request("GET", "/devices/status"))
     
     def get_device_recommendations(self, target_type: str) -> Dict[str, Any]:
         """Get device allocation recommendations for a specific target type."""
-        url = f"{self.base_url}/devices/recommendations/{target_type}"
-        
-        try:
-            response = requests.get(url)
-            return self._handle_response(response)
-        except requests.exceptions.RequestException as e:
-            raise APIError(f"API error: {str(e)}")
+        return self._handle_response(self.request("GET", f"/devices/recommendations/{target_type}"))
     
     def perform_health_check(self) -> Dict[str, Any]:
         """Perform health check on all devices."""
-        url = f"{self.base_url}/devices/health-check"
-        
-        try:
-            response = requests.post(url)
-            return self._handle_response(response)
-        except requests.exceptions.RequestException as e:
-            raise APIError(f"API error: {str(e)}") 
+        return self._handle_response(self.request("POST", "/devices/health-check"))
 
 class QualClient:
     def __init__(self, base_url: str):
         self.base_url = base_url.rstrip('/')
-        self.client = httpx.Client()
+        self.client = get_http_client()
     
     def submit_job(self, org_id: str, app_version_id: str, test_path: str, priority: int = 1, target: str = "local"):
         """Submit a new test job"""
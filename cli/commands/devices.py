@@ -1,13 +1,8 @@
 import click
 from ..client import APIClient, APIError
-from ..utils.formatting import print_error
-from rich.console import Console
-from rich.table import Table
-from rich.panel import Panel
+from ..utils.formatting import console, print_error
 import sys
 
-console = Console()
-
 @click.group()
 def devices():
     """Device management commands."""
@@ -16,6 +11,8 @@ def devices():
 @devices.command()
 def list():
     """List all devices and their current status."""
+    from rich.table import Table
+
     try:
         client = APIClient()
         response = client.get_devices()
@@ -67,6 +64,9 @@ def list():
 @devices.command()
 def status():
     """Show device pool status and utilization metrics."""
+    from rich.panel import Panel
+    from rich.table import Table
+
     try:
         client = APIClient()
         response = client.get_device_status()
@@ -118,6 +118,8 @@ def status():
 @click.argument('target_type', type=click.Choice(['emulator', 'device', 'browserstack']))
 def recommend(target_type):
     """Get device allocation recommendations for a target type."""
+    from rich.panel import Panel
+
     try:
         client = APIClient()
         response = client.get_device_recommendations(target_type)
@@ -141,7 +143,9 @@ def recommend(target_type):
             panel = Panel.fit(
                 f"[bold yellow]⏳ Queue Required[/bold yellow]\n\n"
                 f"[bold white]Message:[/] {response.get('message', 'All devices busy')}\n"
-                f"[bold white]Estimated Wait Time:[/] {response.get('estimated_wait_time', 0)} seconds",
+                f"[bold white]Estimated Wait Time:[/] {response.get('estimated_wait_time', 0)} seconds"
+                + (f" (up to {response['estimated_wait_time_p90']}s)"
+                   if response.get('estimated_wait_time_p90') is not None else ""),
                 title=f"[bold yellow]{target_type.capitalize()} Recommendation",
                 border_style="yellow"
             )
@@ -172,6 +176,9 @@ def recommend(target_type):
 @devices.command()
 def health():
     """Perform health check on all devices."""
+    from rich.panel import Panel
+    from rich.table import Table
+
     try:
         client = APIClient()
         response = client.perform_health_check()
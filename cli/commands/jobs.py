@@ -1,34 +1,126 @@
 import click
 from ..client import APIClient, APIError
-from ..utils.formatting import print_error
-from rich.console import Console
-from rich.table import Table
-from rich.panel import Panel
-from rich.text import Text
-from rich.progress import Progress, SpinnerColumn, TextColumn
+from ..utils.formatting import console, get_console, print_error
 import sys
-import requests
 import time
 from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
 
-console = Console()
+if TYPE_CHECKING:
+    from rich.table import Table
 
 @click.group()
 def jobs():
     """Job management and control commands."""
     pass
 
+def _jobs_table(title: str) -> "Table":
+    from rich.table import Table
+
+    table = Table(title=title)
+    table.add_column("ID", style="cyan", justify="center", width=6)
+    table.add_column("Priority", style="magenta", justify="center", width=8)
+    table.add_column("Status", style="yellow", justify="center", width=10)
+    table.add_column("Target", style="green", justify="center", width=8)
+    table.add_column("Org", style="blue", width=12)
+    table.add_column("App Version", style="blue", width=15)
+    table.add_column("Test File", style="white", width=25)
+    table.add_column("Created", style="dim", width=16)
+    table.add_column("Duration", style="cyan", width=8)
+    return table
+
+def _add_job_row(table: "Table", job: dict):
+    # Priority with visual indicator
+    job_priority = job.get('priority', 0)
+    if job_priority >= 4:
+        priority_display = f"🔥 {job_priority}"
+    elif job_priority >= 2:
+        priority_display = f"⚡ {job_priority}"
+    else:
+        priority_display = f"🐌 {job_priority}"
+    
+    # Status with color and icon
+    job_status = job.get('status', 'unknown').lower()
+    status_displays = {
+        'queued': '[yellow]⏳ QUEUED[/yellow]',
+        'running': '[blue]🔄 RUNNING[/blue]',
+        'completed': '[green]✅ DONE[/green]',
+        'failed': '[red]❌ FAILED[/red]',
+        'sharded': '[blue]🧩 SHARDED[/blue]'
+    }
+    status_display = status_displays.get(job_status, job_status.upper())
+    
+    # Truncate long fields
+    org_id = job.get('org_id', '')[:10] + ('...' if len(job.get('org_id', '')) > 10 else '')
+    app_version = job.get('app_version_id', '')[:13] + ('...' if len(job.get('app_version_id', '')) > 13 else '')
+    
+    test_path = job.get('test_path', '')
+    if '/' in test_path:
+        test_path = '.../' + test_path.split('/')[-1]
+    if len(test_path) > 23:
+        test_path = test_path[:20] + '...'
+    if job.get('shard_index'):
+        test_path += f" [{job['shard_index']}/{job['shard_count']}]"
+    
+    # Format times
+    created_at = job.get('created_at', '')
+    if 'T' in created_at:
+        try:
+            created_dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+            created_display = created_dt.strftime('%m-%d %H:%M:%S')
+        except:
+            created_display = created_at[:16]
+    else:
+        created_display = created_at[:16]
+    
+    # Calculate duration
+    duration = "N/A"
+    if created_at:
+        try:
+            created_dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+            updated_at = job.get('updated_at', created_at)
+            updated_dt = datetime.fromisoformat(updated_at.replace('Z', '+00:00'))
+            
+            if job_status in ['completed', 'failed']:
+                duration_sec = (updated_dt - created_dt).total_seconds()
+            else:
+                duration_sec = (datetime.now() - created_dt.replace(tzinfo=None)).total_seconds()
+            
+            if duration_sec < 60:
+                duration = f"{int(duration_sec)}s"
+            elif duration_sec < 3600:
+                duration = f"{int(duration_sec/60)}m"
+            else:
+                duration = f"{int(duration_sec/3600)}h"
+        except:
+            duration = "N/A"
+    
+    table.add_row(
+        str(job.get('id', '')),
+        priority_display,
+        status_display,
+        job.get('target', '').upper(),
+        org_id,
+        app_version,
+        test_path,
+        created_display,
+        duration
+    )
+
 @jobs.command()
 @click.option('--status-filter', type=click.Choice(['queued', 'running', 'completed', 'failed']), help='Filter by job status')
 @click.option('--priority', type=click.IntRange(1, 5), help='Filter by priority level (1-5)')
 @click.option('--target', type=click.Choice(['emulator', 'device', 'browserstack']), help='Filter by target environment')
 @click.option('--app-version-id', help='Filter by app version ID')
 @click.option('--org-id', help='Filter by organization ID')
-@click.option('--limit', type=int, default=50, help='Maximum number of jobs to show (default: 50)')
+@click.option('--limit', type=int, default=50, help='Maximum number of jobs to show, or page size with --all (default: 50)')
 @click.option('--sort', type=click.Choice(['created', 'priority', 'status']), default='created', help='Sort by field (default: created)')
 @click.option('--order', type=click.Choice(['asc', 'desc']), default='desc', help='Sort order (default: desc)')
-def list(status_filter, priority, target, app_version_id, org_id, limit, sort, order):
+@click.option('--all', 'all_pages', is_flag=True, help='Page through every matching job, fetching pages as they are shown')
+def list(status_filter, priority, target, app_version_id, org_id, limit, sort, order, all_pages):
     """List and filter jobs with advanced options."""
+    from rich.panel import Panel
+
     try:
         # Build query parameters
         params = {
@@ -47,19 +139,10 @@ def list(status_filter, priority, target, app_version_id, org_id, limit, sort, o
         if org_id:
             params['org_id'] = org_id
         
-        # Make API request
-        url = "http://localhost:8002/jobs"
-        response = requests.get(url, params=params)
-        
-        if response.status_code != 200:
-            print_error(f"Failed to get jobs: {response.text}")
-            return
-        
-        jobs = response.json()
-        
-        if not jobs:
-            console.print("[yellow]No jobs found matching the criteria.[/yellow]")
-            return
+        client = APIClient()
+        pages = client.iter_job_pages(params)
+        if not all_pages:
+            pages = [next(pages)]
         
         # Filter description
         filters = []
@@ -76,112 +159,44 @@ def list(status_filter, priority, target, app_version_id, org_id, limit, sort, o
         
         filter_text = f" (Filters: {', '.join(filters)})" if filters else ""
         
-        # Create table
-        table = Table(title=f"Jobs List - {len(jobs)} found{filter_text}")
-        table.add_column("ID", style="cyan", justify="center", width=6)
-        table.add_column("Priority", style="magenta", justify="center", width=8)
-        table.add_column("Status", style="yellow", justify="center", width=10)
-        table.add_column("Target", style="green", justify="center", width=8)
-        table.add_column("Org", style="blue", width=12)
-        table.add_column("App Version", style="blue", width=15)
-        table.add_column("Test File", style="white", width=25)
-        table.add_column("Created", style="dim", width=16)
-        table.add_column("Duration", style="cyan", width=8)
+        # Only running totals are kept, so --all works on any amount of history
+        status_counts = {}
+        priority_counts = {}
+        target_counts = {}
+        total = 0
         
-        for job in jobs:
-            # Priority with visual indicator
-            job_priority = job.get('priority', 0)
-            if job_priority >= 4:
-                priority_display = f"🔥 {job_priority}"
-            elif job_priority >= 2:
-                priority_display = f"⚡ {job_priority}"
-            else:
-                priority_display = f"🐌 {job_priority}"
-            
-            # Status with color and icon
-            job_status = job.get('status', 'unknown').lower()
-            status_displays = {
-                'queued': '[yellow]⏳ QUEUED[/yellow]',
-                'running': '[blue]🔄 RUNNING[/blue]',
-                'completed': '[green]✅ DONE[/green]',
-                'failed': '[red]❌ FAILED[/red]'
-            }
-            status_display = status_displays.get(job_status, job_status.upper())
-            
-            # Truncate long fields
-            org_id = job.get('org_id', '')[:10] + ('...' if len(job.get('org_id', '')) > 10 else '')
-            app_version = job.get('app_version_id', '')[:13] + ('...' if len(job.get('app_version_id', '')) > 13 else '')
-            
-            test_path = job.get('test_path', '')
-            if '/' in test_path:
-                test_path = '.../' + test_path.split('/')[-1]
-            if len(test_path) > 23:
-                test_path = test_path[:20] + '...'
+        for page_number, jobs in enumerate(pages, 1):
+            if not jobs:
+                break
+            total += len(jobs)
             
-            # Format times
-            created_at = job.get('created_at', '')
-            if 'T' in created_at:
-                try:
-                    created_dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                    created_display = created_dt.strftime('%m-%d %H:%M:%S')
-                except:
-                    created_display = created_at[:16]
+            if all_pages:
+                title = f"Jobs List - page {page_number}, {total} so far{filter_text}"
             else:
-                created_display = created_at[:16]
-            
-            # Calculate duration
-            duration = "N/A"
-            if created_at:
-                try:
-                    created_dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                    updated_at = job.get('updated_at', created_at)
-                    updated_dt = datetime.fromisoformat(updated_at.replace('Z', '+00:00'))
-                    
-                    if job_status in ['completed', 'failed']:
-                        duration_sec = (updated_dt - created_dt).total_seconds()
-                    else:
-                        duration_sec = (datetime.now() - created_dt.replace(tzinfo=None)).total_seconds()
-                    
-                    if duration_sec < 60:
-                        duration = f"{int(duration_sec)}s"
-                    elif duration_sec < 3600:
-                        duration = f"{int(duration_sec/60)}m"
-                    else:
-                        duration = f"{int(duration_sec/3600)}h"
-                except:
-                    duration = "N/A"
+                title = f"Jobs List - {len(jobs)} found{filter_text}"
+            table = _jobs_table(title)
+            for job in jobs:
+                _add_job_row(table, job)
+                
+                status = job.get('status', 'unknown')
+                job_priority = job.get('priority', 0)
+                job_target = job.get('target', 'unknown')
+                status_counts[status] = status_counts.get(status, 0) + 1
+                priority_counts[job_priority] = priority_counts.get(job_priority, 0) + 1
+                target_counts[job_target] = target_counts.get(job_target, 0) + 1
             
-            table.add_row(
-                str(job.get('id', '')),
-                priority_display,
-                status_display,
-                job.get('target', '').upper(),
-                org_id,
-                app_version,
-                test_path,
-                created_display,
-                duration
-            )
+            console.print(table)
         
-        console.print(table)
-        
-        # Summary statistics
-        status_counts = {}
-        priority_counts = {}
-        target_counts = {}
-        for job in jobs:
-            status = job.get('status', 'unknown')
-            priority = job.get('priority', 0)
-            target = job.get('target', 'unknown')
-            
-            status_counts[status] = status_counts.get(status, 0) + 1
-            priority_counts[priority] = priority_counts.get(priority, 0) + 1
-            target_counts[target] = target_counts.get(target, 0) + 1
+        if not total:
+            console.print("[yellow]No jobs found matching the criteria.[/yellow]")
+            return
         
         # Summary panel
         summary_text = f"[bold white]Status Distribution:[/] {dict(status_counts)}\n"
         summary_text += f"[bold white]Priority Distribution:[/] {dict(sorted(priority_counts.items(), reverse=True))}\n"
         summary_text += f"[bold white]Target Distribution:[/] {dict(target_counts)}"
+        if all_pages:
+            summary_text += f"\n[bold white]Total Jobs:[/] {total}"
         
         summary_panel = Panel.fit(
             summary_text,
@@ -190,8 +205,8 @@ def list(status_filter, priority, target, app_version_id, org_id, limit, sort, o
         )
         console.print(summary_panel)
         
-    except requests.exceptions.RequestException as e:
-        print_error(f"Connection error: {str(e)}")
+    except APIError as ae:
+        print_error(f"Failed to get jobs: {str(ae)}")
         sys.exit(1)
     except Exception as e:
         print_error(f"Error listing jobs: {str(e)}")
@@ -207,13 +222,7 @@ def recent(priority, limit):
         if priority:
             params['priority'] = priority
         
-        response = requests.get("http://localhost:8002/jobs", params=params)
-        
-        if response.status_code != 200:
-            print_error(f"Failed to get recent jobs: {response.text}")
-            return
-        
-        jobs = response.json()
+        jobs = APIClient().list_jobs(params)
         
         if not jobs:
             console.print("[yellow]No recent jobs found.[/yellow]")
@@ -272,8 +281,8 @@ def recent(priority, limit):
             
             console.print(f"{i:2}. {status_icon} Job {job.get('id', '')} - {priority_icon}[{priority_color}]P{job_priority}[/{priority_color}] - {job_status.upper()} - {test_path} ({time_ago})")
         
-    except requests.exceptions.RequestException as e:
-        print_error(f"Connection error: {str(e)}")
+    except APIError as ae:
+        print_error(f"Failed to get recent jobs: {str(ae)}")
         sys.exit(1)
     except Exception as e:
         print_error(f"Error getting recent jobs: {str(e)}")
@@ -321,7 +330,7 @@ def cancel(job_id, force):
                 return
         
         # Make cancellation request
-        response = requests.delete(f"http://localhost:8002/jobs/{job_id}")
+        response = client.cancel_job(job_id)
         
         if response.status_code == 200:
             console.print(f"[green]✅ Job {job_id} has been cancelled successfully.[/green]")
@@ -336,121 +345,179 @@ def cancel(job_id, force):
     except APIError as ae:
         print_error(str(ae))
         sys.exit(1)
-    except requests.exceptions.RequestException as e:
-        print_error(f"Connection error: {str(e)}")
-        sys.exit(1)
     except Exception as e:
         print_error(f"Error cancelling job: {str(e)}")
         sys.exit(1)
 
 @jobs.command()
-@click.option('--watch', '-w', is_flag=True, help='Watch job activity in real-time')
-@click.option('--priority', type=click.IntRange(1, 5), help='Filter by priority level')
-def active(watch, priority):
-    """Show currently active (queued + running) jobs."""
-    def display_active():
-        try:
-            params = {'status': 'queued,running'}
-            if priority:
-                params['priority'] = priority
-            
-            response = requests.get("http://localhost:8002/jobs", params=params)
-            
-            if response.status_code != 200:
-                print_error(f"Failed to get active jobs: {response.text}")
-                return False
-            
-            jobs = response.json()
-            
-            if watch:
-                console.clear()
-            
-            title = "🔄 Active Jobs"
-            if priority:
-                title += f" (Priority {priority})"
-            if watch:
-                title += " (Live)"
+@click.argument('job_id', type=int)
+def shards(job_id):
+    """Show the shards of a sharded job and its rolled-up status."""
+    try:
+        client = APIClient()
+        result = client.get_job_shards(job_id)
+
+        counts = ", ".join(f"{count} {status}" for status, count in result['shards'].items() if count)
+        console.print(f"\n[bold]Job {job_id}:[/bold] {result['status'].upper()} "
+                      f"({result['shard_count']} shards: {counts or 'none'})")
+        table = _jobs_table(f"Shards of job {job_id}")
+        for shard in result['jobs']:
+            _add_job_row(table, shard)
+        console.print(table)
+
+    except APIError as ae:
+        print_error(f"Failed to get shards: {str(ae)}")
+        sys.exit(1)
+    except Exception as e:
+        print_error(f"Error getting shards: {str(e)}")
+        sys.exit(1)
+
+def _render_active(jobs, priority, live):
+    """Build the active jobs view (queued + running) as one renderable."""
+    from rich.console import Group
+
+    lines = []
+    
+    title = "🔄 Active Jobs"
+    if priority:
+        title += f" (Priority {priority})"
+    if live:
+        title += " (Live)"
+    
+    lines.append(f"[bold blue]{title}[/bold blue]\n")
+    
+    if not jobs:
+        lines.append("[dim]No active jobs found.[/dim]")
+    
+    # Separate queued and running
+    queued_jobs = [j for j in jobs if j.get('status', '').lower() == 'queued']
+    running_jobs = [j for j in jobs if j.get('status', '').lower() == 'running']
+    
+    # Running jobs
+    if running_jobs:
+        lines.append("[bold green]🔄 Currently Running:[/bold green]")
+        for job in sorted(running_jobs, key=lambda x: -x.get('priority', 0)):
+            job_priority = job.get('priority', 0)
+            priority_icon = "🔥" if job_priority >= 4 else "⚡" if job_priority >= 2 else "🐌"
             
-            console.print(f"[bold blue]{title}[/bold blue]\n")
+            test_path = job.get('test_path', '')
+            if '/' in test_path:
+                test_path = test_path.split('/')[-1]
             
-            if not jobs:
-                console.print("[dim]No active jobs found.[/dim]")
-                return True
+            device = job.get('assigned_device_name') or 'No device'
             
-            # Separate queued and running
-            queued_jobs = [j for j in jobs if j.get('status', '').lower() == 'queued']
-            running_jobs = [j for j in jobs if j.get('status', '').lower() == 'running']
+            lines.append(f"  {priority_icon} Job {job.get('id', '')} (P{job_priority}) - {test_path} on {device}")
+        
+        lines.append("")
+    
+    # Queued jobs
+    if queued_jobs:
+        lines.append("[bold yellow]⏳ Waiting in Queue:[/bold yellow]")
+        for job in sorted(queued_jobs, key=lambda x: -x.get('priority', 0)):
+            job_priority = job.get('priority', 0)
+            priority_icon = "🔥" if job_priority >= 4 else "⚡" if job_priority >= 2 else "🐌"
             
-            # Running jobs
-            if running_jobs:
-                console.print("[bold green]🔄 Currently Running:[/bold green]")
-                for job in sorted(running_jobs, key=lambda x: -x.get('priority', 0)):
-                    job_priority = job.get('priority', 0)
-                    priority_icon = "🔥" if job_priority >= 4 else "⚡" if job_priority >= 2 else "🐌"
-                    
-                    test_path = job.get('test_path', '')
-                    if '/' in test_path:
-                        test_path = test_path.split('/')[-1]
-                    
-                    device = job.get('assigned_device_name', 'No device')
-                    
-                    console.print(f"  {priority_icon} Job {job.get('id', '')} (P{job_priority}) - {test_path} on {device}")
-                
-                console.print()
+            test_path = job.get('test_path', '')
+            if '/' in test_path:
+                test_path = test_path.split('/')[-1]
             
-            # Queued jobs
-            if queued_jobs:
-                console.print("[bold yellow]⏳ Waiting in Queue:[/bold yellow]")
-                for job in sorted(queued_jobs, key=lambda x: -x.get('priority', 0)):
-                    job_priority = job.get('priority', 0)
-                    priority_icon = "🔥" if job_priority >= 4 else "⚡" if job_priority >= 2 else "🐌"
-                    
-                    test_path = job.get('test_path', '')
-                    if '/' in test_path:
-                        test_path = test_path.split('/')[-1]
-                    
-                    # Show time in queue
-                    created_at = job.get('created_at', '')
-                    queue_time = ""
-                    if created_at:
-                        try:
-                            created_dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                            now = datetime.now()
-                            delta = now - created_dt.replace(tzinfo=None)
-                            
-                            if delta.total_seconds() < 60:
-                                queue_time = f" ({int(delta.total_seconds())}s in queue)"
-                            else:
-                                queue_time = f" ({int(delta.total_seconds()/60)}m in queue)"
-                        except:
-                            pass
+            # Show time in queue
+            created_at = job.get('created_at', '')
+            queue_time = ""
+            if created_at:
+                try:
+                    created_dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+                    now = datetime.now()
+                    delta = now - created_dt.replace(tzinfo=None)
                     
-                    console.print(f"  {priority_icon} Job {job.get('id', '')} (P{job_priority}) - {test_path}{queue_time}")
-            
-            # Summary
-            total_active = len(jobs)
-            console.print(f"\n[dim]Total active: {total_active} ({len(running_jobs)} running, {len(queued_jobs)} queued)[/dim]")
-            
-            if watch:
-                console.print(f"[dim]Updated: {datetime.now().strftime('%H:%M:%S')} | Press Ctrl+C to stop[/dim]")
-            
-            return True
+                    if delta.total_seconds() < 60:
+                        queue_time = f" ({int(delta.total_seconds())}s in queue)"
+                    else:
+                        queue_time = f" ({int(delta.total_seconds()/60)}m in queue)"
+                except:
+                    pass
             
-        except Exception as e:
-            print_error(f"Error getting active jobs: {str(e)}")
-            return False
+            lines.append(f"  {priority_icon} Job {job.get('id', '')} (P{job_priority}) - {test_path}{queue_time}")
+    
+    # Summary
+    if jobs:
+        lines.append(f"\n[dim]Total active: {len(jobs)} ({len(running_jobs)} running, {len(queued_jobs)} queued)[/dim]")
+    
+    if live:
+        lines.append(f"[dim]Updated: {datetime.now().strftime('%H:%M:%S')} | Press Ctrl+C to stop[/dim]")
+    
+    return Group(*lines)
+
+def _apply_job_event(jobs, event, priority=None):
+    """Update the active jobs (keyed by id) in place from a pushed job event."""
+    job_id = event['job_id']
+    if event['status'] not in ('queued', 'running') or (priority and event.get('priority') != priority):
+        jobs.pop(job_id, None)
+        return
+    
+    job = jobs.setdefault(job_id, {
+        'id': job_id,
+        # Server timestamps are UTC, like created_at from the API
+        'created_at': datetime.utcfromtimestamp(event.get('timestamp', time.time())).isoformat()
+    })
+    job.update({
+        'status': event['status'],
+        'priority': event.get('priority', 0),
+        'test_path': event.get('test_path', ''),
+        'assigned_device_name': event.get('assigned_device_name')
+    })
+
+@jobs.command()
+@click.option('--watch', '-w', is_flag=True, help='Watch job activity in real-time')
+@click.option('--priority', type=click.IntRange(1, 5), help='Filter by priority level')
+def active(watch, priority):
+    """Show currently active (queued + running) jobs."""
+    from rich.live import Live
+
+    client = APIClient()
+    params = {'status': 'queued,running'}
+    if priority:
+        params['priority'] = priority
+    
+    def fetch_active():
+        return client.list_jobs(params)
+    
+    def watch_events():
+        """Push mode: subscribe to GET /events, take one snapshot, then apply job events."""
+        stream = client.stream_events(['job'])
+        # The first keep-alive arrives once the subscription is active, so no
+        # change made after the snapshot below can be missed
+        next(stream)
+        active_jobs = {job['id']: job for job in fetch_active()}
+        with Live(_render_active(list(active_jobs.values()), priority, True), console=get_console(),
+                  refresh_per_second=4) as live:
+            for event in stream:
+                if event:
+                    _apply_job_event(active_jobs, event, priority)
+                live.update(_render_active(list(active_jobs.values()), priority, True))
+    
+    def poll():
+        """Polling fallback for servers without the event stream."""
+        while True:
+            console.clear()
+            console.print(_render_active(fetch_active(), priority, True))
+            time.sleep(3)
     
     try:
         if watch:
-            while True:
-                if not display_active():
-                    break
-                time.sleep(3)
+            try:
+                watch_events()
+            except APIError as ae:
+                console.print(f"[dim]Live updates unavailable ({ae}); polling every 3s[/dim]")
+                poll()
         else:
-            display_active()
+            console.print(_render_active(fetch_active(), priority, False))
             
     except KeyboardInterrupt:
         console.print("\n[dim]Monitoring stopped.[/dim]")
+    except APIError as ae:
+        print_error(f"Error getting active jobs: {str(ae)}")
+        sys.exit(1)
     except Exception as e:
         print_error(f"Error in active jobs monitor: {str(e)}")
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
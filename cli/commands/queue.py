@@ -1,14 +1,9 @@
 import click
 from ..client import APIClient, APIError
-from ..utils.formatting import print_error
-from rich.console import Console
-from rich.table import Table
-from rich.panel import Panel
-from rich.text import Text
+from ..utils.formatting import console, get_console, print_error
 import sys
-import requests
-
-console = Console()
+import time
+from datetime import datetime
 
 @click.group()
 def queue():
@@ -18,14 +13,12 @@ def queue():
 @queue.command()
 def status():
     """Show current queue status across all priority levels."""
+    from rich.panel import Panel
+    from rich.table import Table
+
     try:
         # Get queue status from the API
-        response = requests.get("http://localhost:8002/queues/status")
-        if response.status_code != 200:
-            print_error(f"Failed to get queue status: {response.text}")
-            return
-        
-        data = response.json()
+        data = APIClient().get_queue_status()
         
         # Queue Summary Panel
         queue_summary = data.get('queue_summary', {})
@@ -99,8 +92,8 @@ def status():
         timestamp = data.get('timestamp', 'Unknown')
         console.print(f"\n[dim]Last updated: {timestamp}[/dim]")
         
-    except requests.exceptions.RequestException as e:
-        print_error(f"Connection error: {str(e)}")
+    except APIError as ae:
+        print_error(f"Failed to get queue status: {str(ae)}")
         sys.exit(1)
     except Exception as e:
         print_error(f"Error getting queue status: {str(e)}")
@@ -109,14 +102,11 @@ def status():
 @queue.command()
 def info():
     """Show priority queue configuration and routing information."""
+    from rich.table import Table
+
     try:
         # Get priority queue info
-        response = requests.get("http://localhost:8002/queues/priority-info")
-        if response.status_code != 200:
-            print_error(f"Failed to get priority info: {response.text}")
-            return
-        
-        data = response.json()
+        data = APIClient().get_priority_info()
         priority_queues = data.get('priority_queues', {})
         
         # Priority Mapping Table
@@ -166,111 +156,142 @@ def info():
         status_color = "green" if status == "active" else "red"
         console.print(f"\n[bold]Status:[/bold] [{status_color}]{status.upper()}[/{status_color}]")
         
-    except requests.exceptions.RequestException as e:
-        print_error(f"Connection error: {str(e)}")
+    except APIError as ae:
+        print_error(f"Failed to get priority info: {str(ae)}")
         sys.exit(1)
     except Exception as e:
         print_error(f"Error getting priority info: {str(e)}")
         sys.exit(1)
 
+def _render_monitor(data, live):
+    """Build the queue monitor view from /queues/status data."""
+    from rich.console import Group
+    from rich.panel import Panel
+    from rich.table import Table
+    from rich.text import Text
+
+    # Title
+    title = Text("🔍 Queue Monitor", style="bold blue")
+    if live:
+        title.append(" (Live)", style="dim")
+    
+    # Real-time queue metrics
+    queue_summary = data.get('queue_summary', {})
+    
+    # Quick stats panel
+    total_queued = sum(stats.get('queued_jobs', 0) for stats in queue_summary.values())
+    total_running = sum(stats.get('running_jobs', 0) for stats in queue_summary.values())
+    total_active = total_queued + total_running
+    
+    metrics_panel = Panel.fit(
+        f"[bold white]Total Active Jobs:[/] {total_active}\n"
+        f"[bold yellow]Queued:[/] {total_queued}\n"
+        f"[bold blue]Running:[/] {total_running}",
+        title="[bold green]Live Metrics",
+        border_style="green"
+    )
+    
+    # Queue activity table
+    table = Table(title="Queue Activity")
+    table.add_column("Queue", style="cyan")
+    table.add_column("Queued", style="yellow", justify="center") 
+    table.add_column("Running", style="blue", justify="center")
+    table.add_column("Total", style="magenta", justify="center")
+    table.add_column("Status", style="green", justify="center")
+    
+    for queue_name, stats in queue_summary.items():
+        queue_display = queue_name.replace('_', ' ').title()
+        queued = stats.get('queued_jobs', 0)
+        running = stats.get('running_jobs', 0)
+        total = queued + running
+        
+        # Status indicator
+        if total == 0:
+            status = "[green]Idle[/green]"
+        elif queued > running:
+            status = "[yellow]Backlog[/yellow]"
+        else:
+            status = "[blue]Active[/blue]"
+        
+        table.add_row(
+            queue_display,
+            str(queued),
+            str(running), 
+            str(total),
+            status
+        )
+    
+    # Last updated
+    timestamp = data.get('timestamp', 'Unknown')
+    return Group(title, "", metrics_panel, table, f"\n[dim]Updated: {timestamp}[/dim]")
+
+def _apply_job_event(data, event):
+    """
+    Adjust /queues/status counts in place for a pushed job event: the job
+    leaves its previous status and enters its new one.
+    """
+    stats = data.get('priority_breakdown', {}).get(f"priority_{event.get('priority')}")
+    if not stats:
+        return
+    summary = data.get('queue_summary', {}).get(stats.get('queue_name'), {})
+    
+    for status, delta in ((event.get('previous_status'), -1), (event.get('status'), 1)):
+        key = {'queued': 'queued_jobs', 'running': 'running_jobs'}.get(status)
+        if not key:
+            continue
+        for counts in (stats, summary):
+            counts[key] = max(0, counts.get(key, 0) + delta)
+            counts['total_active'] = counts.get('queued_jobs', 0) + counts.get('running_jobs', 0)
+    
+    data['timestamp'] = datetime.utcfromtimestamp(event.get('timestamp', time.time())).isoformat()
+
 @queue.command()
-@click.option('--watch', '-w', is_flag=True, help='Watch queue status in real-time (refresh every 5 seconds)')
+@click.option('--watch', '-w', is_flag=True, help='Watch queue status in real-time (live updates pushed by the server)')
 def monitor(watch):
     """Monitor queue activity and job flow."""
-    import time
+    from rich.live import Live
+
+    client = APIClient()
     
-    def display_monitor():
-        try:
-            # Clear screen for watch mode
-            if watch:
-                console.clear()
-            
-            # Get queue status
-            response = requests.get("http://localhost:8002/queues/status")
-            if response.status_code != 200:
-                print_error(f"Failed to get queue status: {response.text}")
-                return False
-            
-            data = response.json()
-            
-            # Title
-            title = Text("🔍 Queue Monitor", style="bold blue")
-            if watch:
-                title.append(" (Live)", style="dim")
-            console.print(title)
-            console.print()
-            
-            # Real-time queue metrics
-            queue_summary = data.get('queue_summary', {})
-            
-            # Quick stats panel
-            total_queued = sum(stats.get('queued_jobs', 0) for stats in queue_summary.values())
-            total_running = sum(stats.get('running_jobs', 0) for stats in queue_summary.values())
-            total_active = total_queued + total_running
-            
-            metrics_panel = Panel.fit(
-                f"[bold white]Total Active Jobs:[/] {total_active}\n"
-                f"[bold yellow]Queued:[/] {total_queued}\n"
-                f"[bold blue]Running:[/] {total_running}",
-                title="[bold green]Live Metrics",
-                border_style="green"
-            )
-            console.print(metrics_panel)
-            
-            # Queue activity table
-            table = Table(title="Queue Activity")
-            table.add_column("Queue", style="cyan")
-            table.add_column("Queued", style="yellow", justify="center") 
-            table.add_column("Running", style="blue", justify="center")
-            table.add_column("Total", style="magenta", justify="center")
-            table.add_column("Status", style="green", justify="center")
-            
-            for queue_name, stats in queue_summary.items():
-                queue_display = queue_name.replace('_', ' ').title()
-                queued = stats.get('queued_jobs', 0)
-                running = stats.get('running_jobs', 0)
-                total = queued + running
-                
-                # Status indicator
-                if total == 0:
-                    status = "[green]Idle[/green]"
-                elif queued > running:
-                    status = "[yellow]Backlog[/yellow]"
-                else:
-                    status = "[blue]Active[/blue]"
-                
-                table.add_row(
-                    queue_display,
-                    str(queued),
-                    str(running), 
-                    str(total),
-                    status
-                )
-            
-            console.print(table)
-            
-            # Last updated
-            timestamp = data.get('timestamp', 'Unknown')
-            console.print(f"\n[dim]Updated: {timestamp}[/dim]")
-            
-            return True
-            
-        except Exception as e:
-            print_error(f"Monitor error: {str(e)}")
-            return False
+    def watch_events():
+        """Push mode: subscribe to GET /events, take one snapshot, then apply job events."""
+        stream = client.stream_events(['job'])
+        # The first keep-alive arrives once the subscription is active, so no
+        # change made after the snapshot below can be missed
+        next(stream)
+        data = client.get_queue_status()
+        # Counts are deltas: skip events the snapshot already includes
+        taken = (datetime.fromisoformat(data['timestamp']) - datetime(1970, 1, 1)).total_seconds()
+        with Live(_render_monitor(data, True), console=get_console(), refresh_per_second=4) as live:
+            for event in stream:
+                if event and event.get('timestamp', taken) >= taken:
+                    _apply_job_event(data, event)
+                    live.update(_render_monitor(data, True))
+    
+    def poll():
+        """Polling fallback for servers without the event stream."""
+        while True:
+            data = client.get_queue_status()
+            console.clear()
+            console.print(_render_monitor(data, True))
+            time.sleep(5)
     
     try:
         if watch:
             console.print("[dim]Press Ctrl+C to stop monitoring...[/dim]\n")
-            while True:
-                if not display_monitor():
-                    break
-                time.sleep(5)
+            try:
+                watch_events()
+            except APIError as ae:
+                console.print(f"[dim]Live updates unavailable ({ae}); polling every 5s[/dim]")
+                poll()
         else:
-            display_monitor()
+            console.print(_render_monitor(client.get_queue_status(), False))
             
     except KeyboardInterrupt:
         console.print("\n[dim]Monitoring stopped.[/dim]")
+    except APIError as ae:
+        print_error(f"Monitor error: {str(ae)}")
+        sys.exit(1)
     except Exception as e:
         print_error(f"Error in monitor: {str(e)}")
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
@@ -1,14 +1,7 @@
 import click
-from ..client import APIClient, APIError
-from ..utils.formatting import print_error
-from rich.console import Console
-from rich.table import Table
-from rich.panel import Panel
-from rich.text import Text
+from ..client import APIClient, APIError, run_concurrently
+from ..utils.formatting import console, print_error
 import sys
-import requests
-
-console = Console()
 
 @click.group()
 def status():
@@ -20,6 +13,8 @@ def status():
 @click.option('--verbose', '-v', is_flag=True, help='Show detailed information including priority and device allocation')
 def job_status(job_id, verbose):
     """Check the status of a specific job."""
+    from rich.panel import Panel
+
     try:
         client = APIClient()
         result = client.get_job_status(job_id)
@@ -100,6 +95,8 @@ def job_status(job_id, verbose):
 @click.option('--limit', type=int, default=20, help='Maximum number of jobs to show (default: 20)')
 def list_jobs(app_version_id, status_filter, priority, target, limit):
     """List jobs with optional filtering."""
+    from rich.table import Table
+
     try:
         # Build query parameters
         params = {}
@@ -114,14 +111,7 @@ def list_jobs(app_version_id, status_filter, priority, target, limit):
         params['limit'] = limit
         
         # Make API request
-        url = "http://localhost:8002/jobs"
-        response = requests.get(url, params=params)
-        
-        if response.status_code != 200:
-            print_error(f"Failed to get jobs: {response.text}")
-            return
-        
-        jobs = response.json()
+        jobs = APIClient().list_jobs(params)
         
         if not jobs:
             console.print("[yellow]No jobs found matching the criteria.[/yellow]")
@@ -195,8 +185,8 @@ def list_jobs(app_version_id, status_filter, priority, target, limit):
         console.print(f"Status: {dict(status_counts)}")
         console.print(f"Priority: {dict(sorted(priority_counts.items(), reverse=True))}")
         
-    except requests.exceptions.RequestException as e:
-        print_error(f"Connection error: {str(e)}")
+    except APIError as ae:
+        print_error(f"Failed to get jobs: {str(ae)}")
         sys.exit(1)
     except Exception as e:
         print_error(f"Error listing jobs: {str(e)}")
@@ -205,16 +195,19 @@ def list_jobs(app_version_id, status_filter, priority, target, limit):
 @status.command(name="summary")
 def summary():
     """Show overall system status summary."""
+    from rich.panel import Panel
+
     try:
-        # Get queue status
-        queue_response = requests.get("http://localhost:8002/queues/status")
-        device_response = requests.get("http://localhost:8002/devices/status")
+        # Get queue and device status at the same time over the shared connection pool
+        client = APIClient()
+        queue_data, device_data = run_concurrently(client.get_queue_status, client.get_device_status)
+        if isinstance(queue_data, APIError) and isinstance(device_data, APIError):
+            raise queue_data
         
         console.print("[bold blue]📊 System Status Summary[/bold blue]\n")
         
         # Queue Status
-        if queue_response.status_code == 200:
-            queue_data = queue_response.json()
+        if not isinstance(queue_data, Exception):
             queue_summary = queue_data.get('queue_summary', {})
             
             total_queued = sum(stats.get('queued_jobs', 0) for stats in queue_summary.values())
@@ -230,9 +223,7 @@ def summary():
             console.print(queue_panel)
         
         # Device Status  
-        if device_response.status_code == 200:
-            device_data = device_response.json()
-            
+        if not isinstance(device_data, Exception):
             available = device_data.get('available_devices', 0)
             busy = device_data.get('busy_devices', 0)
             offline = device_data.get('offline_devices', 0)
@@ -256,7 +247,7 @@ def summary():
                     console.print(f"  {device_type.title()}: {stats.get('available', 0)} available, {stats.get('busy', 0)} busy")
         
         # Priority allocation
-        if queue_response.status_code == 200:
+        if not isinstance(queue_data, Exception):
             priority_breakdown = queue_data.get('priority_breakdown', {})
             active_priorities = {k: v for k, v in priority_breakdown.items() if v.get('total_active', 0) > 0}
             
@@ -273,8 +264,8 @@ def summary():
                         icon = "🐌"
                     console.print(f"  {icon} Priority {priority_num}: {stats.get('total_active', 0)} jobs")
         
-    except requests.exceptions.RequestException as e:
-        print_error(f"Connection error: {str(e)}")
+    except APIError as ae:
+        print_error(f"Connection error: {str(ae)}")
         sys.exit(1)
     except Exception as e:
         print_error(f"Error getting summary: {str(e)}")
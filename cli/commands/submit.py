@@ -1,23 +1,53 @@
 import click
-from ..client import APIClient, APIError
-from ..utils.formatting import format_job_submission, format_job_result, print_error, print_success
+from ..client import APIClient, APIError, run_concurrently
+from ..utils.formatting import format_job_submission, format_job_result, format_bulk_submission_summary, print_error
 from ..utils.validation import validate_test_file
+from ..utils.manifest import load_manifest, expand_test_glob, chunked
 import sys
 
 # Valid target environments
 VALID_TARGETS = ['emulator', 'device', 'browserstack']
 
 @click.command()
-@click.option('--org-id', required=True, help='Organization ID')
-@click.option('--app-version-id', required=True, help='Application version ID')
-@click.option('--test', required=True, help='Path to test file')
+@click.option('--org-id', help='Organization ID')
+@click.option('--app-version-id', help='Application version ID')
+@click.option('--test', help='Path to test file')
+@click.option('--from-manifest', 'manifest', type=click.Path(exists=True, dir_okay=False),
+              help='Submit every job listed in a YAML/JSON manifest')
+@click.option('--test-glob', help="Submit one job per file matching a glob, e.g. 'tests/**/*.spec.js'")
+@click.option('--chunk-size', type=click.IntRange(1, 1000), default=200,
+              help='Jobs per bulk request in manifest/glob mode (default: 200)')
 @click.option('--priority', type=int, default=1, help='Job priority (1-5, default: 1)')
 @click.option('--target', type=click.Choice(VALID_TARGETS), default='emulator',
               help='Target environment for test execution')
+@click.option('--shard', 'shards', default='1', metavar='N|auto',
+              help='Split the test file into N shards run on separate devices (auto: from its past runtimes)')
 @click.option('--show-queue-info', is_flag=True, help='Show priority queue information after submission')
-def submit(org_id, app_version_id, test, priority, target, show_queue_info):
+def submit(org_id, app_version_id, test, manifest, test_glob, chunk_size, priority, target, shards, show_queue_info):
     """Submit a test job for execution with priority scheduling."""
+    sources = [option for option in (test, manifest, test_glob) if option]
+    if len(sources) != 1:
+        print_error("Specify exactly one of --test, --from-manifest or --test-glob")
+        sys.exit(1)
+
+    if shards != 'auto':
+        try:
+            shards = int(shards)
+        except ValueError:
+            print_error("--shard must be a number of shards or 'auto'")
+            sys.exit(1)
+    if shards != 1 and not test:
+        print_error("--shard can only be used with --test")
+        sys.exit(1)
+
+    if manifest or test_glob:
+        submit_batch(org_id, app_version_id, manifest, test_glob, chunk_size, priority, target)
+        return
+
     try:
+        if not org_id or not app_version_id:
+            raise ValueError("--org-id and --app-version-id are required")
+
         # Validate priority
         if not 1 <= priority <= 5:
             raise ValueError("Priority must be between 1 and 5")
@@ -39,7 +69,8 @@ def submit(org_id, app_version_id, test, priority, target, show_queue_info):
             app_version_id=app_version_id,
             test_path=test_path,
             priority=priority,
-            target=target
+            target=target,
+            shards=shards
         )
         
         # Show the result with priority info
@@ -50,6 +81,10 @@ def submit(org_id, app_version_id, test, priority, target, show_queue_info):
             priority=priority
         )
 
+        if result.get('shard_job_ids'):
+            click.echo(f"\n🧩 Split into {result['shard_count']} shards: jobs {result['shard_job_ids']} "
+                       f"(follow them with 'qgjob jobs shards {result['job_id']}')")
+
         # Show priority queue routing info
         if priority >= 4:
             queue_name = "High Priority Queue"
@@ -64,60 +99,54 @@ def submit(org_id, app_version_id, test, priority, target, show_queue_info):
         click.echo(f"\n[bold blue]Queue Routing:[/bold blue] {queue_desc}")
         click.echo(f"[dim]Routed to: {queue_name}[/dim]")
 
-        # Try to get grouped jobs with enhanced display
-        try:
-            grouped_jobs = client.get_grouped_jobs(app_version_id)
-            if grouped_jobs and len(grouped_jobs) > 1:
-                click.echo(f"\n[bold]Other jobs in this group ({app_version_id}):[/bold]")
-                
-                # Sort by priority and creation time
-                sorted_jobs = sorted(grouped_jobs, key=lambda x: (-x.get('priority', 0), x.get('created_at', '')))
-                
-                for job in sorted_jobs:
-                    if job['job_id'] != result['job_id']:  # Don't show the job we just created
-                        job_priority = job.get('priority', 0)
-                        
-                        # Priority indicator
-                        if job_priority >= 4:
-                            priority_icon = "🔥"
-                        elif job_priority >= 2:
-                            priority_icon = "⚡"
-                        else:
-                            priority_icon = "🐌"
-                        
-                        # Status indicator
-                        status = job.get('status', 'unknown').lower()
-                        if status == 'completed':
-                            status_icon = "✅"
-                        elif status == 'running':
-                            status_icon = "🔄"
-                        elif status == 'failed':
-                            status_icon = "❌"
-                        else:
-                            status_icon = "⏳"
-                        
-                        click.echo(f"  • {status_icon} Job {job['job_id']} - {priority_icon}P{job_priority} - {job['status'].upper()}")
-        except Exception:
-            # Silently ignore if we can't get grouped jobs
-            pass
-
-        # Show queue info if requested
+        # The group listing and queue status are independent: fetch them at the
+        # same time over the connection the submission already opened
+        calls = [lambda: client.get_grouped_jobs(app_version_id)]
         if show_queue_info:
-            try:
-                import requests
-                response = requests.get("http://localhost:8002/queues/status")
-                if response.status_code == 200:
-                    data = response.json()
-                    queue_summary = data.get('queue_summary', {})
+            calls.append(client.get_queue_status)
+        grouped_jobs, *queue_data = run_concurrently(*calls)
+
+        # Show grouped jobs with enhanced display (silently skipped if unavailable)
+        if not isinstance(grouped_jobs, Exception) and grouped_jobs and len(grouped_jobs) > 1:
+            click.echo(f"\n[bold]Other jobs in this group ({app_version_id}):[/bold]")
+            
+            # Sort by priority and creation time
+            sorted_jobs = sorted(grouped_jobs, key=lambda x: (-x.get('priority', 0), x.get('created_at', '')))
+            
+            for job in sorted_jobs:
+                if job['job_id'] != result['job_id']:  # Don't show the job we just created
+                    job_priority = job.get('priority', 0)
+                    
+                    # Priority indicator
+                    if job_priority >= 4:
+                        priority_icon = "🔥"
+                    elif job_priority >= 2:
+                        priority_icon = "⚡"
+                    else:
+                        priority_icon = "🐌"
                     
-                    click.echo(f"\n[bold blue]📊 Current Queue Status:[/bold blue]")
-                    for queue_name, stats in queue_summary.items():
-                        if stats.get('total_active', 0) > 0:
-                            queue_display = queue_name.replace('_', ' ').title()
-                            click.echo(f"  • {queue_display}: {stats.get('total_active', 0)} active jobs")
-            except:
-                # Silently ignore queue status errors
-                pass
+                    # Status indicator
+                    status = job.get('status', 'unknown').lower()
+                    if status == 'completed':
+                        status_icon = "✅"
+                    elif status == 'running':
+                        status_icon = "🔄"
+                    elif status == 'failed':
+                        status_icon = "❌"
+                    else:
+                        status_icon = "⏳"
+                    
+                    click.echo(f"  • {status_icon} Job {job['job_id']} - {priority_icon}P{job_priority} - {job['status'].upper()}")
+
+        # Show queue info if requested (silently skipped if unavailable)
+        if queue_data and not isinstance(queue_data[0], Exception):
+            queue_summary = queue_data[0].get('queue_summary', {})
+            
+            click.echo(f"\n[bold blue]📊 Current Queue Status:[/bold blue]")
+            for queue_name, stats in queue_summary.items():
+                if stats.get('total_active', 0) > 0:
+                    queue_display = queue_name.replace('_', ' ').title()
+                    click.echo(f"  • {queue_display}: {stats.get('total_active', 0)} active jobs")
 
     except ValueError as ve:
         print_error(str(ve))
@@ -127,4 +156,41 @@ def submit(org_id, app_version_id, test, priority, target, show_queue_info):
         sys.exit(1)
     except Exception as e:
         print_error(f"Error submitting job: {str(e)}")
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1) 
+
+def submit_batch(org_id, app_version_id, manifest, test_glob, chunk_size, priority, target):
+    """Submit a manifest or glob of tests through the bulk endpoint, chunk by chunk."""
+    submitted = []
+    try:
+        defaults = {'priority': priority, 'target': target}
+        if org_id:
+            defaults['org_id'] = org_id
+        if app_version_id:
+            defaults['app_version_id'] = app_version_id
+
+        if manifest:
+            jobs = load_manifest(manifest, defaults)
+        else:
+            jobs = expand_test_glob(test_glob, defaults)
+
+        click.echo(f"Submitting {len(jobs)} jobs in chunks of {chunk_size}...")
+
+        client = APIClient()
+        for chunk in chunked(jobs, chunk_size):
+            result = client.submit_jobs_bulk(chunk)
+            # The API returns job IDs in payload order
+            for job, item in zip(chunk, result['jobs']):
+                submitted.append(dict(job, job_id=item['job_id'], status=item['status']))
+            click.echo(f"  • Submitted {len(submitted)}/{len(jobs)}")
+
+        format_bulk_submission_summary(submitted)
+
+    except ValueError as ve:
+        print_error(str(ve))
+        sys.exit(1)
+    except APIError as ae:
+        print_error(f"{str(ae)} ({len(submitted)} jobs were submitted before the error)")
+        sys.exit(1)
+    except Exception as e:
+        print_error(f"Error submitting jobs: {str(e)}")
+        sys.exit(1)
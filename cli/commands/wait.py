@@ -0,0 +1,85 @@
+import click
+from ..client import APIClient, APIError
+from ..utils.formatting import console, print_error
+import sys
+import time
+
+
+# Exit codes: CI can tell failed tests from a wait that ran out of time
+EXIT_FAILED = 1
+EXIT_TIMEOUT = 2
+
+def _parse_job_ids(values):
+    job_ids = []
+    for value in values:
+        for job_id in value.replace(',', ' ').split():
+            if not job_id.isdigit():
+                raise click.BadParameter(f"Invalid job ID: {job_id}", param_hint='--job-ids')
+            job_ids.append(int(job_id))
+    if not job_ids:
+        raise click.BadParameter("At least one job ID is required", param_hint='--job-ids')
+    return list(dict.fromkeys(job_ids))
+
+@click.command()
+@click.option('--job-ids', multiple=True, required=True, help='Job IDs to wait for (comma-separated, repeatable)')
+@click.option('--all', 'mode', flag_value='all', default=True, help='Wait until every job has finished (default)')
+@click.option('--any', 'mode', flag_value='any', help='Return as soon as one job has finished')
+@click.option('--timeout', type=click.IntRange(min=1), default=1800, help='Seconds to wait before giving up (default: 1800)')
+def wait(job_ids, mode, timeout):
+    """
+    Block until jobs finish, for CI gating.
+
+    Exits 0 when the finished jobs all completed, 1 if any of them failed and
+    2 if the timeout passed first.
+    """
+    from rich.table import Table
+
+    try:
+        job_ids = _parse_job_ids(job_ids)
+        client = APIClient()
+        deadline = time.monotonic() + timeout
+        
+        console.print(f"[dim]⏳ Waiting for {'all' if mode == 'all' else 'any'} of {len(job_ids)} jobs (timeout {timeout}s)...[/dim]")
+        while True:
+            remaining = max(0, deadline - time.monotonic())
+            result = client.wait_for_jobs(job_ids, mode, remaining)
+            if result['done'] or time.monotonic() >= deadline:
+                break
+        
+        summary = result['summary']
+        statuses = result['jobs']
+        failed = sorted(int(job_id) for job_id, status in statuses.items() if status == 'failed')
+        
+        if len(statuses) <= 50:
+            table = Table(title="Job Results")
+            table.add_column("Job ID", style="cyan", justify="center")
+            table.add_column("Status", justify="center")
+            status_displays = {
+                'completed': '[green]✅ COMPLETED[/green]',
+                'failed': '[red]❌ FAILED[/red]'
+            }
+            for job_id in job_ids:
+                status = statuses.get(str(job_id), 'unknown')
+                table.add_row(str(job_id), status_displays.get(status, f"[yellow]⏳ {status.upper()}[/yellow]"))
+            console.print(table)
+        
+        console.print(f"[bold]Completed:[/] {summary['completed']}  [bold]Failed:[/] {summary['failed']}  "
+                      f"[bold]Pending:[/] {summary['pending']}")
+        
+        if failed:
+            print_error(f"{len(failed)} job(s) failed: {', '.join(map(str, failed[:20]))}{' ...' if len(failed) > 20 else ''}")
+            sys.exit(EXIT_FAILED)
+        if not result['done']:
+            print_error(f"Timed out after {timeout}s with {summary['pending']} job(s) still pending")
+            sys.exit(EXIT_TIMEOUT)
+        
+        console.print("[green]✅ All finished jobs completed successfully[/green]")
+        
+    except APIError as ae:
+        print_error(str(ae))
+        sys.exit(EXIT_FAILED)
+    except click.BadParameter:
+        raise
+    except Exception as e:
+        print_error(f"Error waiting for jobs: {str(e)}")
+        sys.exit(EXIT_FAILED)
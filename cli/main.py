@@ -1,20 +1,65 @@
+import importlib
+
 import click
-from .commands.submit import submit
-from .commands.status import status
-from .commands.devices import devices
-from .commands.queue import queue
-from .commands.jobs import jobs
 
-@click.group()
+class LazyGroup(click.Group):
+    """
+    Command group that imports a subcommand's module only when it is used.
+
+    `qgjob` runs thousands of times a day in CI, so startup matters: each
+    command module pulls in rich and the HTTP client, and loading all of them
+    for every invocation (even `qgjob --help`) cost most of the startup time.
+    Commands are registered as "module:attribute" with their help text, so the
+    command list in --help is rendered without importing anything.
+    """
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # name -> (import path, help text)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(self.commands) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            self.add_command(self._load(cmd_name), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def _load(self, cmd_name):
+        import_path, _ = self.lazy_commands[cmd_name]
+        module_name, attribute = import_path.split(':')
+        command = getattr(importlib.import_module(module_name), attribute)
+        if not isinstance(command, click.Command):
+            raise click.ClickException(f"{import_path} is not a click command")
+        return command
+
+    def format_commands(self, ctx, formatter):
+        # Same layout as click.Group.format_commands, with unloaded commands
+        # described by their registered help instead of being imported
+        commands = []
+        for name in self.list_commands(ctx):
+            command = self.commands.get(name) or click.Command(name, help=self.lazy_commands[name][1])
+            if not command.hidden:
+                commands.append((name, command))
+
+        if commands:
+            limit = formatter.width - 6 - max(len(name) for name, _ in commands)
+            rows = [(name, command.get_short_help_str(limit)) for name, command in commands]
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+@click.group(cls=LazyGroup, lazy_commands={
+    'submit': ('cli.commands.submit:submit', "Submit a test job for execution with priority scheduling."),
+    'status': ('cli.commands.status:status', "Job status and monitoring commands."),
+    'devices': ('cli.commands.devices:devices', "Device management commands."),
+    'queue': ('cli.commands.queue:queue', "Queue management and monitoring commands."),
+    'jobs': ('cli.commands.jobs:jobs', "Job management and control commands."),
+    'wait': ('cli.commands.wait:wait', "Block until jobs finish, for CI gating."),
+})
 def cli():
     """QualGent CLI tool for managing AppWright test jobs."""
     pass
 
-cli.add_command(submit)
-cli.add_command(status)
-cli.add_command(devices)
-cli.add_command(queue)
-cli.add_command(jobs)
-
 if __name__ == '__main__':
-    cli() 
\ No newline at end of file
+    cli()
@@ -1,12 +1,31 @@
-from rich.console import Console
-from rich.table import Table
-from rich.panel import Panel
 from datetime import datetime
 
-console = Console()
+_console = None
+
+def get_console():
+    """Return the shared rich Console, importing rich on first use."""
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
+
+class _LazyConsole:
+    """
+    Stand-in for the shared Console that only imports rich when used.
+
+    rich is the most expensive import of the CLI; deferring it keeps
+    `qgjob --help` and argument errors from paying for it.
+    """
+    def __getattr__(self, name):
+        return getattr(get_console(), name)
+
+console = _LazyConsole()
 
 def format_job_submission(org_id: str, app_version_id: str, test_path: str, priority: int, target: str):
     """Format job submission details in a panel with priority indicators."""
+    from rich.panel import Panel
+
     # Priority visual indicator and description
     if priority >= 4:
         priority_display = f"🔥 {priority} (High Priority)"
@@ -43,6 +62,8 @@ def format_job_submission(org_id: str, app_version_id: str, test_path: str, prio
 
 def format_job_result(job_id: int, status: str, created_at: str, priority: int = None):
     """Format job result with color-coded status and priority info."""
+    from rich.panel import Panel
+
     status_colors = {
         'queued': 'yellow',
         'running': 'blue',
@@ -95,6 +116,8 @@ def format_job_result(job_id: int, status: str, created_at: str, priority: int =
 
 def format_job_status(job_id: int, status: str, created_at: str, priority: int = None, target: str = None, device: str = None):
     """Format job status with comprehensive information and visual indicators."""
+    from rich.panel import Panel
+
     status_colors = {
         'queued': 'yellow',
         'running': 'blue',
@@ -156,6 +179,36 @@ def format_job_status(job_id: int, status: str, created_at: str, priority: int =
     )
     console.print(panel)
 
+def format_bulk_submission_summary(jobs: list):
+    """Summarize a bulk submission grouped by app version and target."""
+    from rich.table import Table
+
+    groups = {}
+    for job in jobs:
+        key = (job['app_version_id'], job['target'])
+        groups.setdefault(key, []).append(job)
+
+    table = Table(title=f"Submitted {len(jobs)} Jobs in {len(groups)} Groups")
+    table.add_column("App Version", style="blue")
+    table.add_column("Target", style="green")
+    table.add_column("Jobs", style="cyan", justify="center")
+    table.add_column("Priorities", style="magenta")
+    table.add_column("Job IDs", style="white")
+
+    for (app_version_id, target), group in sorted(groups.items()):
+        job_ids = sorted(job['job_id'] for job in group)
+        priorities = sorted({job['priority'] for job in group}, reverse=True)
+        id_display = f"{job_ids[0]}-{job_ids[-1]}" if len(job_ids) > 1 else str(job_ids[0])
+        table.add_row(
+            app_version_id,
+            target,
+            str(len(group)),
+            ", ".join(format_priority_indicator(p) for p in priorities),
+            id_display
+        )
+
+    console.print(table)
+
 def format_priority_indicator(priority: int) -> str:
     """Get priority indicator with icon and color."""
     if priority >= 4:
@@ -181,6 +234,8 @@ def format_status_indicator(status: str) -> str:
 
 def print_error(message: str):
     """Print error message in red panel."""
+    from rich.panel import Panel
+
     panel = Panel.fit(
         f"[bold red]{message}[/]",
         title="[bold red]Error",
@@ -190,6 +245,8 @@ def print_error(message: str):
 
 def print_success(message: str, title: str = "Success"):
     """Print success message in green panel."""
+    from rich.panel import Panel
+
     panel = Panel.fit(
         f"[bold green]{message}[/]",
         title=f"[bold green]{title}",
@@ -199,6 +256,8 @@ def print_success(message: str, title: str = "Success"):
 
 def print_warning(message: str, title: str = "Warning"):
     """Print warning message in yellow panel."""
+    from rich.panel import Panel
+
     panel = Panel.fit(
         f"[bold yellow]{message}[/]",
         title=f"[bold yellow]{title}",
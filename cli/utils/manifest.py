@@ -0,0 +1,94 @@
+import glob
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from .validation import validate_test_file
+
+VALID_TARGETS = ['emulator', 'device', 'browserstack']
+
+def load_manifest(manifest_path: str, defaults: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Load a job manifest (YAML or JSON) and return one job payload per test.
+
+    The manifest may set org_id, app_version_id, priority and target at the
+    top level; each entry under ``jobs`` is either a test path or a mapping
+    with ``test`` plus any per-job overrides. Values given on the command
+    line are used when neither level sets them.
+    Raises ValueError if the manifest is malformed or a test file is invalid.
+    """
+    path = Path(manifest_path)
+    if not path.is_file():
+        raise ValueError(f"Manifest not found: {manifest_path}")
+
+    with open(path, 'r') as f:
+        if path.suffix == '.json':
+            data = json.load(f)
+        else:
+            import yaml
+            data = yaml.safe_load(f)
+
+    if isinstance(data, list):
+        data = {'jobs': data}
+    if not isinstance(data, dict) or not isinstance(data.get('jobs'), list):
+        raise ValueError(f"Manifest must contain a 'jobs' list: {manifest_path}")
+
+    base = dict(defaults)
+    for key in ('org_id', 'app_version_id', 'priority', 'target'):
+        if data.get(key) is not None:
+            base[key] = data[key]
+
+    jobs = []
+    for index, entry in enumerate(data['jobs']):
+        if isinstance(entry, str):
+            entry = {'test': entry}
+        if not isinstance(entry, dict) or not entry.get('test'):
+            raise ValueError(f"Manifest entry {index} must be a test path or have a 'test' key")
+
+        job = dict(base)
+        job.update({k: v for k, v in entry.items() if k != 'test' and v is not None})
+        job['test_path'] = validate_test_file(entry['test'])
+        jobs.append(_check_job(job, index))
+
+    return jobs
+
+def expand_test_glob(pattern: str, defaults: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Expand a (recursive) glob into one job payload per matching test file.
+    Raises ValueError if nothing matches.
+    """
+    matches = sorted(glob.glob(pattern, recursive=True))
+    if not matches:
+        raise ValueError(f"No test files match: {pattern}")
+
+    return [
+        _check_job(dict(defaults, test_path=validate_test_file(match)), index)
+        for index, match in enumerate(matches)
+    ]
+
+def chunked(items: List[Any], size: int) -> Iterator[List[Any]]:
+    """Yield successive slices of at most ``size`` items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _check_job(job: Dict[str, Any], index: Optional[int] = None) -> Dict[str, Any]:
+    """Ensure a job payload has every field the API requires."""
+    missing = [key for key in ('org_id', 'app_version_id') if not job.get(key)]
+    if missing:
+        raise ValueError(f"Job {index} is missing {', '.join(missing)} (set it in the manifest or on the command line)")
+
+    priority = int(job.get('priority', 1))
+    if not 1 <= priority <= 5:
+        raise ValueError(f"Job {index}: priority must be between 1 and 5")
+
+    target = job.get('target', 'emulator')
+    if target not in VALID_TARGETS:
+        raise ValueError(f"Job {index}: target must be one of {', '.join(VALID_TARGETS)}")
+
+    return {
+        'org_id': job['org_id'],
+        'app_version_id': job['app_version_id'],
+        'test_path': job['test_path'],
+        'priority': priority,
+        'target': target
+    }
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Throughput of one Celery worker process running mock tests.
+
+Runs batches of mock TestRunner tests (no database, broker or devices) the
+ways a worker process can drive them and reports tests per second:
+
+    per_test     a new event loop per test, one test at a time (the old
+                 per-job task)
+    per_batch    asyncio.run() per batch, WORKER_EVENT_LOOP=per_batch
+    persistent   every batch on the worker's long-lived loop, capped at
+                 --concurrency tests, WORKER_EVENT_LOOP=persistent
+
+--threads stands in for `celery worker --pool threads --concurrency N`:
+that many batches are in flight in the process at once.
+
+    python scripts/bench_worker_loop.py
+    python scripts/bench_worker_loop.py --batches 40 --batch-size 10 --threads 8 --concurrency 32
+    python scripts/bench_worker_loop.py --test-seconds 0 --batches 2000    # loop overhead only
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.queue.worker_loop import WorkerLoop
+from backend.services.test_runner import TestRunner
+
+# Per-test log lines would dominate the timings
+logging.getLogger('backend').setLevel(logging.ERROR)
+
+class BenchRunner(TestRunner):
+    EXECUTION_TIMES = {}
+
+async def run_batch(runner, spec, batch_size, slots, limit=None):
+    """A batch fanned out over `slots` device slots, like _execute_batch."""
+    pending = asyncio.Queue()
+    for _ in range(batch_size):
+        pending.put_nowait(spec)
+    passed = []
+
+    async def slot_worker():
+        while not pending.empty():
+            test_path = pending.get_nowait()
+            if limit is None:
+                result = await runner.run_tests(test_path, "bench")
+            else:
+                async with limit:
+                    result = await runner.run_tests(test_path, "bench")
+            passed.append(result["success"])
+
+    await asyncio.gather(*(slot_worker() for _ in range(min(slots, batch_size))))
+    return sum(passed)
+
+def drive(threads, batches, run_one):
+    """Run `batches` batches on `threads` task threads and return (tests passed, seconds)."""
+    work = queue.Queue()
+    for _ in range(batches):
+        work.put(None)
+    passed = []
+    lock = threading.Lock()
+
+    def task_thread():
+        while True:
+            try:
+                work.get_nowait()
+            except queue.Empty:
+                return
+            count = run_one()
+            with lock:
+                passed.append(count)
+
+    workers = [threading.Thread(target=task_thread) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(passed), time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--slots', type=int, default=4, help='device slots per batch')
+    parser.add_argument('--threads', type=int, default=4, help='batches in flight per worker process')
+    parser.add_argument('--concurrency', type=int, default=16, help='WORKER_TEST_CONCURRENCY')
+    parser.add_argument('--test-seconds', type=float, default=0.1, help='simulated seconds per test')
+    args = parser.parse_args()
+
+    BenchRunner.EXECUTION_TIMES = {'bench': args.test_seconds}
+    runner = BenchRunner('bench')
+    spec = os.path.join(tempfile.mkdtemp(), 'bench.spec.js')
+    with open(spec, 'w') as f:
+        f.write("test('bench', async () => {});")
+    tests = args.batches * args.batch_size
+
+    print(f"{args.batches} batches x {args.batch_size} tests of {args.test_seconds}s, {args.slots} slots per batch, "
+          f"{args.threads} task threads, cap {args.concurrency}")
+
+    def per_test():
+        return sum(asyncio.run(run_batch(runner, spec, 1, 1)) for _ in range(args.batch_size))
+
+    def per_batch():
+        return asyncio.run(run_batch(runner, spec, args.batch_size, args.slots))
+
+    worker_loop = WorkerLoop(concurrency=args.concurrency)
+
+    async def capped_batch():
+        return await run_batch(runner, spec, args.batch_size, args.slots, limit=worker_loop.execution_slot())
+
+    def persistent():
+        return worker_loop.run(capped_batch())
+
+    print(f"\n  {'mode':<12} {'tests/s':>10} {'wall':>9}")
+    for name, run_one, threads in [
+        ('per_test', per_test, 1),
+        ('per_batch', per_batch, args.threads),
+        ('persistent', persistent, args.threads),
+    ]:
+        passed, elapsed = drive(threads, args.batches, run_one)
+        assert passed == tests, f"{name}: {passed}/{tests} tests passed"
+        print(f"  {name:<12} {tests / elapsed:>10.1f} {elapsed:>8.2f}s")
+    worker_loop.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Load test for GET /jobs/{id}.
+
+Drives concurrent job status lookups against a running API server and reports
+throughput and latency percentiles.
+
+    python scripts/load_test_jobs.py --concurrency 100 --requests 10000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+import httpx
+
+async def fetch_job_ids(client: httpx.AsyncClient, count: int):
+    response = await client.get("/jobs", params={"limit": count})
+    response.raise_for_status()
+    return [job["id"] for job in response.json()]
+
+async def run(base_url: str, concurrency: int, total: int, job_ids):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        if not job_ids:
+            job_ids = await fetch_job_ids(client, 100)
+        if not job_ids:
+            raise SystemExit("No jobs found; submit some jobs or pass --job-ids")
+
+        latencies = []
+        errors = 0
+        remaining = iter(range(total))
+
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(f"/jobs/{random.choice(job_ids)}")
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started, latencies, errors
+
+def percentile(sorted_values, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=os.getenv('API_URL', 'http://localhost:8002'))
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--job-ids', help='Comma-separated job IDs to query (default: 100 most recent)')
+    args = parser.parse_args()
+
+    job_ids = [int(job_id) for job_id in args.job_ids.split(',')] if args.job_ids else []
+    elapsed, latencies, errors = asyncio.run(run(args.url, args.concurrency, args.requests, job_ids))
+
+    latencies.sort()
+    print(f"GET /jobs/{{id}} against {args.url}")
+    print(f"  requests:    {len(latencies)} ({errors} errors) with concurrency {args.concurrency}")
+    print(f"  throughput:  {len(latencies) / elapsed:.0f} req/s")
+    print(f"  latency p50: {statistics.median(latencies) * 1000:.2f}ms")
+    print(f"  latency p99: {percentile(latencies, 0.99) * 1000:.2f}ms")
+    print(f"  latency max: {latencies[-1] * 1000:.2f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Bring an existing database up to the current schema (missing columns and indexes).
+
+Safe to re-run. On a large production Postgres database use --concurrently so
+index builds don't lock the jobs table against writes.
+"""
+
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.database import engine
+from backend.migrations import upgrade_schema
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrently', action='store_true',
+                        help='Use CREATE INDEX CONCURRENTLY (Postgres only)')
+    args = parser.parse_args()
+
+    print("Upgrading database schema...")
+    created = upgrade_schema(engine, concurrently=args.concurrently)
+    if created:
+        for name in created:
+            print(f"  created {name}")
+    else:
+        print("  already up to date")
+    print("Schema upgrade complete!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Replay batches of tests and compare their makespan under execution orders.
+
+Orders:
+    fifo            claim order, what batches did before runtime history
+    longest_first   backend.services.runtime_stats: longest estimated runtime
+                    first, estimates learned from the trace's earlier batches
+    oracle          longest actual runtime first (what perfect estimates
+                    would give)
+
+Each batch runs on --slots slots (BATCH_MAX_PARALLEL_SLOTS); a slot takes the
+next test as soon as it is free, as _execute_batch does. Runtime history is
+updated after every batch with the actual durations, so early batches fall
+back to DEFAULT_RUNTIME_SECONDS like a fresh deployment.
+
+A trace is JSONL, one finished job per line, batches in claim order:
+
+    {"batch": "v42/emulator", "target": "emulator", "test_path": "tests/login.spec.js", "duration": 31.5}
+
+Without --trace, a suite with lognormal test runtimes (a few long tests, many
+short ones) is generated, and every batch runs a random subset of it.
+
+    python scripts/simulate_makespan.py
+    python scripts/simulate_makespan.py --trace runs.jsonl --slots 4
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import os
+import random
+import sys
+from collections import defaultdict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.getLogger('backend').setLevel(logging.ERROR)
+
+from backend.services.runtime_stats import DEFAULT_RUNTIME_SECONDS, RUNTIME_WINDOW, summarize
+
+def load_trace(path):
+    batches = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                job = json.loads(line)
+                batches.setdefault(job['batch'], []).append(job)
+    return list(batches.values())
+
+def synthetic_trace(seed, batches, tests, batch_size, target='emulator'):
+    """A suite whose runtimes are lognormal (median ~20s), each run within +-20% of its test's mean."""
+    rng = random.Random(seed)
+    means = {f"tests/t{i:03d}.spec.js": rng.lognormvariate(3.0, 0.9) for i in range(tests)}
+    trace = []
+    for b in range(batches):
+        paths = rng.sample(sorted(means), min(batch_size, tests))
+        trace.append([{'batch': f"b{b}", 'target': target, 'test_path': path,
+                       'duration': means[path] * rng.uniform(0.8, 1.2)} for path in paths])
+    return trace
+
+class History:
+    """In-memory stand-in for RuntimeModel: the same windows and fallbacks, without Redis."""
+
+    def __init__(self, window=RUNTIME_WINDOW):
+        self.window = window
+        self.runs = defaultdict(list)
+
+    def record(self, job):
+        for key in ((job['test_path'], job['target']), job['target']):
+            self.runs[key].insert(0, job['duration'])
+            del self.runs[key][self.window:]
+
+    def estimate(self, job):
+        ewma = summarize(self.runs[(job['test_path'], job['target'])])['ewma']
+        if ewma is None:
+            ewma = summarize(self.runs[job['target']])['ewma'] or DEFAULT_RUNTIME_SECONDS
+        return ewma
+
+def makespan(durations, slots):
+    """Wall time of running `durations` in order on `slots` slots (list scheduling)."""
+    free_at = [0.0] * min(slots, len(durations))
+    for duration in durations:
+        heapq.heappush(free_at, heapq.heappop(free_at) + duration)
+    return max(free_at, default=0.0)
+
+def simulate(trace, slots):
+    """
+    Returns:
+        {order: [makespan per batch]} and the estimates' mean absolute error in seconds
+    """
+    history = History()
+    spans = defaultdict(list)
+    errors = []
+    for batch in trace:
+        estimates = [history.estimate(job) for job in batch]
+        errors.extend(abs(estimate - job['duration']) for estimate, job in zip(estimates, batch))
+        orders = {
+            'fifo': batch,
+            'longest_first': [job for _, job in sorted(zip(estimates, batch), key=lambda pair: -pair[0])],
+            'oracle': sorted(batch, key=lambda job: -job['duration']),
+        }
+        for name, jobs in orders.items():
+            spans[name].append(makespan([job['duration'] for job in jobs], slots))
+        for job in batch:
+            history.record(job)
+    return spans, sum(errors) / max(len(errors), 1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trace', help='JSONL run trace (default: generated suite)')
+    parser.add_argument('--slots', type=int, default=8, help='slots per batch')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--batches', type=int, default=50)
+    parser.add_argument('--tests', type=int, default=120, help='tests in the generated suite')
+    parser.add_argument('--batch-size', type=int, default=40)
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = synthetic_trace(args.seed, args.batches, args.tests, args.batch_size)
+
+    spans, error = simulate(trace, args.slots)
+    fifo_total = sum(spans['fifo'])
+    print(f"{len(trace)} batches, {sum(len(batch) for batch in trace)} jobs on {args.slots} slots per batch")
+    print(f"Runtime estimates: mean absolute error {error:.1f}s")
+    print(f"\n  {'order':<14} {'total':>9} {'mean':>8} {'max':>8} {'vs fifo':>8}")
+    for name in ('fifo', 'longest_first', 'oracle'):
+        total = sum(spans[name])
+        print(f"  {name:<14} {total:>8.0f}s {total / len(trace):>7.1f}s {max(spans[name]):>7.1f}s "
+              f"{(1 - total / fifo_total) * 100:>7.1f}%")
+
+if __name__ == "__main__":
+    main()
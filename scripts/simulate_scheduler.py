@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Replay a job trace against the dispatch policies and compare per-org waits.
+
+Policies:
+    priority     what the queues do without the scheduler: highest priority
+                 first, then first come first served
+    fair_share   backend.queue.scheduler (FAIR_SHARE_SCHEDULING=true), with
+                 the weights and aging rate from the environment or flags
+
+A trace is JSONL, one job per line:
+
+    {"submitted_at": 0.0, "org_id": "acme", "priority": 5, "duration": 30}
+
+Without --trace, a flood scenario is generated: one org submits a burst of
+priority-5 jobs while other orgs keep submitting lower-priority work.
+
+    python scripts/simulate_scheduler.py
+    python scripts/simulate_scheduler.py --trace jobs.jsonl --slots 8 --aging-rate 0.1
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import random
+import sys
+from collections import defaultdict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.queue.scheduler import AGING_RATE, ORG_WEIGHTS, PRIORITY_WEIGHTS, FairShareQueue, parse_weights
+
+class PriorityQueue:
+    """Strict priority, then submission order."""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+
+    def push(self, item, org_id, priority, enqueued_at, cost=1.0):
+        heapq.heappush(self._heap, (-priority, enqueued_at, next(self._seq), item))
+
+    def pop(self):
+        return heapq.heappop(self._heap)[-1]
+
+    def __len__(self):
+        return len(self._heap)
+
+def load_trace(path):
+    with open(path) as f:
+        jobs = [json.loads(line) for line in f if line.strip()]
+    return sorted(jobs, key=lambda job: job['submitted_at'])
+
+def flood_trace(seed, flood_jobs, background_orgs, duration):
+    """One org floods priority-5 jobs at t=0; the others trickle in priorities 1-3."""
+    rng = random.Random(seed)
+    jobs = [
+        {'submitted_at': i * 0.1, 'org_id': 'flood', 'priority': 5, 'duration': rng.uniform(20, 40)}
+        for i in range(flood_jobs)
+    ]
+    for org in range(background_orgs):
+        t = 0.0
+        while t < duration:
+            t += rng.expovariate(1 / 60)
+            jobs.append({'submitted_at': t, 'org_id': f"org-{org}", 'priority': rng.choice([1, 2, 3]),
+                         'duration': rng.uniform(20, 40)})
+    return sorted(jobs, key=lambda job: job['submitted_at'])
+
+def simulate(jobs, slots, queue):
+    """
+    Run the trace on `slots` identical device slots.
+
+    Returns:
+        List of (job, wait seconds) in dispatch order
+    """
+    arrivals = iter(jobs)
+    upcoming = next(arrivals, None)
+    running = []  # heap of finish times
+    waits = []
+    now = 0.0
+    while upcoming is not None or len(queue) or running:
+        # Advance to the next arrival or completion
+        candidates = [running[0]] if running else []
+        if upcoming is not None:
+            candidates.append(upcoming['submitted_at'])
+        if candidates:
+            now = max(now, min(candidates))
+        while running and running[0] <= now:
+            heapq.heappop(running)
+        while upcoming is not None and upcoming['submitted_at'] <= now:
+            queue.push(upcoming, upcoming['org_id'], upcoming['priority'], upcoming['submitted_at'])
+            upcoming = next(arrivals, None)
+        while len(queue) and len(running) < slots:
+            job = queue.pop()
+            waits.append((job, now - job['submitted_at']))
+            heapq.heappush(running, now + job['duration'])
+    return waits
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def report(name, waits, starvation):
+    by_org = defaultdict(list)
+    for job, wait in waits:
+        by_org[job['org_id']].append(wait)
+
+    print(f"\n{name}")
+    print(f"  {'org':<12} {'jobs':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'starved':>8}")
+    for org, org_waits in sorted(by_org.items()):
+        org_waits.sort()
+        starved = sum(1 for wait in org_waits if wait > starvation)
+        print(f"  {org:<12} {len(org_waits):>6} {percentile(org_waits, 0.5):>7.0f}s "
+              f"{percentile(org_waits, 0.9):>7.0f}s {percentile(org_waits, 0.99):>7.0f}s "
+              f"{org_waits[-1]:>7.0f}s {starved:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trace', help='JSONL job trace (default: generated flood scenario)')
+    parser.add_argument('--slots', type=int, default=8, help='device slots shared by every job')
+    parser.add_argument('--priority-weights', default=None, help='e.g. "1=1,2=2,3=4,4=8,5=16"')
+    parser.add_argument('--org-weights', default=None, help='e.g. "acme=2,globex=1"')
+    parser.add_argument('--aging-rate', type=float, default=AGING_RATE)
+    parser.add_argument('--starvation', type=float, default=600, help='waits above this many seconds count as starved')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--flood-jobs', type=int, default=300)
+    parser.add_argument('--background-orgs', type=int, default=3)
+    parser.add_argument('--duration', type=float, default=1800, help='seconds of background submissions')
+    args = parser.parse_args()
+
+    if args.trace:
+        jobs = load_trace(args.trace)
+    else:
+        jobs = flood_trace(args.seed, args.flood_jobs, args.background_orgs, args.duration)
+    priority_weights = parse_weights(args.priority_weights, int) if args.priority_weights else PRIORITY_WEIGHTS
+    org_weights = parse_weights(args.org_weights) if args.org_weights is not None else ORG_WEIGHTS
+
+    print(f"{len(jobs)} jobs from {len({job['org_id'] for job in jobs})} orgs on {args.slots} slots")
+    print(f"Priority weights {priority_weights}, org weights {org_weights or 'all 1'}, aging {args.aging_rate}/s")
+
+    report("priority (current queues)", simulate(jobs, args.slots, PriorityQueue()), args.starvation)
+    report("fair_share", simulate(jobs, args.slots, FairShareQueue(org_weights, priority_weights, args.aging_rate)),
+           args.starvation)
+
+if __name__ == "__main__":
+    main()
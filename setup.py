@@ -28,6 +28,8 @@ setup(
         "uvicorn>=0.15.0",
         "sqlalchemy>=1.4.0",
         "psycopg2-binary>=2.9.0",
+        "asyncpg>=0.29.0",
+        "aiosqlite>=0.19.0",
         "redis>=4.0.0",
         "celery>=5.2.0",
         "click>=8.0.0",
@@ -35,6 +37,7 @@ setup(
         "python-dotenv>=0.19.0",
         "requests>=2.31.0",
         "httpx>=0.24.0",
+        "PyYAML>=6.0",
     ],
     entry_points={
         "console_scripts": [
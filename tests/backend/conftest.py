@@ -0,0 +1,44 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# backend.database builds its engine at import time; keep the unit tests off Postgres
+os.environ.setdefault('DATABASE_URL', 'sqlite:///./test_qualcli.db')
+
+from backend.database import Base
+from backend.models import Job, Device  # noqa: F401  (register tables)
+from backend.queue import batching
+from backend.services import events
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    """In-memory Redis for batch markers and events, shared by sync and asyncio clients."""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(batching, '_redis_client', client)
+    monkeypatch.setattr(events, '_async_redis_client', fakeredis.FakeAsyncRedis(server=server))
+    return client
+
+@pytest.fixture
+def db_engine(tmp_path):
+    """File-backed SQLite engine shared by every thread in a test."""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'qualcli.db'}",
+        connect_args={"timeout": 30, "check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def session_factory(db_engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
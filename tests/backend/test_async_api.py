@@ -0,0 +1,387 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend import main
+from backend.database import get_async_db
+from backend.models import Device, Job, TestResult
+from backend.queue.batching import record_batch_stats
+from backend.services import events, queue_stats
+from backend.services.counters import QueueCounters
+from backend.services.device_manager import DeviceManager
+
+@pytest.fixture
+def api(db_engine, monkeypatch):
+    """Run the app against the test database on aiosqlite, without a broker."""
+    signalled = []
+    monkeypatch.setattr(main, '_signal_batches', lambda jobs, producer=None: signalled.extend(jobs) or len(jobs))
+    monkeypatch.setattr(main, '_signal_batches_pooled', lambda jobs: signalled.extend(jobs) or len(jobs))
+
+    async def call(requests):
+        engine = create_async_engine(str(db_engine.url).replace('sqlite://', 'sqlite+aiosqlite://'))
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+
+        async def override():
+            async with factory() as session:
+                yield session
+
+        main.app.dependency_overrides[get_async_db] = override
+        monkeypatch.setattr(main, 'AsyncSessionLocal', factory)
+        try:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await requests(client)
+        finally:
+            main.app.dependency_overrides.clear()
+            await engine.dispose()
+
+    def run(requests):
+        return asyncio.run(call(requests))
+
+    run.signalled = signalled
+    return run
+
+def test_submit_and_get_job(api, db):
+    async def requests(client):
+        submitted = await client.post("/jobs/submit", json={
+            "org_id": "qualgent", "app_version_id": "v1", "test_path": "tests/a.spec.js", "priority": 3
+        })
+        fetched = await client.get(f"/jobs/{submitted.json()['job_id']}")
+        missing = await client.get("/jobs/9999")
+        return submitted, fetched, missing
+
+    submitted, fetched, missing = api(requests)
+
+    assert submitted.status_code == 200
+    assert fetched.status_code == 200
+    assert fetched.json() == {key: submitted.json()[key] for key in ("job_id", "status", "created_at")}
+    assert submitted.json()["estimated_duration_seconds"] == 30  # No history: DEFAULT_RUNTIME_SECONDS
+    assert submitted.json()["estimated_duration_seconds_p90"] == 30
+    assert submitted.json()["status"] == "queued"
+    assert missing.status_code == 404
+    assert [job.app_version_id for job in api.signalled] == ["v1"]
+    assert db.get(Job, submitted.json()["job_id"]).priority == 3
+
+def test_bulk_submit_preserves_order(api):
+    payload = {"jobs": [
+        {"org_id": "qualgent", "app_version_id": "v2", "test_path": f"tests/{i}.spec.js"} for i in range(5)
+    ]}
+
+    response = api(lambda client: client.post("/jobs/submit/bulk", json=payload))
+
+    ids = [job["job_id"] for job in response.json()["jobs"]]
+    assert response.json()["total"] == 5
+    assert ids == sorted(ids)
+    assert len(api.signalled) == 5
+
+def test_list_jobs_filters_and_sorts(api, db):
+    db.add_all([
+        Job(org_id="qualgent", app_version_id="v1", test_path=f"tests/{i}.spec.js",
+            priority=i % 5 + 1, target="emulator", status="queued" if i % 2 else "completed")
+        for i in range(10)
+    ])
+    db.commit()
+
+    async def requests(client):
+        return await asyncio.gather(
+            client.get("/jobs", params={"status": "queued", "sort": "priority", "order": "desc"}),
+            client.get("/jobs", params={"status": "queued,completed", "limit": 3}),
+        )
+
+    queued, limited = api(requests)
+
+    priorities = [job["priority"] for job in queued.json()]
+    assert len(priorities) == 5
+    assert priorities == sorted(priorities, reverse=True)
+    assert {job["status"] for job in queued.json()} == {"queued"}
+    assert len(limited.json()) == 3
+
+def test_list_jobs_cursor_walks_every_row_once(api, db):
+    created = datetime(2024, 1, 1)
+    db.add_all([
+        # Pairs share created_at so the id tiebreak is exercised
+        Job(org_id="qualgent", app_version_id="v1", test_path=f"tests/{i}.spec.js",
+            priority=i % 3 + 1, target="emulator", status="queued", created_at=created + timedelta(seconds=i // 2))
+        for i in range(23)
+    ])
+    db.commit()
+
+    async def walk(client, sort, order):
+        pages, cursor = [], None
+        while True:
+            params = {"sort": sort, "order": order, "limit": 5}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.get("/jobs", params=params)
+            pages.append([job["id"] for job in response.json()])
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                return pages
+
+    async def requests(client):
+        return await asyncio.gather(walk(client, "created", "desc"), walk(client, "priority", "asc"),
+                                    walk(client, "status", "desc"))
+
+    for pages in api(requests):
+        ids = [job_id for page in pages for job_id in page]
+        assert sorted(ids) == list(range(1, 24))
+        assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+
+    by_created, by_priority, _ = api(requests)
+    assert by_created[0][:2] == [23, 22]
+    priorities = [db.get(Job, job_id).priority for page in by_priority for job_id in page]
+    assert priorities == sorted(priorities)
+
+def test_list_jobs_rejects_bad_cursor(api):
+    async def requests(client):
+        first = await client.get("/jobs", params={"limit": 1, "sort": "priority"})
+        return await asyncio.gather(
+            client.get("/jobs", params={"cursor": "not-a-cursor"}),
+            client.get("/jobs", params={"cursor": first.headers.get("X-Next-Cursor", "e30"), "sort": "created"}),
+        )
+
+    malformed, wrong_sort = api(requests)
+
+    assert malformed.status_code == 400
+    assert wrong_sort.status_code == 400
+
+def test_list_jobs_ndjson_stream(api, db, monkeypatch):
+    monkeypatch.setattr(main, 'STREAM_BATCH_SIZE', 4)
+    db.add_all([
+        Job(org_id="qualgent", app_version_id="v1", test_path=f"tests/{i}.spec.js",
+            priority=1, target="emulator", status="completed")
+        for i in range(10)
+    ])
+    db.commit()
+
+    response = api(lambda client: client.get("/jobs", params={"format": "ndjson", "order": "asc"}))
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == list(range(1, 11))
+    assert "X-Next-Cursor" not in response.headers
+
+def test_job_results(api, db):
+    job = Job(org_id="qualgent", app_version_id="v1", test_path="tests/login.spec.js",
+              priority=1, target="emulator", status="failed")
+    db.add(job)
+    db.commit()
+    db.add_all([
+        TestResult.from_case(job.id, {"title": "login › works", "file": "login.spec.js", "line": 3,
+                                      "project": "android", "status": "passed", "duration_ms": 1200,
+                                      "attachments": [{"name": "trace", "content_type": "application/zip",
+                                                       "path": "/tmp/trace.zip"}]}),
+        TestResult.from_case(job.id, {"title": "login › fails", "status": "failed", "duration_ms": 300,
+                                      "error": "Timed out"}),
+    ])
+    db.commit()
+
+    async def requests(client):
+        return (await client.get(f"/jobs/{job.id}/results"),
+                await client.get(f"/jobs/{job.id}/results", params={"status": "failed"}),
+                await client.get("/jobs/9999/results"))
+
+    everything, failed, missing = api(requests)
+
+    assert everything.json()["summary"] == {"total": 2, "passed": 1, "failed": 1, "flaky": 0, "skipped": 0,
+                                            "duration_ms": 1500}
+    assert everything.json()["results"][0]["attachments"][0]["path"] == "/tmp/trace.zip"
+    assert [r["title"] for r in failed.json()["results"]] == ["login › fails"]
+    assert failed.json()["results"][0]["error"] == "Timed out"
+    assert missing.status_code == 404
+
+def test_sharded_submission_rolls_up(api, db):
+    async def requests(client):
+        submitted = await client.post("/jobs/submit", json={
+            "org_id": "qualgent", "app_version_id": "v1", "test_path": "tests/login.spec.js", "priority": 3,
+            "shards": 3
+        })
+        parent_id = submitted.json()["job_id"]
+        fetched = await client.get(f"/jobs/{parent_id}")
+        shards = await client.get(f"/jobs/{parent_id}/shards")
+        bulk = await client.post("/jobs/submit/bulk", json={"jobs": [
+            {"org_id": "qualgent", "app_version_id": "v1", "test_path": "tests/a.spec.js", "shards": 2}]})
+        too_many = await client.post("/jobs/submit", json={
+            "org_id": "qualgent", "app_version_id": "v1", "test_path": "tests/a.spec.js", "shards": 1000})
+        cancelled = await client.delete(f"/jobs/{parent_id}")
+        after = await client.get(f"/jobs/{parent_id}/shards")
+        return submitted, fetched, shards, bulk, too_many, cancelled, after
+
+    submitted, fetched, shards, bulk, too_many, cancelled, after = api(requests)
+
+    body = submitted.json()
+    assert body["status"] == "queued" and body["shard_count"] == 3
+    assert api.signalled and len(body["shard_job_ids"]) == 3
+    assert body["estimated_duration_seconds"] == 10  # The default 30s file estimate over 3 shards
+    assert fetched.json()["status"] == "queued"
+    assert shards.json()["shards"] == {"queued": 3, "running": 0, "completed": 0, "failed": 0}
+    assert [(j["id"], j["shard_index"], j["shard_count"]) for j in shards.json()["jobs"]] == [
+        (job_id, i, 3) for i, job_id in enumerate(body["shard_job_ids"], start=1)]
+    assert bulk.status_code == 400 and too_many.status_code == 400
+    assert cancelled.json()["previous_status"] == "sharded"
+    assert after.json()["status"] == "failed"
+    assert after.json()["shards"]["failed"] == 3
+    assert db.query(Job).filter(Job.status.in_(("queued", "running"))).count() == 0
+
+def test_device_endpoints(api, db):
+    async def requests(client):
+        created = await client.post("/devices", json={"device_id": "emulator-1", "device_type": "emulator",
+                                                      "max_concurrent_jobs": 2})
+        duplicate = await client.post("/devices", json={"device_id": "emulator-1", "device_type": "emulator"})
+        listed = await client.get("/devices")
+        status = await client.get("/devices/status")
+        health = await client.post("/devices/health-check")
+        recommendations = await client.get("/devices/recommendations/emulator")
+        removed = await client.delete("/devices/emulator-1")
+        return created, duplicate, listed, status, health, recommendations, removed
+
+    created, duplicate, listed, status, health, recommendations, removed = api(requests)
+
+    assert created.status_code == 200
+    assert duplicate.status_code == 400
+    assert [d["device_id"] for d in listed.json()["devices"]] == ["emulator-1"]
+    assert status.status_code == 200 and "error" not in status.json()
+    assert health.json()["healthy"] == 1
+    assert "recommendation" in recommendations.json()
+    assert removed.status_code == 200
+    assert db.query(Device).count() == 0
+
+def test_submit_and_cancel_publish_job_events(api, fake_redis):
+    pubsub = fake_redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(events.EVENTS_CHANNEL)
+
+    async def requests(client):
+        submitted = await client.post("/jobs/submit", json={
+            "org_id": "qualgent", "app_version_id": "v1", "test_path": "tests/a.spec.js"
+        })
+        return await client.delete(f"/jobs/{submitted.json()['job_id']}")
+
+    assert api(requests).status_code == 200
+
+    messages = [pubsub.get_message(timeout=0.01) for _ in range(5)]
+    received = [json.loads(message["data"]) for message in messages if message]
+    assert [(e["type"], e["previous_status"]) for e in received] == [("job.queued", None), ("job.failed", "queued")]
+    assert received[1]["cancelled"] is True
+
+def test_wait_returns_when_jobs_finish(api, db):
+    db.add_all([
+        Job(org_id="qualgent", app_version_id="v1", test_path="tests/a.spec.js", target="emulator", status="completed"),
+        Job(org_id="qualgent", app_version_id="v1", test_path="tests/b.spec.js", target="emulator", status="running"),
+    ])
+    db.commit()
+
+    def finish_second_job():
+        job = db.get(Job, 2)
+        job.status = "failed"
+        db.commit()
+        events.publish_event(events.job_event(job, "running"))
+
+    async def requests(client):
+        async def finish_later():
+            await asyncio.sleep(0.3)
+            await asyncio.to_thread(finish_second_job)
+
+        started = asyncio.get_running_loop().time()
+        any_done = await client.get("/jobs/wait", params={"ids": "1,2", "mode": "any", "timeout": 5})
+        all_done, _ = await asyncio.gather(
+            client.post("/jobs/wait", json={"job_ids": [1, 2], "timeout": 5}),
+            finish_later()
+        )
+        return any_done, all_done, asyncio.get_running_loop().time() - started
+
+    any_done, all_done, elapsed = api(requests)
+
+    assert any_done.json()["done"] is True
+    assert all_done.json() == {
+        "mode": "all", "done": True, "timed_out": False,
+        "summary": {"completed": 1, "failed": 1, "pending": 0},
+        "jobs": {"1": "completed", "2": "failed"}
+    }
+    assert elapsed < 3  # Woken by the event, not the re-check interval
+
+def test_wait_times_out_and_rejects_unknown_jobs(api, db):
+    db.add(Job(org_id="qualgent", app_version_id="v1", test_path="tests/a.spec.js", target="emulator", status="queued"))
+    db.commit()
+
+    async def requests(client):
+        return await asyncio.gather(
+            client.get("/jobs/wait", params={"ids": "1", "timeout": 0.2}),
+            client.get("/jobs/wait", params={"ids": "1,99", "timeout": 0.2}),
+            client.get("/jobs/wait", params={"ids": "1", "mode": "some"}),
+        )
+
+    timed_out, missing, bad_mode = api(requests)
+
+    assert timed_out.json()["timed_out"] is True
+    assert timed_out.json()["summary"]["pending"] == 1
+    assert missing.status_code == 404
+    assert bad_mode.status_code == 400
+
+def test_status_endpoints_served_from_counters(api, db, fake_redis):
+    db.add_all([
+        Device(device_id="device-1", device_type="device", status="busy", max_concurrent_jobs=1, current_jobs=1),
+        Device(device_id="emulator-1", device_type="emulator", status="available", max_concurrent_jobs=2,
+               current_jobs=0),
+        Job(org_id="qualgent", app_version_id="v1", test_path="tests/a.spec.js", priority=4, target="device",
+            status="running", device_id=1),
+        Job(org_id="qualgent", app_version_id="v1", test_path="tests/b.spec.js", priority=2, target="emulator",
+            status="queued"),
+    ])
+    db.commit()
+
+    async def requests(client):
+        return await asyncio.gather(client.get("/queues/status"), client.get("/devices/status"))
+
+    QueueCounters(fake_redis).reconcile(db)
+    record_batch_stats("emulator", jobs=3, installs=1, warm_hits=1)
+    queues, devices = api(requests)
+
+    expected = queue_stats.get_queue_status(db)
+    assert queues.json()["priority_breakdown"] == expected["priority_breakdown"]
+    assert queues.json()["queue_summary"] == expected["queue_summary"]
+    assert devices.json() == DeviceManager(db).get_device_status()
+    assert devices.json()["by_type"]["emulator"]["app_cache"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+    # Counters, not the database, answer once reconciled
+    fake_redis.hincrby(QueueCounters(fake_redis).jobs_key, "1:queued:emulator", 5)
+    queues, _ = api(requests)
+    assert queues.json()["priority_breakdown"]["priority_1"]["queued_jobs"] == 5
+
+def test_fair_share_submission_goes_through_ready_set(api, fake_redis, monkeypatch):
+    monkeypatch.setattr(main, 'FAIR_SHARE_SCHEDULING', True)
+    monkeypatch.setattr(main, 'release_ready_jobs', lambda: 0)
+    payload = {"jobs": [
+        {"org_id": "qualgent", "app_version_id": "v1", "test_path": f"tests/{i}.spec.js"} for i in range(3)
+    ]}
+
+    async def requests(client):
+        submitted = await client.post("/jobs/submit/bulk", json=payload)
+        cancelled = await client.delete(f"/jobs/{submitted.json()['jobs'][0]['job_id']}")
+        return submitted, cancelled
+
+    submitted, cancelled = api(requests)
+
+    assert submitted.status_code == 200 and cancelled.status_code == 200
+    assert api.signalled == []  # Batches are signalled on release, not submission
+    ids = [job["job_id"] for job in submitted.json()["jobs"]]
+    ready = fake_redis.zrange(main.ReadySet(fake_redis).ready_key("emulator"), 0, -1)
+    assert sorted(int(job_id) for job_id in ready) == ids[1:]
+
+def test_busy_pool_recommendation_matches_the_sync_estimate(api, db):
+    db.add(Device(device_id="emulator-1", device_type="emulator", status="busy", max_concurrent_jobs=1,
+                  current_jobs=1))
+    db.add_all([Job(org_id="o", app_version_id="v1", test_path="tests/a.spec.js", target="emulator", priority=1,
+                    status=status) for status in ("running", "queued")])
+    db.commit()
+
+    response = api(lambda client: client.get("/devices/recommendations/emulator",
+                                             params={"priority": 2, "test_path": "tests/a.spec.js"}))
+
+    expected = DeviceManager(db).get_device_recommendations("emulator", 2, "tests/a.spec.js")
+    assert response.json() == expected
+    assert expected["recommendation"] == "queue_and_wait"
+    assert expected["estimated_run_time"] == 30
@@ -0,0 +1,140 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from celery.exceptions import Retry
+
+from backend.models import Device, Job
+from backend.queue import batching, tasks
+from backend.queue.batching import app_cache_stats, batch_stats, claim_batch, linger_seconds, record_batch_stats
+
+def add_jobs(db, count, app_version_id="v1", target="emulator", priority=1, status="queued"):
+    for i in range(count):
+        db.add(Job(
+            org_id="org",
+            app_version_id=app_version_id,
+            test_path=f"tests/{app_version_id}_{i}.spec.js",
+            priority=priority,
+            target=target,
+            status=status
+        ))
+    db.commit()
+
+def add_device(db, device_id="emulator-1", device_type="emulator"):
+    device = Device(device_id=device_id, device_type=device_type, status="available",
+                    max_concurrent_jobs=5, current_jobs=1)
+    db.add(device)
+    db.commit()
+    return device
+
+def test_claim_only_takes_queued_jobs_of_the_batch(db):
+    device = add_device(db)
+    add_jobs(db, 3)
+    add_jobs(db, 2, status="completed")
+    add_jobs(db, 2, app_version_id="v2")
+    add_jobs(db, 2, target="device")
+
+    claimed = claim_batch(db, "v1", "emulator", device)
+
+    assert len(claimed) == 3
+    assert {job.status for job in claimed} == {"running"}
+    assert {job.assigned_device_name for job in claimed} == {"emulator-1"}
+    assert db.query(Job).filter(Job.status == "queued").count() == 4
+
+def test_claim_respects_max_batch_size_and_priority(db):
+    device = add_device(db)
+    add_jobs(db, 3, priority=1)
+    add_jobs(db, 2, priority=5)
+
+    claimed = claim_batch(db, "v1", "emulator", device, max_batch_size=3)
+
+    assert [job.priority for job in claimed] == [5, 5, 1]
+    assert db.query(Job).filter(Job.status == "queued").count() == 2
+
+def test_concurrent_claims_never_share_a_job(db, session_factory):
+    device = add_device(db)
+    add_jobs(db, 40)
+    claimers = 8
+    barrier = threading.Barrier(claimers)
+    claimed_ids = []
+    lock = threading.Lock()
+
+    def claimer():
+        session = session_factory()
+        try:
+            barrier.wait()
+            jobs = claim_batch(session, "v1", "emulator", session.get(Device, device.id), max_batch_size=7)
+            with lock:
+                claimed_ids.extend(job.id for job in jobs)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=claimer) for _ in range(claimers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(claimed_ids) == len(set(claimed_ids)) == 40
+
+def test_linger_shrinks_with_priority(monkeypatch):
+    monkeypatch.setattr(batching, "BATCH_LINGER_SECONDS", 8.0)
+
+    assert [linger_seconds(priority) for priority in range(1, 6)] == [8.0, 6.0, 4.0, 2.0, 0.0]
+
+def test_urgent_signal_does_not_wait_for_a_lingering_dispatcher(monkeypatch):
+    monkeypatch.setattr(batching, "BATCH_LINGER_SECONDS", 8.0)
+    enqueued = []
+    monkeypatch.setattr(tasks.dispatch_batch, "apply_async",
+                        lambda **kwargs: enqueued.append(kwargs) or SimpleNamespace(id="task"))
+
+    assert tasks.enqueue_batch_dispatch("v1", "emulator", 4)
+    assert not tasks.enqueue_batch_dispatch("v1", "emulator", 4)  # Coalesced into the lingering one
+    assert tasks.enqueue_batch_dispatch("v1", "emulator", 5)  # Cannot wait 2s
+    assert not tasks.enqueue_batch_dispatch("v1", "emulator", 4)
+
+    assert [kwargs["countdown"] for kwargs in enqueued] == [2.0, None]
+
+def test_busy_pool_backs_off_and_keeps_the_batch_queued(db, session_factory, monkeypatch):
+    monkeypatch.setattr(tasks, "SessionLocal", session_factory)
+    db.add(Device(device_id="emulator-1", device_type="emulator", status="busy",
+                  max_concurrent_jobs=1, current_jobs=1))
+    db.commit()
+    add_jobs(db, 2)
+    retries = []
+
+    def dispatch(attempt):
+        batching.release_batch_signal("v1", "emulator", "normal_priority")
+        task = SimpleNamespace(request=SimpleNamespace(id="test", retries=attempt),
+                               retry=lambda **kwargs: retries.append(kwargs) or Retry())
+        with pytest.raises(Retry):
+            tasks._run_batch(task, "v1", "emulator", 2)
+
+    for attempt in (0, 1, 10):
+        dispatch(attempt)
+
+    assert retries == [{"countdown": 10, "max_retries": None}, {"countdown": 20, "max_retries": None},
+                       {"countdown": tasks.DEVICE_RETRY_MAX_DELAY, "max_retries": None}]
+    assert {job.status for job in db.query(Job)} == {"queued"}
+
+def test_batch_without_any_device_of_its_target_fails(db, session_factory, monkeypatch):
+    monkeypatch.setattr(tasks, "SessionLocal", session_factory)
+    add_device(db, device_type="device")
+    add_jobs(db, 2)
+    task = SimpleNamespace(request=SimpleNamespace(id="test", retries=0))
+
+    result = tasks._run_batch(task, "v1", "emulator", 2)
+
+    assert result["status"] == "failed"
+    assert result["error"] == "No emulator devices configured"
+    assert {job.status for job in db.query(Job)} == {"failed"}
+
+def test_batch_stats_totals():
+    record_batch_stats("emulator", jobs=6, installs=2, warm_hits=1)
+    record_batch_stats("emulator", jobs=2, installs=0, warm_hits=1)
+    record_batch_stats("device", jobs=1, installs=1, warm_hits=0)
+
+    assert batch_stats() == {"batches": 3, "jobs": 9, "installs": 3, "installs_avoided": 6,
+                             "warm_device_hits": 2, "average_batch_size": 3.0}
+    assert app_cache_stats() == {"device": {"hits": 0, "misses": 1, "hit_rate": 0.0},
+                                 "emulator": {"hits": 2, "misses": 2, "hit_rate": 0.5}}
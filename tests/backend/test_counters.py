@@ -0,0 +1,98 @@
+from backend.models import Device, Job
+from backend.queue.batching import claim_batch
+from backend.services import events
+from backend.services.counters import QueueCounters, priority_allocation
+from backend.services.device_manager import DeviceManager
+
+def submit(db, count, priority=2, target="emulator", app_version_id="v1"):
+    """Record queued jobs and publish their events, like POST /jobs/submit."""
+    jobs = [
+        Job(org_id="org", app_version_id=app_version_id, test_path=f"tests/{i}.spec.js",
+            priority=priority, target=target, status="queued")
+        for i in range(count)
+    ]
+    db.add_all(jobs)
+    db.commit()
+    events.publish_events(events.job_event(job) for job in jobs)
+    return jobs
+
+def test_transitions_keep_counters_in_step(db, fake_redis):
+    device = Device(device_id="emulator-1", device_type="emulator", status="available",
+                    max_concurrent_jobs=2, current_jobs=0)
+    db.add(device)
+    db.commit()
+    events.publish_event(events.device_event(device, "registered"))
+    counters = QueueCounters(fake_redis)
+    assert counters.reconcile(db)["drifted"] == 0
+
+    submit(db, 3)
+    manager = DeviceManager(db)
+    allocated = manager.allocate_device("emulator", 2)
+    claimed = claim_batch(db, "v1", "emulator", allocated, max_batch_size=2)
+    events.publish_events(events.job_event(job, "queued") for job in claimed)
+    claimed[0].status = "completed"
+    db.commit()
+    events.publish_event(events.job_event(claimed[0], "running"))
+    claimed[1].status = "failed"
+    db.commit()
+    events.publish_event(events.job_event(claimed[1], "running", cancelled=True))
+    manager.release_device(allocated.id)
+
+    assert counters.job_counts() == {(2, "queued", "emulator"): 1}
+    devices, _ = counters.snapshot()
+    assert devices == [{"device_id": "emulator-1", "type": "emulator", "status": "available",
+                        "current_jobs": 0, "max_jobs": 2}]
+    assert counters.reconcile(db)["drifted"] == 0
+
+def test_reconcile_reports_and_repairs_drift(db, fake_redis):
+    counters = QueueCounters(fake_redis)
+    # Written without events, e.g. by a seed script
+    db.add_all([
+        Device(device_id="device-1", device_type="device", status="busy", max_concurrent_jobs=1, current_jobs=1),
+        Job(org_id="org", app_version_id="v1", test_path="tests/a.spec.js", priority=5,
+            target="device", status="running"),
+    ])
+    db.commit()
+
+    assert counters.job_counts() is None  # Not trusted before the first reconciliation
+
+    drift = counters.reconcile(db)
+    assert drift["jobs"] == {"5:running:device": {"counter": None, "actual": "1"}}
+    assert drift["devices"]["device-1"]["jobs"] == {"counter": None, "actual": "1"}
+
+    fake_redis.hincrby(counters.jobs_key, "5:running:device", 2)
+    fake_redis.hincrby(counters.jobs_key, "1:queued:emulator", -1)
+    drift = counters.reconcile(db)
+
+    assert drift["drifted"] == 2
+    assert drift["jobs"]["5:running:device"] == {"counter": "3", "actual": "1"}
+    assert counters.job_counts() == {(5, "running", "device"): 1}
+
+def test_priority_allocation_from_counters():
+    stats = priority_allocation({
+        (5, "running", "device"): 2, (5, "running", "emulator"): 1, (5, "queued", "device"): 4,
+        (1, "queued", "emulator"): 3,
+    })
+
+    assert stats["priority_5"] == {"running_jobs": 3, "queued_jobs": 4,
+                                   "devices_by_type": {"device": 2, "emulator": 1}}
+    assert stats["priority_1"] == {"running_jobs": 0, "queued_jobs": 3, "devices_by_type": {}}
+    assert stats["priority_3"]["running_jobs"] == 0
+
+def test_database_fallback_matches_the_counters(db, fake_redis):
+    db.add_all([
+        Job(org_id="org", app_version_id="v1", test_path="tests/a.spec.js", priority=5,
+            target="device", status="running"),
+        Job(org_id="org", app_version_id="v1", test_path="tests/b.spec.js", priority=5,
+            target="device", status="queued"),
+        Job(org_id="org", app_version_id="v1", test_path="tests/c.spec.js", priority=1,
+            target="emulator", status="completed"),
+    ])
+    db.commit()
+    counters = QueueCounters(fake_redis)
+    counters.reconcile(db)
+
+    stats = DeviceManager(db)._get_priority_allocation_stats()
+
+    assert stats == priority_allocation(counters.job_counts())
+    assert stats["priority_5"] == {"running_jobs": 1, "queued_jobs": 1, "devices_by_type": {"device": 1}}
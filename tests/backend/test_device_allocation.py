@@ -0,0 +1,201 @@
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+
+from backend.models import Device, Job
+from backend.services.device_manager import DeviceManager, select_preemption_victim
+
+ALLOCATORS = 64
+
+def add_devices(db, configs):
+    for device_id, device_type, max_jobs, current_jobs in configs:
+        db.add(Device(
+            device_id=device_id,
+            device_type=device_type,
+            status="available" if current_jobs < max_jobs else "busy",
+            max_concurrent_jobs=max_jobs,
+            current_jobs=current_jobs
+        ))
+    db.commit()
+
+def test_allocation_marks_full_device_busy(db):
+    add_devices(db, [("emulator-1", "emulator", 2, 0)])
+    manager = DeviceManager(db)
+
+    assert manager.allocate_device("emulator", 3).device_id == "emulator-1"
+    device = manager.allocate_device("emulator", 3)
+    assert device.current_jobs == 2
+    assert device.status == "busy"
+    assert manager.allocate_device("emulator", 3) is None
+
+def test_allocation_waits_for_locked_candidates_once(db):
+    add_devices(db, [("emulator-1", "emulator", 2, 0)])
+    manager = DeviceManager(db)
+    statement = manager._allocation_statement
+    attempts = []
+
+    def every_candidate_locked(target_type, priority, app_version_id=None, skip_locked=True):
+        attempts.append(skip_locked)
+        # SKIP LOCKED sees no candidate while another allocator holds the row
+        return statement("locked" if skip_locked else target_type, priority, app_version_id, skip_locked)
+
+    manager._allocation_statement = every_candidate_locked
+
+    assert manager.allocate_device("emulator", 3).device_id == "emulator-1"
+    assert attempts == [True, False]
+    assert "SKIP LOCKED" in str(statement("emulator", 3).compile(dialect=postgresql.dialect()))
+    assert "SKIP LOCKED" not in str(statement("emulator", 3, skip_locked=False).compile(dialect=postgresql.dialect()))
+
+@pytest.mark.parametrize("priority, expected", [(5, "emulator-idle"), (3, "emulator-idle"), (1, "emulator-loaded")])
+def test_allocation_strategy_by_priority(db, priority, expected):
+    add_devices(db, [
+        ("emulator-idle", "emulator", 4, 0),
+        ("emulator-loaded", "emulator", 4, 3),
+        ("device-1", "device", 4, 0),
+    ])
+
+    assert DeviceManager(db).allocate_device("emulator", priority).device_id == expected
+
+def test_allocation_prefers_devices_with_the_version_installed(db):
+    add_devices(db, [
+        ("emulator-idle", "emulator", 4, 0),
+        ("emulator-warm", "emulator", 4, 2),
+    ])
+    db.query(Device).filter(Device.device_id == "emulator-warm").one().installed_app_versions = '["v1", "v7"]'
+    db.commit()
+    manager = DeviceManager(db)
+
+    assert manager.allocate_device("emulator", 3, app_version_id="v7").device_id == "emulator-warm"
+    assert manager.allocate_device("emulator", 3, app_version_id="v8").device_id == "emulator-idle"
+    assert manager.allocate_device("emulator", 3, app_version_id="v%").device_id == "emulator-idle"
+
+def test_installed_versions_are_an_lru_set(db):
+    add_devices(db, [("emulator-1", "emulator", 2, 0), ("emulator-2", "emulator", 2, 0)])
+    manager = DeviceManager(db)
+    ids = [device.id for device in db.query(Device).order_by(Device.id)]
+    for device in db.query(Device):
+        device.app_storage_slots = 2
+    db.commit()
+
+    assert manager.use_app_version(ids, "v1") == ["emulator-1", "emulator-2"]
+    assert manager.use_app_version(ids[:1], "v2") == ["emulator-1"]
+    assert manager.use_app_version(ids, "v1") == []  # Hit on both; v1 is most recent again
+    assert manager.use_app_version(ids[:1], "v3") == ["emulator-1"]  # Evicts v2, not v1
+
+    assert db.get(Device, ids[0]).installed_versions == ["v3", "v1"]
+    assert db.get(Device, ids[1]).installed_versions == ["v1"]
+
+def test_preemption_victim_comes_from_one_query(db):
+    add_devices(db, [
+        ("emulator-big", "emulator", 4, 4),
+        ("emulator-old", "emulator", 1, 1),
+        ("emulator-new", "emulator", 1, 1),
+        ("emulator-urgent", "emulator", 1, 1),
+        ("device-1", "device", 1, 1),
+    ])
+    devices = {device.device_id: device.id for device in db.query(Device)}
+    running = [
+        ("emulator-big", 1, 10), ("emulator-big", 1, 11), ("emulator-big", 2, 12), ("emulator-big", 5, 13),
+        ("emulator-old", 2, 1),
+        ("emulator-new", 2, 30),
+        ("emulator-urgent", 4, 40),
+        ("device-1", 1, 50),
+    ]
+    for device_id, priority, minute in running:
+        db.add(Job(org_id="org", app_version_id="v1", test_path="t.spec.js", target="emulator",
+                   status="running", priority=priority, device_id=devices[device_id],
+                   updated_at=datetime(2024, 1, 1, 12, minute)))
+    db.commit()
+    manager = DeviceManager(db)
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        candidates = manager._preemption_candidates("emulator", 5)
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+
+    assert len(statements) == 1
+    assert {c.device_id: (c.running_jobs, c.evictable_jobs, c.min_priority) for c in candidates} == {
+        "emulator-big": (4, 3, 1),
+        "emulator-old": (1, 1, 2),
+        "emulator-new": (1, 1, 2),
+    }
+    # Fewest jobs to evict, then lowest priority, then least progress
+    assert select_preemption_victim(candidates).device_id == "emulator-new"
+    assert select_preemption_victim([]) is None
+    assert manager.get_device_recommendations("emulator", 5)["device_id"] == "emulator-new"
+
+def test_concurrent_allocators_never_over_allocate(db, session_factory):
+    """64 allocators race for 12 slots: exactly 12 succeed and no device exceeds its limit."""
+    add_devices(db, [
+        ("browserstack-1", "browserstack", 5, 0),
+        ("browserstack-2", "browserstack", 5, 0),
+        ("browserstack-3", "browserstack", 2, 0),
+    ])
+    barrier = threading.Barrier(ALLOCATORS)
+    allocated = []
+    lock = threading.Lock()
+
+    def allocator(priority):
+        session = session_factory()
+        try:
+            barrier.wait()
+            device = DeviceManager(session).allocate_device("browserstack", priority, allow_preemption=False)
+            if device:
+                with lock:
+                    allocated.append(device.device_id)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=allocator, args=(i % 5 + 1,)) for i in range(ALLOCATORS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db.expire_all()
+    devices = {d.device_id: d for d in db.query(Device).all()}
+    assert len(allocated) == 12
+    for device_id, device in devices.items():
+        assert device.current_jobs <= device.max_concurrent_jobs
+        assert device.current_jobs == allocated.count(device_id)
+        assert device.status == "busy"
+
+def test_release_is_an_atomic_decrement(db, session_factory):
+    """Releases racing allocations never overwrite their increments."""
+    add_devices(db, [("emulator-1", "emulator", 4, 2)])
+    device_pk = db.query(Device.id).scalar()
+    barrier = threading.Barrier(8)
+    allocated = []
+
+    def worker(i):
+        session = session_factory()
+        try:
+            barrier.wait()
+            if i % 2:
+                DeviceManager(session).release_device(device_pk)
+            elif DeviceManager(session).allocate_device("emulator", 3, allow_preemption=False):
+                allocated.append(i)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db.expire_all()
+    device = db.query(Device).one()
+    assert 0 <= device.current_jobs <= 4
+    assert device.status == ("busy" if device.current_jobs == 4 else "available")
+
+    for _ in range(device.current_jobs + 1):  # One more than it runs: a no-op
+        DeviceManager(db).release_device(device_pk)
+    db.expire_all()
+    assert (device.current_jobs, device.status) == (0, "available")
@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from backend import main
+from backend.models import Device, Job
+from backend.services import events
+from backend.services.device_manager import DeviceManager
+
+def collect(fake_redis, action, count, types=None):
+    """Run action while subscribed and return the first `count` events it publishes."""
+    async def scenario():
+        stream = events.subscribe(types, heartbeat=0.05)
+        await stream.__anext__()  # Subscribed
+        await asyncio.to_thread(action)
+        received = []
+        async for event in stream:
+            if event is None:
+                break
+            received.append(event)
+            if len(received) == count:
+                break
+        await stream.aclose()
+        return received
+
+    return asyncio.run(scenario())
+
+def test_allocation_and_release_publish_device_events(fake_redis, db):
+    db.add(Device(device_id="emulator-1", device_type="emulator", status="available",
+                  max_concurrent_jobs=1, current_jobs=0))
+    db.commit()
+
+    def allocate_and_release():
+        manager = DeviceManager(db)
+        device = manager.allocate_device("emulator", priority=2)
+        manager.release_device(device.id)
+
+    received = collect(fake_redis, allocate_and_release, 2, types=["device"])
+
+    assert [(e["type"], e["status"], e["current_jobs"]) for e in received] == [
+        ("device.allocated", "busy", 1),
+        ("device.released", "available", 0),
+    ]
+
+def test_subscribe_filters_by_type_prefix(fake_redis):
+    job = Job(id=7, status="completed", priority=3, target="emulator", app_version_id="v1",
+              test_path="tests/a.spec.js", assigned_device_name="emulator-1")
+
+    def publish():
+        events.publish_events([
+            {"type": "device.allocated", "device_id": "emulator-1"},
+            events.job_event(job, "running"),
+        ])
+
+    received = collect(fake_redis, publish, 1, types=["job.completed"])
+
+    assert received[0]["job_id"] == 7
+    assert received[0]["previous_status"] == "running"
+
+def test_publish_without_redis_does_not_raise(monkeypatch):
+    class Unavailable:
+        def pipeline(self, **kwargs):
+            raise ConnectionError("redis down")
+
+    monkeypatch.setattr(events, 'get_redis', lambda: Unavailable())
+
+    assert events.publish_event({"type": "job.queued"}) == 0
+
+def test_sse_framing():
+    event = {"type": "job.running", "job_id": 1}
+
+    assert main._format_sse(None) == ": keep-alive\n\n"
+    framed = main._format_sse(event)
+    assert framed.startswith("event: job.running\ndata: ")
+    assert json.loads(framed.split("data: ", 1)[1]) == event
@@ -0,0 +1,67 @@
+from sqlalchemy import create_engine, func, inspect, select, text, tuple_
+
+from backend.migrations import upgrade_schema
+from backend.models import Job
+from backend.models.job import ACTIVE_STATUSES
+
+def query_plan(db, statement) -> str:
+    """Return SQLite's EXPLAIN QUERY PLAN for a statement with literal parameters."""
+    sql = statement.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True})
+    rows = db.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+    return "\n".join(row[-1] for row in rows)
+
+def test_batch_claim_uses_composite_index(db):
+    plan = query_plan(db, select(Job.id).where(
+        Job.app_version_id == "v1", Job.target == "emulator", Job.status == "queued"
+    ))
+    assert "ix_jobs_app_version_target_status" in plan
+
+def test_active_priority_counts_use_partial_index(db):
+    plan = query_plan(db, select(Job.priority, Job.status, func.count(Job.id))
+                      .where(Job.status.in_(ACTIVE_STATUSES))
+                      .group_by(Job.priority, Job.status))
+    assert "ix_jobs_active_priority_status" in plan
+
+def test_preemption_candidates_use_device_index(db):
+    plan = query_plan(db, select(Job.id).where(
+        Job.device_id == 1, Job.status == "running", Job.priority < 3
+    ))
+    assert "ix_jobs_device_status_priority" in plan
+
+def test_recent_jobs_ordering_uses_created_at_index(db):
+    plan = query_plan(db, select(Job).order_by(Job.created_at.desc()).limit(50))
+    assert "ix_jobs_created_at_id" in plan
+    assert "TEMP B-TREE" not in plan  # No sort step
+
+def test_priority_keyset_page_uses_priority_index(db):
+    plan = query_plan(db, select(Job).where(tuple_(Job.priority, Job.id) > (2, 100))
+                      .order_by(Job.priority, Job.id).limit(50))
+    assert "ix_jobs_priority_id" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_upgrade_schema_adds_missing_indexes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        # Tables as created before the indexes, app version and shard columns were declared
+        conn.exec_driver_sql(
+            "CREATE TABLE devices (id INTEGER PRIMARY KEY, device_id VARCHAR NOT NULL, "
+            "device_type VARCHAR NOT NULL, status VARCHAR NOT NULL, max_concurrent_jobs INTEGER, "
+            "current_jobs INTEGER, location VARCHAR, capabilities VARCHAR, last_health_check DATETIME, "
+            "created_at DATETIME, updated_at DATETIME)"
+        )
+        conn.exec_driver_sql("INSERT INTO devices (device_id, device_type, status) VALUES ('emulator-1', 'emulator', 'available')")
+        conn.exec_driver_sql(
+            "CREATE TABLE jobs (id INTEGER PRIMARY KEY, org_id VARCHAR, app_version_id VARCHAR, "
+            "test_path VARCHAR, priority INTEGER, target VARCHAR, status VARCHAR, device_id INTEGER, "
+            "assigned_device_name VARCHAR, created_at DATETIME, updated_at DATETIME)"
+        )
+
+    created = upgrade_schema(engine)
+
+    expected = {index.name for index in Job.__table__.indexes}
+    assert set(created) == expected | {"devices.installed_app_versions", "devices.app_storage_slots",
+                                       "jobs.parent_job_id", "jobs.shard_index", "jobs.shard_count"}
+    assert {ix["name"] for ix in inspect(engine).get_indexes("jobs")} == expected
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT installed_app_versions, app_storage_slots FROM devices").one() == (None, 3)
+    assert upgrade_schema(engine) == []
@@ -0,0 +1,40 @@
+import asyncio
+import os
+import sys
+
+from backend.services import output_capture
+from backend.services.real_test_runner import RealTestRunner
+
+NOISY_SCRIPT = """
+import sys
+for i in range(20000):
+    print(f"line {i} " + "x" * 100)
+print("warning: slow device", file=sys.stderr)
+sys.stdout.write("y" * 100000)
+"""
+
+def test_output_streams_to_a_rotating_log_and_keeps_only_the_tail(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_capture, "TEST_LOG_MAX_BYTES", 512 * 1024)
+    monkeypatch.setattr(output_capture, "TEST_LOG_BACKUPS", 1)
+    log_path = str(tmp_path / "job-1.log")
+
+    result = asyncio.run(RealTestRunner("emulator")._run_command(
+        [sys.executable, "-c", NOISY_SCRIPT], log_path=log_path))
+
+    assert result["success"]
+    assert result["output_bytes"] > 2_000_000
+    lines = result["output"].split("\n")
+    assert len(lines) == output_capture.TEST_OUTPUT_TAIL_LINES
+    # The unterminated 100KB line is split into MAX_LINE_BYTES pieces
+    pieces = -(-100000 // output_capture.MAX_LINE_BYTES)
+    assert lines[-pieces - 1].startswith("line 19999 ")
+    assert "".join(lines[-pieces:]) == "y" * 100000
+    assert result["error"] == "warning: slow device"
+
+    # Two files of at most 512KB on disk, the newest ending with the full output
+    assert sorted(os.listdir(tmp_path)) == ["job-1.log", "job-1.log.1"]
+    assert os.path.getsize(log_path) <= 512 * 1024
+    with open(log_path) as f:
+        log = f.read()
+    assert "[stderr] warning: slow device\n" in log
+    assert log.endswith("y" * (100000 % output_capture.MAX_LINE_BYTES) + "\n")
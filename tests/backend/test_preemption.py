@@ -0,0 +1,222 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from celery.exceptions import Retry
+
+from backend.models import Device, Job, TestResult
+from backend.queue import tasks
+from backend.services import preemption, test_runner
+
+TEST_SECONDS = 0.3
+
+class Broker:
+    """Runs signalled high priority batches at once in their own thread, like an idle worker."""
+
+    def __init__(self):
+        self.threads = []
+        self.deferred = []
+
+    def enqueue(self, app_version_id, target, priority, producer=None, linger=True):
+        if priority < 4:
+            self.deferred.append((app_version_id, target, priority))
+            return True
+        thread = threading.Thread(target=self.dispatch, args=(app_version_id, target, priority))
+        thread.start()
+        self.threads.append(thread)
+        return True
+
+    def dispatch(self, app_version_id, target, priority):
+        task = SimpleNamespace(request=SimpleNamespace(id="test", retries=0),
+                               retry=lambda **kwargs: Retry())
+        try:
+            return tasks._run_batch(task, app_version_id, target, priority)
+        except Retry:
+            return {"status": "retry"}
+
+@pytest.fixture
+def batch_env(session_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(tasks, "SessionLocal", session_factory)
+    monkeypatch.setattr(tasks, "PREEMPT_POLL_INTERVAL", 0.02)
+    monkeypatch.setattr(test_runner.TestRunner, "EXECUTION_TIMES", {"emulator": TEST_SECONDS})
+    broker = Broker()
+    monkeypatch.setattr(tasks, "enqueue_batch_dispatch", broker.enqueue)
+
+    running = [0]
+    peak = [0]
+    lock = threading.Lock()
+    run_tests = test_runner.TestRunner.run_tests
+
+    async def counting_run_tests(self, test_path, app_version_id, **kwargs):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        try:
+            return await run_tests(self, test_path, app_version_id, **kwargs)
+        finally:
+            with lock:
+                running[0] -= 1
+
+    monkeypatch.setattr(test_runner.TestRunner, "run_tests", counting_run_tests)
+
+    spec = tmp_path / "login.spec.js"
+    spec.write_text("test('login', async () => {});")
+    return SimpleNamespace(broker=broker, peak=peak, spec=str(spec))
+
+def add_jobs(db, count, priority, app_version_id, spec):
+    jobs = [Job(org_id="org", app_version_id=app_version_id, test_path=spec, priority=priority,
+                target="emulator", status="queued") for _ in range(count)]
+    db.add_all(jobs)
+    db.commit()
+    return [job.id for job in jobs]
+
+def test_priority_5_preempts_running_batch_without_oversubscribing(db, batch_env):
+    db.add(Device(device_id="emulator-1", device_type="emulator", status="available",
+                  max_concurrent_jobs=1, current_jobs=0))
+    db.commit()
+    low_ids = add_jobs(db, 6, 1, "v-low", batch_env.spec)
+
+    over_allocated = []
+    done = threading.Event()
+
+    def monitor():
+        session = type(db)(bind=db.get_bind())
+        while not done.is_set():
+            device = session.query(Device).one()
+            if device.current_jobs > device.max_concurrent_jobs:
+                over_allocated.append(device.current_jobs)
+            session.rollback()
+            time.sleep(0.005)
+        session.close()
+
+    watcher = threading.Thread(target=monitor)
+    watcher.start()
+    low = threading.Thread(target=batch_env.broker.dispatch, args=("v-low", "emulator", 1))
+    low.start()
+    time.sleep(TEST_SECONDS / 2)
+
+    submitted_at = time.monotonic()
+    high_id = add_jobs(db, 1, 5, "v-high", batch_env.spec)[0]
+    assert batch_env.broker.dispatch("v-high", "emulator", 5)["status"] == "retry"  # Asked for a slot
+    low.join()
+    for thread in batch_env.broker.threads:
+        thread.join()
+    latency = time.monotonic() - submitted_at
+
+    # The low batch stopped mid-test and re-queued the rest instead of running them first
+    assert db.get(Job, high_id).status == "completed"
+    assert latency < TEST_SECONDS * 3  # Behind the low batch it would wait ~5.5 tests
+    assert batch_env.broker.deferred == [("v-low", "emulator", 1)]
+
+    for job_id in low_ids:
+        db.expire(db.get(Job, job_id))
+    requeued = [job_id for job_id in low_ids if db.get(Job, job_id).status == "queued"]
+    assert len(requeued) == 6  # The stopped job and the five that never started
+    assert all(db.get(Job, job_id).device_id is None for job_id in requeued)
+
+    # Re-dispatched with their original priority, they all run
+    batch_env.broker.dispatch(*batch_env.broker.deferred[0])
+    done.set()
+    watcher.join()
+
+    db.expire_all()
+    assert {db.get(Job, job_id).status for job_id in low_ids} == {"completed"}
+    assert db.query(Device).one().current_jobs == 0
+    # One test result per job, none for the run that was stopped
+    assert sorted(row.job_id for row in db.query(TestResult)) == sorted(low_ids + [high_id])
+    assert batch_env.peak[0] == 1
+    assert over_allocated == []
+
+def test_extra_slots_leave_room_for_other_waiting_batches(db, batch_env):
+    db.add_all([Device(device_id=f"emulator-{i}", device_type="emulator", status="available",
+                       max_concurrent_jobs=1, current_jobs=0) for i in range(2)])
+    db.commit()
+    first_ids = add_jobs(db, 4, 2, "v1", batch_env.spec)
+    second_ids = add_jobs(db, 2, 2, "v2", batch_env.spec)
+
+    results = {}
+
+    def dispatch(app_version_id):
+        results[app_version_id] = batch_env.broker.dispatch(app_version_id, "emulator", 2)
+
+    threads = [threading.Thread(target=dispatch, args=(app_version_id,)) for app_version_id in ("v1", "v2")]
+    threads[0].start()
+    time.sleep(TEST_SECONDS / 3)
+    threads[1].start()
+    for thread in threads:
+        thread.join()
+
+    # Without the reserve, v1 would take both slots and v2 would go into retries
+    assert results["v1"]["batch_summary"]["parallel_slots"] == 1
+    assert results["v2"]["status"] == "completed"
+    assert results["v2"]["batch_summary"]["parallel_slots"] == 1
+    assert batch_env.peak[0] == 2
+    db.expire_all()
+    assert {db.get(Job, job_id).status for job_id in first_ids + second_ids} == {"completed"}
+
+def test_ask_only_stops_work_below_the_requester(fake_redis):
+    assert preemption.request(1, "v-high", "emulator", 4)
+
+    assert preemption.take(1, 5) is None  # Sharing the device with the victim, not one itself
+    assert preemption.take(1, 3) is None
+    assert preemption.take(1, 2)["app_version_id"] == "v-high"
+    assert preemption.take(1, 1) is None  # Taken once
+
+def test_shared_device_gives_up_the_lower_priority_slot(db, batch_env):
+    db.add(Device(device_id="emulator-1", device_type="emulator", status="available",
+                  max_concurrent_jobs=2, current_jobs=0))
+    db.commit()
+    low_ids = add_jobs(db, 4, 1, "v-low", batch_env.spec)
+    top_ids = add_jobs(db, 2, 5, "v-top", batch_env.spec)
+
+    results = {}
+
+    def dispatch(app_version_id, priority):
+        results[app_version_id] = batch_env.broker.dispatch(app_version_id, "emulator", priority)
+
+    threads = [threading.Thread(target=dispatch, args=args) for args in (("v-low", 1), ("v-top", 5))]
+    for thread in threads:
+        thread.start()
+    time.sleep(TEST_SECONDS / 2)
+    add_jobs(db, 1, 4, "v-high", batch_env.spec)
+    assert batch_env.broker.dispatch("v-high", "emulator", 4)["status"] == "retry"  # Asked for a slot
+    for thread in threads + batch_env.broker.threads:
+        thread.join()
+
+    assert results["v-top"]["batch_summary"]["preempted_jobs"] == []
+    assert results["v-low"]["batch_summary"]["preempted_jobs"]
+    db.expire_all()
+    assert {db.get(Job, job_id).status for job_id in top_ids} == {"completed"}
+    assert {db.get(Job, job_id).status for job_id in low_ids} == {"queued"}
+
+def test_cancelled_jobs_are_neither_completed_nor_requeued(db, session_factory, batch_env, monkeypatch, fake_redis):
+    db.add(Device(device_id="emulator-1", device_type="emulator", status="available",
+                  max_concurrent_jobs=1, current_jobs=0))
+    db.commit()
+    job_id, other_id = add_jobs(db, 2, 2, "v1", batch_env.spec)
+    published = []
+    monkeypatch.setattr(tasks.events, "publish_event", published.append)
+    monkeypatch.setattr(tasks.events, "publish_events", lambda events: published.extend(events))
+    run_tests = test_runner.TestRunner.run_tests
+
+    async def cancelled_meanwhile(self, test_path, app_version_id, job_id=None, **kwargs):
+        session = session_factory()
+        session.get(Job, job_id).status = "failed"  # DELETE /jobs/{id}
+        session.commit()
+        session.close()
+        return await run_tests(self, test_path, app_version_id, job_id=job_id, **kwargs)
+
+    monkeypatch.setattr(test_runner.TestRunner, "run_tests", cancelled_meanwhile)
+    result = batch_env.broker.dispatch("v1", "emulator", 2)
+
+    assert [r["status"] for r in result["batch_summary"]["batch_results"]] == ["failed", "failed"]
+    # Only the claim was published; the cancellation already moved the jobs out of the running counters
+    assert [event["type"] for event in published if event["type"].startswith("job.")] == ["job.running"] * 2
+
+    tasks._requeue_jobs([db.get(Job, job_id)])
+    assert [event["type"] for event in published if event["type"].startswith("job.")] == ["job.running"] * 2
+    db.expire_all()
+    assert {db.get(Job, i).status for i in (job_id, other_id)} == {"failed"}
+    assert db.query(TestResult).count() == 0
+    assert batch_env.broker.deferred == []
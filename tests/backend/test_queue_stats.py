@@ -0,0 +1,26 @@
+from sqlalchemy import event
+
+from backend.models import Job
+from backend.services.queue_stats import get_queue_status
+
+def test_queue_status_counts_with_one_query(db):
+    for priority, status, count in [(5, "queued", 2), (4, "running", 1), (3, "queued", 3),
+                                    (1, "running", 4), (1, "completed", 9), (5, "failed", 2)]:
+        for i in range(count):
+            db.add(Job(org_id="org", app_version_id="v1", test_path=f"t{i}.spec.js",
+                       priority=priority, target="emulator", status=status))
+    db.commit()
+
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    status = get_queue_status(db)
+
+    assert len(statements) == 1
+    assert status["priority_breakdown"]["priority_5"] == {
+        "queue_name": "high_priority", "queued_jobs": 2, "running_jobs": 0, "total_active": 2
+    }
+    assert status["queue_summary"] == {
+        "high_priority": {"queued_jobs": 2, "running_jobs": 1, "total_active": 3},
+        "normal_priority": {"queued_jobs": 3, "running_jobs": 0, "total_active": 3},
+        "low_priority": {"queued_jobs": 0, "running_jobs": 4, "total_active": 4},
+    }
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from backend.services import output_capture, report_parser
+from backend.services.real_test_runner import RealTestRunner
+
+TRICKY = 'a "quoted" {brace} [bracket] \\ and "specs": [{"title": "not a spec"}]'
+
+def result(status, duration, error=None, attachments=()):
+    return {"workerIndex": 0, "status": status, "duration": duration, "retry": 0, "stdout": [{"text": TRICKY}],
+            "stderr": [], "errors": [{"message": error}] if error else [],
+            **({"error": {"message": error}} if error else {}), "attachments": list(attachments)}
+
+def spec(title, line, status, results):
+    return {"title": title, "ok": status != "unexpected", "file": "login.spec.js", "line": line, "column": 1,
+            "tests": [{"projectName": "android", "expectedStatus": "passed", "status": status, "results": results}]}
+
+REPORT = {
+    "config": {"workers": 1, "projects": [{"name": "android", "use": {
+        "platform": "android", "device": {"provider": "emulator", "name": "Pixel 7", "osVersion": "13.0"}}}]},
+    "suites": [{
+        "title": "login.spec.js", "file": "login.spec.js", "line": 0, "column": 0,
+        "specs": [spec("logs in", 3, "expected", [result("passed", 1200)])],
+        "suites": [{
+            "title": "checkout", "file": "login.spec.js", "line": 10, "column": 1,
+            "specs": [
+                spec("pays", 11, "flaky", [
+                    result("failed", 900, error="Timed out", attachments=[
+                        {"name": "trace", "contentType": "application/zip", "path": "/tmp/trace.zip"},
+                        {"name": "log", "contentType": "text/plain", "body": "aW5saW5l"},
+                    ]),
+                    result("passed", 800),
+                ]),
+                spec("refunds", 20, "unexpected", [result("failed", 500, error="x" * 5000)]),
+            ],
+            "suites": [{"title": "guest", "file": "login.spec.js", "line": 30, "column": 1, "specs": [
+                spec("browses", 31, "skipped", [result("skipped", 0)]),
+            ]}],
+        }],
+    }],
+    "errors": [],
+    "stats": {"startTime": "2024-01-01T00:00:00.000Z", "duration": 3400.5,
+              "expected": 1, "skipped": 1, "unexpected": 1, "flaky": 1},
+}
+
+@pytest.fixture
+def report(tmp_path):
+    path = tmp_path / "job-1.report.json"
+    path.write_text(json.dumps(REPORT, indent=2))
+    return str(path)
+
+@pytest.mark.parametrize("chunk", [7, 64 * 1024])  # 7: split every token across reads
+def test_test_cases_are_streamed_from_the_report(report, monkeypatch, chunk):
+    monkeypatch.setattr(output_capture, "READ_CHUNK_BYTES", chunk)
+
+    cases = list(report_parser.iter_test_cases(report))
+
+    assert [(c["title"], c["line"], c["status"], c["duration_ms"], c["retries"]) for c in cases] == [
+        ("logs in", 3, "passed", 1200, 0),
+        ("checkout › pays", 11, "flaky", 1700, 1),
+        ("checkout › refunds", 20, "failed", 500, 0),
+        ("checkout › guest › browses", 31, "skipped", 0, 0),
+    ]
+    assert cases[1]["error"] == "Timed out"
+    assert cases[1]["attachments"] == [{"name": "trace", "content_type": "application/zip", "path": "/tmp/trace.zip"}]
+    assert len(cases[2]["error"]) == report_parser.MAX_ERROR_CHARS
+    assert {c["project"] for c in cases} == {"android"}
+
+def test_oversized_specs_are_skipped(report, monkeypatch):
+    monkeypatch.setattr(report_parser, "MAX_SPEC_BYTES", 100)
+
+    assert list(report_parser.iter_test_cases(report)) == []
+    assert report_parser.read_report_sections(report, ("stats",))["stats"]["flaky"] == 1
+
+def test_report_sections_are_read_incrementally(report, monkeypatch):
+    monkeypatch.setattr(output_capture, "READ_CHUNK_BYTES", 7)
+
+    assert report_parser.read_report_sections(report) == {"stats": REPORT["stats"], "errors": []}
+    assert report_parser.read_report_sections(report, ("stats",), max_value_bytes=10) == {}
+
+def test_runner_reads_counts_cases_and_device(report):
+    parsed = RealTestRunner("emulator")._read_report(report)
+
+    assert (parsed["tests_run"], parsed["tests_passed"], parsed["tests_failed"]) == (3, 2, 1)
+    assert len(parsed["test_cases"]) == 4
+    assert parsed["device_info"]["provider"] == "emulator"
+    assert parsed["device_info"]["name"] == "Pixel 7"
@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from backend.models import Device, Job
+from backend.queue import tasks
+from backend.services import runtime_stats
+from backend.services.device_manager import DeviceManager
+from backend.services.runtime_stats import RuntimeModel, estimate_start, longest_first, summarize
+
+def test_summarize_weights_recent_runs():
+    assert summarize([]) == {"samples": 0, "ewma": None, "p90": None}
+
+    assert summarize([20.0, 10.0, 10.0], alpha=0.5) == {"samples": 3, "ewma": 15.0, "p90": 20.0}  # Newest first
+    assert summarize([float(s) for s in range(1, 11)])["p90"] == 10.0
+
+def test_estimates_fall_back_to_the_target_then_the_default(fake_redis, monkeypatch):
+    monkeypatch.setattr(runtime_stats, "RUNTIME_EWMA_ALPHA", 1.0)
+    model = RuntimeModel(window=3)
+    for seconds in (5, 6, 7, 8):
+        model.record("tests/a.spec.js", "emulator", seconds)
+
+    assert fake_redis.llen("qualcli:runtime:emulator:tests/a.spec.js") == 3
+    assert model.estimates([("tests/a.spec.js", "emulator"), ("tests/new.spec.js", "emulator"),
+                            ("tests/a.spec.js", "device")]) == {
+        ("tests/a.spec.js", "emulator"): 8.0,
+        ("tests/new.spec.js", "emulator"): 8.0,
+        ("tests/a.spec.js", "device"): runtime_stats.DEFAULT_RUNTIME_SECONDS,
+    }
+
+def test_p90_estimates_fall_back_per_statistic(fake_redis):
+    model = RuntimeModel()
+    for seconds in [100] + [10] * 9:
+        model.record("tests/a.spec.js", "emulator", seconds)
+
+    estimates = model.estimates_by_stat([("tests/a.spec.js", "emulator"), ("tests/new.spec.js", "emulator")])
+
+    assert estimates["ewma"][("tests/a.spec.js", "emulator")] < 20
+    assert estimates["p90"] == {("tests/a.spec.js", "emulator"): 100.0, ("tests/new.spec.js", "emulator"): 100.0}
+
+def test_only_completed_runs_are_recorded(fake_redis):
+    class Runner:
+        def __init__(self, success):
+            self.success = success
+
+        async def run_tests(self, test_path, app_version_id, job_id=None, shard=None):
+            return {"success": self.success, "results": {}, "error": None if self.success else "boom"}
+
+    for job_id, success in ((1, True), (2, False)):
+        job = Job(id=job_id, app_version_id="v1", test_path=f"tests/{job_id}.spec.js", target="emulator")
+        asyncio.run(tasks._execute_job(Runner(success), job, "MOCK"))
+
+    stats = RuntimeModel().stats([("tests/1.spec.js", "emulator"), ("tests/2.spec.js", "emulator")])
+    assert [summary["samples"] for summary in stats.values()] == [1, 0]
+
+def test_longest_first_orders_by_estimate():
+    jobs = [SimpleNamespace(id=i, test_path=path, target="emulator", shard_count=None)
+            for i, path in enumerate(["short", "long", "unknown", "mid"])]
+    estimates = {("short", "emulator"): 1, ("long", "emulator"): 60, ("mid", "emulator"): 20}
+
+    assert [job.id for job in longest_first(jobs, estimates)] == [1, 3, 0, 2]
+
+def test_estimate_start_simulates_the_slots():
+    assert estimate_start(0, [], []) is None
+    assert estimate_start(2, [10], []) == 0  # One slot idle
+    assert estimate_start(2, [10, 40], [30]) == 40  # The queued job takes the first free slot (10 -> 40)
+    assert estimate_start(1, [-5], [10, 10]) == 20  # Overrunning jobs free up "now"
+
+def test_wait_estimate_counts_running_and_higher_priority_jobs(db):
+    model = RuntimeModel()
+    for path, seconds in (("tests/long.spec.js", 100), ("tests/short.spec.js", 10)):
+        model.record(path, "emulator", seconds)
+    now = datetime.utcnow()
+    db.add(Device(device_id="emulator-1", device_type="emulator", status="busy", max_concurrent_jobs=2,
+                  current_jobs=2))
+    db.add_all([
+        Job(org_id="o", app_version_id="v1", test_path="tests/long.spec.js", target="emulator", priority=1,
+            status="running", updated_at=now - timedelta(seconds=40)),
+        Job(org_id="o", app_version_id="v1", test_path="tests/short.spec.js", target="emulator", priority=1,
+            status="running", updated_at=now),
+        Job(org_id="o", app_version_id="v2", test_path="tests/long.spec.js", target="emulator", priority=5,
+            status="queued"),
+        Job(org_id="o", app_version_id="v3", test_path="tests/long.spec.js", target="emulator", priority=1,
+            status="queued"),
+    ])
+    db.commit()
+
+    estimate = DeviceManager(db).estimate_wait("emulator", 3, "tests/short.spec.js")
+    recommendation = DeviceManager(db).get_device_recommendations("emulator", 3, "tests/short.spec.js")
+
+    # Slots free at ~10s and ~60s; the priority 5 job takes the first (until ~110s), the 60s one is next
+    assert estimate["queued_ahead"] == 1
+    assert estimate["wait_seconds"] == 60
+    assert estimate["run_seconds"] == 10
+    assert recommendation["recommendation"] == "queue_and_wait"
+    assert recommendation["estimated_wait_time"] == 60
+
+def test_conservative_wait_uses_p90_runtimes(db):
+    model = RuntimeModel()
+    for seconds in [100] + [10] * 9:
+        model.record("tests/a.spec.js", "emulator", seconds)
+    db.add(Device(device_id="emulator-1", device_type="emulator", status="busy", max_concurrent_jobs=1,
+                  current_jobs=1))
+    db.add(Job(org_id="o", app_version_id="v1", test_path="tests/a.spec.js", target="emulator", priority=1,
+               status="running", updated_at=datetime.utcnow()))
+    db.commit()
+
+    estimate = DeviceManager(db).estimate_wait("emulator", 3, "tests/a.spec.js")
+    recommendation = DeviceManager(db).get_device_recommendations("emulator", 3, "tests/a.spec.js")
+
+    assert estimate["wait_seconds"] < 20 and estimate["run_seconds"] < 20
+    assert estimate["wait_seconds_p90"] == 100 and estimate["run_seconds_p90"] == 100
+    assert recommendation["estimated_wait_time_p90"] == 100
+    assert recommendation["estimated_run_time_p90"] == 100
@@ -0,0 +1,145 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from backend.models import Device, Job
+from backend.queue import batching, scheduler, tasks
+from backend.services import test_runner
+from backend.queue.scheduler import FairShareQueue, ReadySet, free_slots_by_target
+
+def job(job_id, org_id="org", priority=2, target="emulator", app_version_id="v1"):
+    return SimpleNamespace(id=job_id, org_id=org_id, priority=priority, target=target,
+                           app_version_id=app_version_id)
+
+def test_backlogged_flows_share_by_weight():
+    queue = FairShareQueue(org_weights={"big": 3}, priority_weights={}, aging_rate=0)
+    for i in range(100):
+        queue.push(("big", i), "big", 1, enqueued_at=0)
+        queue.push(("small", i), "small", 1, enqueued_at=0)
+
+    first = [queue.pop()[0] for _ in range(40)]
+
+    assert first.count("big") == 30
+    assert first.count("small") == 10
+
+def test_flood_does_not_starve_other_orgs():
+    queue = FairShareQueue(aging_rate=0)
+    for i in range(500):
+        queue.push(("flood", i), "flood", 5, enqueued_at=0)
+    queue.push(("other", 0), "other", 1, enqueued_at=1)
+
+    order = [queue.pop()[0] for _ in range(len(queue))]
+
+    # A weight-1 flow against a weight-16 one still gets its turn within 17 jobs
+    assert order.index("other") <= 17
+
+def test_aging_lets_waiting_jobs_overtake_new_arrivals():
+    queue = FairShareQueue(priority_weights={1: 1, 5: 1}, aging_rate=1)
+    queue.push("old", "a", 1, enqueued_at=0)
+    for i in range(5):
+        queue.push(f"new-{i}", "b", 5, enqueued_at=10)
+
+    assert queue.pop() == "old"
+
+def test_release_respects_free_slots_and_rank(fake_redis):
+    ready = ReadySet(fake_redis)
+    ready.enqueue([job(i, org_id="flood", priority=5) for i in range(1, 6)], now=0)
+    ready.enqueue([job(10, org_id="other", priority=1, app_version_id="v2")], now=0)
+
+    batches = ready.release({"emulator": 2}, now=1)
+    taken = ready.take_released("v1", "emulator") + ready.take_released("v2", "emulator")
+
+    assert len(taken) == 2
+    assert 10 in taken  # The other org's flow starts level with the flood
+    assert batches == {("v1", "emulator"): 5, ("v2", "emulator"): 1}
+    assert fake_redis.zcard(ready.ready_key("emulator")) == 4
+
+def test_released_jobs_count_against_free_slots(fake_redis):
+    ready = ReadySet(fake_redis)
+    ready.enqueue([job(i) for i in range(1, 5)], now=0)
+
+    ready.release({"emulator": 2}, now=0)
+    assert ready.release({"emulator": 2}, now=1) == {}  # Still unclaimed
+
+    assert ready.requeue_released("v1", "emulator") == 2
+    assert ready.outstanding("emulator") == 0
+    assert ready.release({"emulator": 3}, now=2) == {("v1", "emulator"): 2}
+    assert ready.take_released("v1", "emulator") == [1, 2, 3]
+
+def test_unclaimed_releases_time_out(fake_redis, monkeypatch):
+    monkeypatch.setattr(scheduler, "RELEASE_TIMEOUT", 60)
+    ready = ReadySet(fake_redis)
+    ready.enqueue([job(1)], now=0)
+    ready.release({"emulator": 1}, now=0)
+
+    ready.release({"emulator": 1}, now=120)
+
+    assert ready.take_released("v1", "emulator") == [1]
+
+def test_discarded_jobs_are_not_released(fake_redis):
+    ready = ReadySet(fake_redis)
+    ready.enqueue([job(1), job(2)], now=0)
+    ready.discard([1], "emulator")
+
+    ready.release({"emulator": 2}, now=0)
+
+    assert ready.take_released("v1", "emulator") == [2]
+
+def test_requeued_jobs_keep_their_age(fake_redis):
+    ready = ReadySet(fake_redis)
+    ready.enqueue([job(1, org_id="new")], now=1000)
+    requeued = job(2, org_id="old")
+    requeued.created_at = datetime.utcfromtimestamp(0)
+    ready.enqueue([requeued], now=1000)
+
+    ready.release({"emulator": 1}, now=1000)
+
+    assert ready.take_released("v1", "emulator") == [2]
+
+def test_release_ready_jobs_signals_batches(fake_redis, monkeypatch):
+    signalled = []
+    monkeypatch.setattr(tasks, "enqueue_batch_dispatch", lambda *args, **kwargs: signalled.append(args))
+    monkeypatch.setattr(tasks, "_free_device_slots", lambda: free_slots_by_target([
+        {"type": "emulator", "status": "available", "current_jobs": 1, "max_jobs": 2},
+        {"type": "device", "status": "offline", "current_jobs": 0, "max_jobs": 1},
+    ]))
+    ReadySet(fake_redis).enqueue([job(1, priority=3), job(2, target="device")])
+
+    assert tasks.release_ready_jobs() == 1
+    assert signalled == [("v1", "emulator", 3)]
+
+def test_release_ready_jobs_defers_to_lock_holder(fake_redis, monkeypatch):
+    monkeypatch.setattr(tasks, "_free_device_slots", lambda: {"emulator": 1})
+    ready = ReadySet(fake_redis)
+
+    with ready.releasing() as acquired:
+        assert acquired
+        assert tasks.release_ready_jobs() == 0
+
+    assert ready.take_pending()
+
+def test_dispatcher_claims_every_released_job_past_the_batch_size(db, session_factory, fake_redis, monkeypatch,
+                                                                  tmp_path):
+    monkeypatch.setattr(tasks, "FAIR_SHARE_SCHEDULING", True)
+    monkeypatch.setattr(tasks, "MAX_BATCH_SIZE", 2)
+    monkeypatch.setattr(batching, "MAX_BATCH_SIZE", 2)
+    monkeypatch.setattr(tasks, "SessionLocal", session_factory)
+    monkeypatch.setattr(tasks, "enqueue_batch_dispatch", lambda *args, **kwargs: True)
+    monkeypatch.setattr(test_runner.TestRunner, "EXECUTION_TIMES", {"emulator": 0.01})
+    db.add(Device(device_id="emulator-1", device_type="emulator", status="available",
+                  max_concurrent_jobs=4, current_jobs=0))
+    spec = tmp_path / "login.spec.js"
+    spec.write_text("test('login', async () => {});")
+    jobs = [Job(org_id="org", app_version_id="v1", test_path=str(spec), priority=2, target="emulator",
+                status="queued") for _ in range(4)]
+    db.add_all(jobs)
+    db.commit()
+    ready = ReadySet(fake_redis)
+    ready.enqueue(jobs)
+    assert tasks.release_ready_jobs() == 1
+
+    result = tasks._run_batch(SimpleNamespace(request=SimpleNamespace(id="test", retries=0)), "v1", "emulator", 2)
+
+    assert result["batch_summary"]["total_jobs"] == 4
+    assert ready.outstanding("emulator") == 0
+    db.expire_all()
+    assert {job.status for job in db.query(Job)} == {"completed"}
@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+import pytest
+
+from backend.models import Device, Job, TestResult
+from backend.queue import tasks
+from backend.services import sharding, test_runner
+from backend.services.runtime_stats import RuntimeModel
+
+@pytest.fixture
+def spec(tmp_path):
+    path = tmp_path / "onboarding.spec.js"
+    path.write_text("test('login', async () => {});")
+    return str(path)
+
+def add_sharded_job(db, spec, shard_count, app_version_id="v1"):
+    parent = Job(org_id="org", app_version_id=app_version_id, test_path=spec, priority=3, target="emulator",
+                 status="queued")
+    db.add(parent)
+    db.flush()
+    shards = sharding.create_shards(parent, shard_count)
+    db.add_all(shards)
+    db.commit()
+    return parent, shards
+
+def test_shards_run_across_devices_and_roll_up(db, session_factory, spec, monkeypatch):
+    monkeypatch.setattr(tasks, "SessionLocal", session_factory)
+    monkeypatch.setattr(tasks, "enqueue_batch_dispatch", lambda *args, **kwargs: True)
+    monkeypatch.setattr(test_runner.TestRunner, "EXECUTION_TIMES", {"emulator": 0.05})
+    seen = []
+    run_tests = test_runner.TestRunner.run_tests
+
+    async def recording_run_tests(self, test_path, app_version_id, job_id=None, shard=None):
+        seen.append(shard)
+        return await run_tests(self, test_path, app_version_id, job_id=job_id, shard=shard)
+
+    monkeypatch.setattr(test_runner.TestRunner, "run_tests", recording_run_tests)
+    db.add_all([Device(device_id=f"emulator-{i}", device_type="emulator", status="available",
+                       max_concurrent_jobs=1, current_jobs=0) for i in range(3)])
+    db.commit()
+    parent, shards = add_sharded_job(db, spec, 3)
+
+    task = SimpleNamespace(request=SimpleNamespace(id="test", retries=0))
+    result = tasks._run_batch(task, "v1", "emulator", 3)
+
+    db.expire_all()
+    assert result["batch_summary"]["total_jobs"] == 3  # The parent is never claimed
+    assert result["batch_summary"]["parallel_slots"] == 3
+    assert sorted(seen) == [(1, 3), (2, 3), (3, 3)]
+    assert [db.get(Job, shard.id).status for shard in shards] == ["completed"] * 3
+    assert db.get(Job, parent.id).status == "completed"
+    assert db.query(TestResult).filter(TestResult.job_id == parent.id).count() == 0
+    assert db.query(TestResult).count() == 3
+    # Shards record the whole file's runtime, so the next auto split sees the file as ~3 shards long
+    assert RuntimeModel().estimate(spec, "emulator") >= 3 * 0.05
+
+def test_rollup_waits_for_every_shard_and_fails_on_any_failure(db, spec):
+    parent, shards = add_sharded_job(db, spec, 2)
+
+    shards[0].status = "failed"
+    db.commit()
+    assert sharding.rollup(db, [parent.id]) == []
+    assert sharding.shard_summary(db, parent)["status"] == "running"
+
+    shards[1].status = "completed"
+    db.commit()
+    finished = sharding.rollup(db, [parent.id])
+    db.expire_all()
+
+    assert [(row.id, row.status) for row in finished] == [(parent.id, "failed")]
+    assert db.get(Job, parent.id).status == "failed"
+    assert sharding.rollup(db, [parent.id]) == []  # Already finished
+    assert sharding.shard_summary(db, db.get(Job, parent.id))["shards"] == {
+        "queued": 0, "running": 0, "completed": 1, "failed": 1}
+
+def test_auto_shard_count_follows_history_and_capacity(db, spec, monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD_TARGET_SECONDS", 60)
+    db.add_all([Device(device_id=f"emulator-{i}", device_type="emulator", status="available",
+                       max_concurrent_jobs=2, current_jobs=0) for i in range(2)])
+    db.commit()
+
+    assert sharding.auto_shard_count(db, spec, "emulator") == 1  # Default 30s estimate
+
+    RuntimeModel().record(spec, "emulator", 200)
+    assert sharding.auto_shard_count(db, spec, "emulator") == 4
+
+    RuntimeModel().record(spec, "emulator", 10000)
+    assert sharding.auto_shard_count(db, spec, "emulator") == 4  # Capped by the 4 device slots
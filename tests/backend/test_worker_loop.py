@@ -0,0 +1,112 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from backend.models import Device, Job
+from backend.queue import tasks, worker_loop
+from backend.queue.worker_loop import WorkerLoop
+from backend.services import test_runner
+
+@pytest.fixture
+def loop(monkeypatch):
+    loop = WorkerLoop(concurrency=2)
+    monkeypatch.setattr(worker_loop, "_worker_loop", loop)
+    monkeypatch.setattr(worker_loop, "WORKER_EVENT_LOOP", "persistent")
+    yield loop
+    loop.shutdown()
+
+def test_batches_share_one_loop_under_the_concurrency_cap(loop):
+    running = [0]
+    peak = [0]
+    loops = set()
+
+    async def test():
+        async with worker_loop.execution_slot():
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.05)
+            running[0] -= 1
+
+    async def batch():
+        loops.add(asyncio.get_running_loop())
+        await asyncio.gather(*(test() for _ in range(3)))
+
+    # Three task threads (as in `--pool threads`) each run a batch of three tests
+    threads = [threading.Thread(target=worker_loop.run_coroutine, args=(batch(),)) for _ in range(3)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(loops) == 1
+    assert peak[0] == 2
+    assert time.monotonic() - started >= 0.05 * 9 / 2
+
+def test_run_returns_results_and_raises_errors(loop):
+    async def ok():
+        return 42
+
+    async def broken():
+        raise ValueError("boom")
+
+    assert worker_loop.run_coroutine(ok()) == 42
+    with pytest.raises(ValueError):
+        worker_loop.run_coroutine(broken())
+    assert worker_loop.run_coroutine(ok()) == 42  # The loop survives a failed batch
+
+def test_timeout_cancels_the_coroutine(loop):
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(concurrent.futures.TimeoutError):
+        loop.run(slow(), timeout=0.05)
+    assert cancelled.wait(1)
+
+def test_per_batch_mode_has_no_worker_cap(loop, monkeypatch):
+    monkeypatch.setattr(worker_loop, "WORKER_EVENT_LOOP", "per_batch")
+
+    async def uncapped():
+        async with worker_loop.execution_slot():
+            return asyncio.get_running_loop()
+
+    assert worker_loop.run_coroutine(uncapped()).is_closed()
+
+def test_batch_keeps_sessions_and_redis_off_the_loop(loop, db, session_factory, tmp_path, monkeypatch):
+    on_loop = []
+
+    def off_loop(name, call):
+        def wrapper(*args, **kwargs):
+            if threading.current_thread().name == "qualcli-worker-loop":
+                on_loop.append(name)
+            return call(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(tasks, "SessionLocal", off_loop("session", session_factory))
+    monkeypatch.setattr(tasks.preemption, "take", off_loop("preemption", tasks.preemption.take))
+    monkeypatch.setattr(tasks.events, "publish_event", off_loop("publish", tasks.events.publish_event))
+    monkeypatch.setattr(tasks, "enqueue_batch_dispatch", lambda *args, **kwargs: True)
+    monkeypatch.setattr(tasks, "PREEMPT_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(test_runner.TestRunner, "EXECUTION_TIMES", {"emulator": 0.05})
+    spec = tmp_path / "login.spec.js"
+    spec.write_text("test('login', async () => {});")
+    db.add(Device(device_id="emulator-1", device_type="emulator", status="available",
+                  max_concurrent_jobs=2, current_jobs=0))
+    db.add_all([Job(org_id="org", app_version_id="v1", test_path=str(spec), priority=2, target="emulator",
+                    status="queued") for _ in range(3)])
+    db.commit()
+
+    result = tasks._run_batch(SimpleNamespace(request=SimpleNamespace(id="test", retries=0)), "v1", "emulator", 2)
+
+    assert result["batch_summary"]["successful_jobs"] == 3
+    assert on_loop == []
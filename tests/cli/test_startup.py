@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from cli.main import cli
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cumulative import time of cli.main, in microseconds (-X importtime units)
+STARTUP_BUDGET_US = int(os.getenv('QGJOB_STARTUP_BUDGET_US', '150000'))
+
+# Only needed once a command runs or renders output
+HEAVY_MODULES = ('rich', 'httpx', 'requests')
+
+def import_times(*args):
+    """Run qgjob under -X importtime and return {module: cumulative microseconds}."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'from cli.main import cli; cli()', *args],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, module = line.split('|')
+            if cumulative.strip().isdigit():
+                times[module.strip()] = int(cumulative)
+    return times
+
+@pytest.mark.cli
+@pytest.mark.parametrize('args', [('--help',), ('wait', '--help')])
+def test_help_skips_heavy_imports(args):
+    times = import_times(*args)
+
+    loaded = {name.split('.')[0] for name in times}
+    assert not loaded & set(HEAVY_MODULES)
+    if args == ('--help',):
+        assert 'dotenv' not in loaded
+        assert not [name for name in times if name.startswith('cli.commands')]
+
+@pytest.mark.cli
+def test_startup_within_budget():
+    times = import_times('--help')
+
+    assert times['cli.main'] <= STARTUP_BUDGET_US
+
+@pytest.mark.cli
+def test_registered_help_matches_commands():
+    ctx = click.Context(cli)
+    names = cli.list_commands(ctx)
+
+    assert names == ['devices', 'jobs', 'queue', 'status', 'submit', 'wait']
+    for name in names:
+        _, help_text = cli.lazy_commands[name]
+        command = cli.get_command(ctx, name)
+        assert command.get_short_help_str(100) == help_text, name
+
+@pytest.mark.cli
+def test_invoking_a_command_loads_it():
+    result = CliRunner().invoke(cli, ['wait', '--job-ids', 'abc'])
+
+    assert result.exit_code == 2
+    assert "Invalid job ID" in result.output